@@ -1,11 +1,66 @@
+import argparse
 import sys
 import os
 
 # Add src to python path
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Personal Agent")
+    parser.add_argument("--import-profile", action="store_true", help="报告各模块导入耗时后退出")
+    parser.add_argument("--daemon", action="store_true", help="以常驻进程运行，供多个终端连接")
+    parser.add_argument("--stop-daemon", action="store_true", help="停止正在运行的常驻进程")
+    parser.add_argument("--no-daemon", action="store_true", help="不连接常驻进程，在本进程内运行 agent")
+    parser.add_argument("--serve", action="store_true", help="启动本地 HTTP/SSE 服务")
+    parser.add_argument("--port", type=int, help="HTTP 服务端口（默认取配置 server.port）")
+    parser.add_argument("--batch", metavar="FILE", help="从 JSONL 文件（- 为标准输入）批量执行提示后退出")
+    parser.add_argument("--output", metavar="FILE", help="批处理结果 JSONL 输出文件，默认标准输出")
+    parser.add_argument("--concurrency", type=int, help="批处理同时执行的会话数")
+    parser.add_argument("--approval", choices=("approve", "reject"), help="批处理中需要审批的工具的处理策略")
+    # 启动基准测试使用：初始化到首个提示符前即退出
+    parser.add_argument("--startup-check", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.import_profile:
+        from importprof import print_import_profile
+        print_import_profile()
+        sys.exit(0)
+
+    if args.daemon:
+        from interfaces.daemon import serve
+        serve()
+        sys.exit(0)
+
+    if args.serve:
+        from interfaces.server import serve as serve_http
+        serve_http(port=args.port)
+        sys.exit(0)
+
+    if args.stop_daemon:
+        from interfaces.daemon import connect_daemon
+        client = connect_daemon()
+        if client is None:
+            print("No daemon running.")
+        else:
+            client.shutdown()
+            print("Daemon stopped.")
+        sys.exit(0)
+
+    if args.batch:
+        from interfaces.batch import run_batch
+        sys.exit(run_batch(
+            args.batch,
+            output_path=args.output,
+            concurrency=args.concurrency,
+            approval=args.approval,
+            use_daemon=not args.no_daemon,
+        ))
+
     # 先输出提示，再触发重依赖的 import，改善启动体感
     print("Initializing Personal Agent...", flush=True)
     from interfaces.cli import main
-    main()
+    main(startup_check=args.startup_check, use_daemon=not args.no_daemon)
@@ -0,0 +1,63 @@
+"""Startup-time budget check for the CLI.
+
+Launches `main.py --startup-check` (initializes everything up to the first
+prompt, then exits) several times and compares the median wall time against
+a budget. Exits with status 1 when over budget, after printing the import
+profile so the offending modules are visible.
+
+Usage:
+    python scripts/bench_startup.py --runs 5 --budget 0.5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+def time_startup() -> float:
+    """Wall time of one `main.py --startup-check` run, in seconds."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "main.py"), "--startup-check"],
+        cwd=ROOT,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py --startup-check failed:\n{result.stderr}")
+    return elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check CLI time-to-first-prompt against a budget")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds")
+    args = parser.parse_args(argv)
+
+    # 第一次运行预热 .pyc 与磁盘缓存，不计入结果
+    time_startup()
+    timings = [time_startup() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"time-to-first-prompt: median {median * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms "
+          f"(budget {args.budget * 1000:.0f} ms)")
+
+    if median > args.budget:
+        print("OVER BUDGET")
+        from importprof import print_import_profile
+        print_import_profile()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
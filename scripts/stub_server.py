@@ -0,0 +1,306 @@
+"""Local OpenAI-compatible stub server for load and latency testing.
+
+Speaks the chat/completions protocol (streaming and non-streaming), including
+`reasoning_content` deltas, tool_call chunks and DeepSeek-style usage with
+prompt cache hit/miss counts. Point `llm.base_url` at it to measure the
+agent's own per-turn overhead without paying for the real API.
+
+Usage:
+    python scripts/stub_server.py --port 8765 --ttft 0.3 --tps 60 --script script.json
+
+Script file (JSON list, first matching rule wins):
+    [
+      {"match": "天气", "after_tool": false, "reasoning": "需要查天气", "tool_calls": [
+          {"name": "get_environment_context", "arguments": {}}]},
+      {"after_tool": true, "content": "今天晴，25°C。"},
+      {"content": "好的。", "ttft": 0.1, "tps": 200}
+    ]
+
+`match` is a regex searched in the last user message, `after_tool` restricts a
+rule to requests whose last message is (true) or is not (false) a tool result.
+Rules without `after_tool` match both, so tool-call rules should set it to
+false; otherwise they match again after the tool result and the agent loops.
+Without a matching rule the server echoes the user message.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TOKEN_RE = re.compile(r"[一-鿿]|\w+|\s+|[^\w\s]")
+
+
+def _tokenize(text: str) -> list:
+    """Split text into pseudo-tokens (one per CJK char / word / punctuation)."""
+    return _TOKEN_RE.findall(text or "")
+
+
+def _estimate_tokens(obj) -> int:
+    return max(1, len(json.dumps(obj, ensure_ascii=False)) // 4)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+class PrefixCache:
+    """Simulated provider prefix cache, keyed by hashes of message prefixes."""
+
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def usage(self, request: dict) -> tuple:
+        """Return (hit_tokens, miss_tokens) for the request's prompt."""
+        digest = hashlib.sha1(json.dumps(request.get("tools") or [], sort_keys=True).encode())
+        parts = [("tools", _estimate_tokens(request.get("tools") or []))]
+        parts += [(m, _estimate_tokens(m)) for m in request.get("messages", [])]
+        hit = miss = 0
+        prefix_alive = True
+        with self._lock:
+            for part, tokens in parts:
+                if part != "tools":
+                    digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode())
+                key = digest.hexdigest()
+                if prefix_alive and key in self._seen:
+                    hit += tokens
+                else:
+                    prefix_alive = False
+                    miss += tokens
+                self._seen.add(key)
+        return hit, miss
+
+
+class StubBackend:
+    """Chooses scripted responses and holds server-wide settings."""
+
+    def __init__(self, rules: list, ttft: float, tps: float, verbose: bool = False):
+        self.rules = rules
+        self.ttft = ttft
+        self.tps = tps
+        self.verbose = verbose
+        self.prefix_cache = PrefixCache()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def choose(self, request: dict) -> dict:
+        messages = request.get("messages", [])
+        last = messages[-1] if messages else {}
+        after_tool = last.get("role") == "tool"
+        user_text = next((_message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+
+        for rule in self.rules:
+            if "after_tool" in rule and rule["after_tool"] != after_tool:
+                continue
+            if "match" in rule and not re.search(rule["match"], user_text):
+                continue
+            return rule
+
+        thinking = (request.get("thinking") or {}).get("type") == "enabled"
+        return {
+            "reasoning": "用户发来了一条消息，直接回复即可。" if thinking else "",
+            "content": f"收到：{user_text}" if not after_tool else "工具已返回结果。",
+        }
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _tool_calls(rule: dict) -> list:
+    return [
+        {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {
+                "name": tc["name"],
+                "arguments": json.dumps(tc.get("arguments", {}), ensure_ascii=False),
+            },
+        }
+        for tc in rule.get("tool_calls", [])
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    backend: StubBackend = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.backend.verbose:
+            sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/models", "/v1/models"):
+            self._send_json({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        backend = self.backend
+        with backend._lock:
+            backend.requests += 1
+
+        rule = backend.choose(request)
+        hit, miss = backend.prefix_cache.usage(request)
+        if request.get("stream"):
+            self._stream(request, rule, hit, miss)
+        else:
+            self._complete(request, rule, hit, miss)
+
+    def _usage(self, rule: dict, hit: int, miss: int) -> dict:
+        completion = len(_tokenize(rule.get("reasoning", ""))) + len(_tokenize(rule.get("content", "")))
+        return {
+            "prompt_tokens": hit + miss,
+            "completion_tokens": completion,
+            "total_tokens": hit + miss + completion,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": miss,
+            "prompt_tokens_details": {"cached_tokens": hit},
+        }
+
+    def _complete(self, request: dict, rule: dict, hit: int, miss: int):
+        ttft = rule.get("ttft", self.backend.ttft)
+        tps = rule.get("tps", self.backend.tps)
+        tokens = len(_tokenize(rule.get("reasoning", ""))) + len(_tokenize(rule.get("content", "")))
+        time.sleep(ttft + (tokens / tps if tps else 0))
+
+        message = {"role": "assistant", "content": rule.get("content", "")}
+        if rule.get("reasoning"):
+            message["reasoning_content"] = rule["reasoning"]
+        tool_calls = _tool_calls(rule)
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": self._usage(rule, hit, miss),
+        })
+
+    def _stream(self, request: dict, rule: dict, hit: int, miss: int):
+        ttft = rule.get("ttft", self.backend.ttft)
+        tps = rule.get("tps", self.backend.tps)
+        interval = 1.0 / tps if tps else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "stub")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(payload):
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {data}\n\n".encode())
+            self.wfile.flush()
+
+        try:
+            time.sleep(ttft)
+            send(_chunk(completion_id, model, {"role": "assistant", "content": ""}))
+            for token in _tokenize(rule.get("reasoning", "")):
+                send(_chunk(completion_id, model, {"content": None, "reasoning_content": token}))
+                time.sleep(interval)
+            for token in _tokenize(rule.get("content", "")):
+                send(_chunk(completion_id, model, {"content": token}))
+                time.sleep(interval)
+
+            tool_calls = _tool_calls(rule)
+            for index, tc in enumerate(tool_calls):
+                send(_chunk(completion_id, model, {"tool_calls": [{
+                    "index": index,
+                    "id": tc["id"],
+                    "type": "function",
+                    "function": {"name": tc["function"]["name"], "arguments": ""},
+                }]}))
+                for piece in _tokenize(tc["function"]["arguments"]):
+                    send(_chunk(completion_id, model, {"tool_calls": [{
+                        "index": index,
+                        "function": {"arguments": piece},
+                    }]}))
+                    time.sleep(interval)
+
+            send(_chunk(completion_id, model, {}, "tool_calls" if tool_calls else "stop"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = _chunk(completion_id, model, {})
+                usage_chunk["choices"] = []
+                usage_chunk["usage"] = self._usage(rule, hit, miss)
+                send(usage_chunk)
+            send("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host: str, port: int, backend: StubBackend) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server bound to host:port."""
+    handler = type("BoundStubHandler", (StubHandler,), {"backend": backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for latency testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.2, help="time to first token (seconds)")
+    parser.add_argument("--tps", type=float, default=50.0, help="tokens per second, 0 = unthrottled")
+    parser.add_argument("--script", help="JSON file with scripted response rules")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    rules = []
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+
+    backend = StubBackend(rules, args.ttft, args.tps, args.verbose)
+    server = make_server(args.host, args.port, backend)
+    print(f"Stub server listening on http://{args.host}:{args.port} (base_url: http://{args.host}:{args.port}/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {backend.requests} requests.")
+
+
+if __name__ == "__main__":
+    main()
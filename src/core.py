@@ -1,12 +1,10 @@
 """Core agent initialization logic."""
 
 import os
-import sqlite3
 import yaml
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.checkpoint.sqlite import SqliteSaver
 
-from graph import build_agent_graph
+# 对话 checkpoint 数据库（相对于工作目录）
+CHECKPOINT_DB_PATH = os.path.join("data", "checkpoints.db")
 
 
 def load_config():
@@ -30,17 +28,6 @@ def load_config():
         config = yaml.safe_load(f) or {}
 
     return config
-from tools import (
-    get_environment_context,
-    search_memory,
-    get_memory,
-    update_user_memory,
-    web_search,
-    add_note,
-    search_notes,
-    get_note,
-)
-from llm import get_llm
 
 
 def get_agent_executor(checkpointer=None):
@@ -49,60 +36,85 @@ def get_agent_executor(checkpointer=None):
     Returns a compiled StateGraph with:
     - ReAct pattern (agent ↔ tools loop)
     - Memory tools for long-term user memory
-    - SqliteSaver checkpointer for conversation persistence
+    - SQLite checkpointer (with session index) for conversation persistence
 
     Args:
-        checkpointer: Optional custom checkpointer. If None, creates SqliteSaver
-            with default database path (data/checkpoints.db).
+        checkpointer: Optional custom checkpointer. If None, creates an
+            AgentSqliteSaver with default database path (data/checkpoints.db).
 
     Returns:
         Tuple of (agent_executor, checkpointer)
     """
+    # 图、工具与 LLM 依赖较重，延迟到构建 agent 时导入，
+    # 使只需要 load_config 的模块（CLI 启动路径）保持轻量
+    from graph import build_agent_graph
+    from persistence import AgentSqliteSaver, CheckpointMaintenance, convert_to_incremental, open_checkpoint_connection
+    from tools import get_agent_tools
+    from llm import get_llm
+    import metrics
+    import tracing
+
     config = load_config()
+    # 须在构建图之前配置：节点、工具与 embedding 的计时/追踪包装在构建时决定
+    metrics.configure_from(config)
+    tracing.configure_from(config)
 
     llm = get_llm()
 
-    tools = [
-        get_environment_context,
-        update_user_memory,
-        search_memory,
-        get_memory,
-        web_search,
-        add_note,
-        search_notes,
-        get_note,
-    ]
+    tools = get_agent_tools()
 
     if checkpointer is None:
-        db_path = os.path.join("data", "checkpoints.db")
-        os.makedirs("data", exist_ok=True)
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        checkpointer = SqliteSaver(conn)
+        db_path = CHECKPOINT_DB_PATH
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = open_checkpoint_connection(db_path)
+        maintenance_config = config.get("checkpoint_maintenance") or {}
+        vacuum_threshold = maintenance_config.get("vacuum_threshold", 0.25)
+        # 旧数据库转换为增量回收需要一次全量 VACUUM（排他锁），只在图使用连接之前执行
+        convert_to_incremental(conn, vacuum_threshold)
+        checkpointer = AgentSqliteSaver(conn)
         checkpointer.setup()
 
-        max_sessions = config.get("checkpoint_max_sessions", 10)
-        if max_sessions and max_sessions > 0:
-            cur = conn.cursor()
-            cur.execute("""
-                DELETE FROM checkpoints
-                WHERE thread_id NOT IN (
-                    SELECT thread_id FROM (
-                        SELECT thread_id, MAX(rowid) as latest
-                        FROM checkpoints
-                        GROUP BY thread_id
-                        ORDER BY latest DESC
-                        LIMIT ?
-                    )
-                )
-            """, (max_sessions,))
-            conn.commit()
-            conn.execute("VACUUM")
+        # 会话保留与空间回收在后台线程中增量进行，不阻塞启动
+        CheckpointMaintenance(
+            db_path,
+            max_sessions=config.get("checkpoint_max_sessions", 10),
+            interval=maintenance_config.get("interval", 1800),
+            vacuum_threshold=vacuum_threshold,
+            keep_per_thread=maintenance_config.get("keep_per_thread"),
+            saver=checkpointer,
+        ).start()
+
+    retrieval_config = config.get("speculative_retrieval") or {}
+    speculative_retrieval = None
+    if retrieval_config.get("enabled"):
+        speculative_retrieval = {k: v for k, v in retrieval_config.items() if k != "enabled"}
+
+    routing_config = config.get("tool_routing") or {}
+    tool_routing = None
+    if routing_config.get("enabled"):
+        tool_routing = {k: v for k, v in routing_config.items() if k != "enabled"}
+
+    cascade_config = config.get("llm", {}).get("cascade") or {}
+    fast_llm = get_llm("fast") if cascade_config.get("enabled") else None
+
+    cache_config = config.get("response_cache") or {}
+    response_cache = None
+    if cache_config.get("enabled"):
+        from graph.response_cache import ResponseCache
+        response_cache = ResponseCache(**{k: v for k, v in cache_config.items() if k != "enabled"})
 
     agent = build_agent_graph(
         llm=llm,
         tools=tools,
         system_prompt=config["system_prompt"],
         checkpointer=checkpointer,
+        prompt_layout=config.get("prompt_layout", "default"),
+        memoize_tools=config.get("tool_memo", False),
+        speculative_retrieval=speculative_retrieval,
+        tool_routing=tool_routing,
+        fast_llm=fast_llm,
+        cascade_rules=cascade_config.get("rules"),
+        response_cache=response_cache,
     )
 
     return agent, checkpointer
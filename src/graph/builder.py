@@ -6,7 +6,11 @@ from langchain_core.language_models import BaseChatModel
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
 
-from graph.nodes import create_agent_node, create_tool_node
+from graph.nodes import create_agent_node, create_tool_node, instrument_node, last_human_text
+from graph.response_cache import create_cache_nodes, route_after_lookup
+from graph.retrieval import create_retrieval_node
+from graph.tool_router import ToolRouter
+from llm import classify_turn
 from graph.state import AgentState
 
 # 需要用户审批的工具列表
@@ -33,13 +37,20 @@ def build_agent_graph(
     tools: list,
     system_prompt: str,
     checkpointer=None,
+    prompt_layout: str = "default",
+    memoize_tools: bool = False,
+    speculative_retrieval: dict = None,
+    tool_routing: dict = None,
+    fast_llm: BaseChatModel = None,
+    cascade_rules: dict = None,
+    response_cache=None,
 ):
     """Build the agent graph with ReAct pattern and human-in-the-loop approval.
 
     Graph structure:
-        START → agent ←→ tools
-                  ↓
-                 END
+        START → [cache_lookup →] [retrieve →] agent ←→ tools
+                                                ↓
+                                          [cache_store →] END
 
     Args:
         llm: Language model with tool binding support.
@@ -47,6 +58,21 @@ def build_agent_graph(
         system_prompt: System prompt for the agent.
         checkpointer: Optional checkpointer for conversation persistence.
             Defaults to MemorySaver if not provided.
+        prompt_layout: "default" or "cache_stable". In "cache_stable" mode tool
+            schemas are bound in a canonical (name-sorted) order and volatile
+            context goes to the tail, keeping the request prefix cacheable.
+        memoize_tools: Memoize read-only tool results per thread.
+        speculative_retrieval: Optional kwargs for create_retrieval_node. When
+            given, a retrieval node runs before the agent on each user turn.
+        tool_routing: Optional kwargs for ToolRouter. When given, each turn
+            binds only the core tools plus those relevant to the user message.
+        fast_llm: Optional fast, non-thinking model. When given, each turn is
+            classified locally (llm.classify_turn with `cascade_rules`) and
+            simple turns are routed to it instead of `llm`.
+        cascade_rules: Escalation rules for llm.classify_turn.
+        response_cache: Optional ResponseCache. When given, a lookup node can
+            answer repeated first-turn questions without calling the LLM, and
+            cacheable final answers are stored after the agent finishes.
 
     Returns:
         Compiled StateGraph ready for execution.
@@ -55,25 +81,65 @@ def build_agent_graph(
         checkpointer = MemorySaver()
 
     # Bind tools to the LLM
-    llm_with_tools = llm.bind_tools(tools)
+    # cache_stable 模式下按名称排序，工具 schema 不随调用方列表顺序变化
+    bound_tools = sorted(tools, key=lambda t: t.name) if prompt_layout == "cache_stable" else tools
+    llm_with_tools = llm.bind_tools(bound_tools)
+
+    router = ToolRouter(tools, **tool_routing) if tool_routing is not None else None
+    tier_models = {"reasoning": (llm, llm_with_tools)}
+    if fast_llm is not None:
+        tier_models["fast"] = (fast_llm, fast_llm.bind_tools(bound_tools))
+
+    def select_model(messages):
+        """Pick the cascade tier and bound model for this turn."""
+        tier = "reasoning"
+        if fast_llm is not None:
+            tier = classify_turn(last_human_text(messages), cascade_rules)
+        base, bound = tier_models[tier]
+        if router is not None:
+            return tier, router.model_for(base, messages)
+        return tier, bound
+
+    if router is None and fast_llm is None:
+        select_model = None
 
     # Create nodes
-    agent_node = create_agent_node(llm_with_tools, system_prompt)
-    tool_node = create_tool_node(tools)
+    agent_node = create_agent_node(llm_with_tools, system_prompt, prompt_layout, select_model)
+    tool_node = create_tool_node(tools, memoize=memoize_tools)
 
     # Build the graph
     builder = StateGraph(AgentState)
 
     # Add nodes
-    builder.add_node("agent", agent_node)
-    builder.add_node("tools", tool_node)
+    # 开启指标时各节点包一层计时，未开启时原样注册
+    builder.add_node("agent", instrument_node("agent", agent_node))
+    builder.add_node("tools", instrument_node("tools", tool_node))
+    if speculative_retrieval is not None:
+        builder.add_node("retrieve", instrument_node("retrieve", create_retrieval_node(**speculative_retrieval)))
+    if response_cache is not None:
+        cache_lookup_node, cache_store_node = create_cache_nodes(response_cache)
+        builder.add_node("cache_lookup", instrument_node("cache_lookup", cache_lookup_node))
+        builder.add_node("cache_store", instrument_node("cache_store", cache_store_node))
 
     # Add edges
-    builder.add_edge(START, "agent")
+    entry = "agent"
+    if speculative_retrieval is not None:
+        builder.add_edge("retrieve", "agent")
+        entry = "retrieve"
+    if response_cache is not None:
+        builder.add_edge(START, "cache_lookup")
+        builder.add_conditional_edges(
+            "cache_lookup",
+            route_after_lookup,
+            {"hit": END, "miss": entry},
+        )
+        builder.add_edge("cache_store", END)
+    else:
+        builder.add_edge(START, entry)
     builder.add_conditional_edges(
         "agent",
         should_continue,
-        {"tools": "tools", END: END},
+        {"tools": "tools", END: "cache_store" if response_cache is not None else END},
     )
     builder.add_edge("tools", "agent")
 
@@ -1,47 +1,198 @@
 """Node functions for the agent graph."""
 
-from langchain_core.messages import SystemMessage, ToolMessage, AIMessage
+import inspect
+
+from langchain_core.messages import SystemMessage, ToolMessage, AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode
 
+import metrics
+import tracing
+from graph.retrieval import record_retrieval_outcome
 from graph.state import AgentState
+from tools import memo
+
+
+# Prompt layouts:
+# - "default": volatile context is merged into the leading system message
+# - "cache_stable": the system message stays byte-identical across turns and
+#   sessions; volatile context is appended after the history so the provider's
+#   prefix cache (DeepSeek context caching) can hit on everything before it
+PROMPT_LAYOUTS = ("default", "cache_stable")
+
+
+def last_human_text(messages) -> str:
+    """Return the text of the most recent user message, or ""."""
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content if isinstance(msg.content, str) else str(msg.content)
+    return ""
+
+
+def strip_stale_reasoning(messages) -> list:
+    """Return copies of AIMessages whose reasoning_content is no longer needed.
+
+    Once a new user message arrives, the reasoning of every earlier turn is
+    complete and the API no longer requires it. The copies keep their ids, so
+    returning them through the add_messages reducer replaces the stored ones.
+    """
+    stripped = []
+    for msg in messages:
+        if isinstance(msg, AIMessage) and msg.additional_kwargs.get("reasoning_content"):
+            kwargs = {k: v for k, v in msg.additional_kwargs.items() if k != "reasoning_content"}
+            stripped.append(msg.model_copy(update={"additional_kwargs": kwargs}))
+    return stripped
 
 
-def create_agent_node(llm, system_prompt: str):
+def create_agent_node(llm, system_prompt: str, prompt_layout: str = "default", select_model=None):
     """Create an agent node that calls the LLM with system prompt.
 
     Args:
         llm: The language model to use.
         system_prompt: System prompt to prepend to messages.
+        prompt_layout: One of PROMPT_LAYOUTS, controls where volatile
+            context from `state["context"]` is placed.
+        select_model: Optional callable mapping the message history to a
+            `(tier, model)` pair for this call (e.g. a cascade tier and a
+            per-turn tool subset). Latency is recorded per tier. Defaults to
+            always using `llm`.
 
     Returns:
         A function that processes agent state and returns updated messages.
     """
+    if prompt_layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt_layout: {prompt_layout!r}")
+
+    # 固定的系统消息只构造一次，保证每次请求前缀字节一致
+    system_message = SystemMessage(content=system_prompt)
 
     def agent_node(state: AgentState, config: RunnableConfig) -> dict:
         """Call LLM to generate response or tool calls."""
-        messages = state["messages"]
+        messages = list(state["messages"])
+        context = state.get("context")
 
         # Prepend system message if not already present
         if not messages or not isinstance(messages[0], SystemMessage):
-            messages = [SystemMessage(content=system_prompt)] + list(messages)
+            if context and prompt_layout == "default":
+                messages = [SystemMessage(content=f"{system_prompt}\n\n{context}")] + messages
+            else:
+                messages = [system_message] + messages
+
+        if context and prompt_layout == "cache_stable":
+            messages.append(SystemMessage(content=context))
+
+        # 新一轮开始时，清理状态中已完成轮次的思维链
+        stale = []
+        turn_start = bool(state["messages"]) and isinstance(state["messages"][-1], HumanMessage)
+        if turn_start:
+            stale = strip_stale_reasoning(state["messages"][:-1])
+
+        tier, model = select_model(state["messages"]) if select_model is not None else (None, llm)
+        if tier is None:
+            response = model.invoke(messages, config)
+        else:
+            # 级联档位的调用耗时计入 llm_tier_seconds，在 /stats 中按档位查看
+            with metrics.timer("llm_tier_seconds", tier=tier):
+                response = model.invoke(messages, config)
 
-        response = llm.invoke(messages, config)
-        return {"messages": [response]}
+        if turn_start and context:
+            record_retrieval_outcome(response)
+
+        return {"messages": stale + [response]}
 
     return agent_node
 
 
-def create_tool_node(tools: list):
+def instrument_node(name: str, node):
+    """Wrap a graph node so each execution is timed (metrics node_seconds) and traced.
+
+    Returns `node` unchanged when metrics and tracing are disabled.
+    """
+    if not metrics.enabled() and not tracing.enabled():
+        return node
+    if hasattr(node, "invoke"):
+        call = node.invoke
+    elif "config" in inspect.signature(node).parameters:
+        call = node
+    else:
+        call = lambda state, config: node(state)
+
+    def timed_node(state: AgentState, config: RunnableConfig) -> dict:
+        with metrics.timer("node_seconds", node=name), tracing.span("node", node=name):
+            return call(state, config)
+
+    return timed_node
+
+
+# 追踪中单个工具参数值保留的最大字符数
+_TRACE_ARG_CHARS = 200
+
+
+def _instrument_tool(tool):
+    """Copy of `tool` whose function is timed (metrics tool_seconds) and traced."""
+    func = getattr(tool, "func", None)
+    if func is None:
+        return tool
+    timed = metrics.instrument("tool_seconds", func, tool=tool.name)
+
+    def traced(*args, **kwargs):
+        traced_args = {k: v if not isinstance(v, str) else v[:_TRACE_ARG_CHARS] for k, v in kwargs.items()}
+        with tracing.span("tool", tool=tool.name, args=traced_args) as span:
+            result = timed(*args, **kwargs)
+            if span is not None:
+                span["result_chars"] = len(str(result))
+            return result
+
+    return tool.model_copy(update={"func": traced})
+
+
+def create_tool_node(tools: list, memoize: bool = False):
     """Create a tool node using LangGraph's built-in ToolNode.
 
     Args:
         tools: List of tool functions.
+        memoize: If True, read-only tool results are memoized per thread
+            (see tools.memo) and only cache misses reach the ToolNode.
 
     Returns:
-        A ToolNode instance that executes tool calls.
+        A ToolNode instance (or memoizing wrapper) that executes tool calls.
     """
-    return ToolNode(tools)
+    if metrics.enabled() or tracing.enabled():
+        tools = [_instrument_tool(t) for t in tools]
+    tool_node = ToolNode(tools)
+    if not memoize:
+        return tool_node
+
+    def memoized_tool_node(state: AgentState, config: RunnableConfig) -> dict:
+        """Serve repeated tool calls from the memo, run the rest."""
+        thread_id = config.get("configurable", {}).get("thread_id")
+        messages = state["messages"]
+        last_message = messages[-1]
+
+        results = {}
+        misses = []
+        for tc in last_message.tool_calls:
+            cached = memo.lookup(thread_id, tc["name"], tc["args"])
+            if cached is None:
+                misses.append(tc)
+            else:
+                results[tc["id"]] = ToolMessage(content=cached, name=tc["name"], tool_call_id=tc["id"])
+
+        if misses:
+            partial = last_message.model_copy(update={"tool_calls": misses})
+            output = tool_node.invoke({"messages": list(messages[:-1]) + [partial]}, config)
+            calls_by_id = {tc["id"]: tc for tc in misses}
+            for msg in output["messages"]:
+                results[msg.tool_call_id] = msg
+                tc = calls_by_id.get(msg.tool_call_id)
+                if tc is not None and getattr(msg, "status", "success") != "error":
+                    memo.store(thread_id, tc["name"], tc["args"], msg.content)
+
+        # 保持与原始 tool_calls 相同的顺序
+        ordered = [results[tc["id"]] for tc in last_message.tool_calls if tc["id"] in results]
+        return {"messages": ordered}
+
+    return memoized_tool_node
 
 
 def check_pending_approval_node(state: AgentState) -> dict:
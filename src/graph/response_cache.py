@@ -0,0 +1,233 @@
+"""Semantic response cache for repeated questions.
+
+Keyed by the embedding of the normalized user turn plus a hash of the state
+the answer may depend on (memory version, notes version, date). A lookup
+only hits when the stored state hash matches exactly, so an answer is never
+served after memory or notes have changed.
+
+Only fresh threads are cached (the answer must not depend on earlier
+conversation), and only turns whose tool calls were read-only memory/notes
+lookups — turns that searched the web, read the clock/weather or wrote data
+are never cached.
+
+Several processes (daemon, HTTP server, CLI) share the cache file. Each
+reloads it when its version stamp changes; writes (store, eviction) re-read
+the file under its cross-process lock before replacing it. Hits only update
+`last_hit` in memory, which is carried across reloads and persisted with the
+next write.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import date
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from graph.state import AgentState
+from graph.tool_router import _cosine
+from tools import BASE_DIR, MEMORY_FILE, NOTES_FILE, _get_embeddings
+from tools.storage import atomic_write_json, file_lock, file_version, read_json
+
+RESPONSE_CACHE_FILE = os.path.join(BASE_DIR, "data", "response_cache.json")
+
+# 允许出现在可缓存轮次中的工具（只读，且结果只依赖记忆/笔记版本）
+CACHEABLE_TOOLS = {"search_memory", "get_memory", "search_notes", "get_note"}
+
+
+def _normalize(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?？!！。.~～ ")
+
+
+def _file_version(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _state_hash() -> str:
+    """Hash of the state a cached answer depends on."""
+    key = f"{_file_version(MEMORY_FILE)}|{_file_version(NOTES_FILE)}|{date.today().isoformat()}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Persistent embedding-keyed answer cache with TTL and LRU eviction.
+
+    Args:
+        path: JSON file the entries are persisted to.
+        threshold: Minimum cosine similarity for a hit.
+        ttl: Entry lifetime in seconds.
+        max_entries: Maximum number of entries kept (least recently used
+            entries are evicted first).
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_FILE, threshold: float = 0.92,
+                 ttl: float = 86400, max_entries: int = 200):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = None
+        self._version = None
+        self._last_vector = (None, None)
+        # 查找与写入节点可能在不同工作线程中并发执行，_entries 的读写和落盘都在锁内完成
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Reload the entries if the file changed since the last load or save (caller holds the lock)."""
+        version = file_version(self.path)
+        if self._entries is not None and version == self._version:
+            return
+        # 文件总是整体替换，无需文件锁即可读到完整内容
+        entries = read_json(self.path, [])
+        if not isinstance(entries, list):
+            entries = []
+        # 保留本进程尚未落盘的命中时间
+        last_hits = {e["text"]: e["last_hit"] for e in self._entries or []}
+        for entry in entries:
+            entry["last_hit"] = max(entry["last_hit"], last_hits.get(entry["text"], 0))
+        self._entries = entries
+        self._version = version
+
+    def _save(self):
+        """Write the entries (caller holds the lock and the file's exclusive lock)."""
+        # 先写临时文件再替换，其他进程不会读到写了一半的缓存
+        atomic_write_json(self.path, self._entries, ensure_ascii=False)
+        self._version = file_version(self.path)
+
+    def _embed(self, text: str) -> list:
+        # 先取出整个元组再比较，避免其他线程在检查与读取之间替换它
+        last_text, last_vector = self._last_vector
+        if last_text == text:
+            return last_vector
+        vector = _get_embeddings().embed_query(text)
+        self._last_vector = (text, vector)
+        return vector
+
+    def _evict(self, state_hash: str) -> bool:
+        """Drop expired entries and entries built on an older state (caller holds the lock)."""
+        now = time.time()
+        entries = self._entries
+        kept = [e for e in entries
+                if now - e["created_at"] <= self.ttl and e["state_hash"] == state_hash]
+        changed = len(kept) != len(entries)
+        if len(kept) > self.max_entries:
+            kept.sort(key=lambda e: e["last_hit"], reverse=True)
+            kept = kept[:self.max_entries]
+            changed = True
+        self._entries = kept
+        return changed
+
+    def lookup(self, text: str):
+        """Return a cached answer for `text`, or None."""
+        normalized = _normalize(text)
+        if not normalized:
+            return None
+        state_hash = _state_hash()
+        with self._lock:
+            self._refresh()
+            if self._evict(state_hash):
+                with file_lock(self.path, exclusive=True):
+                    # 其他进程可能刚写入，在文件锁内重新读取后再淘汰
+                    self._refresh()
+                    self._evict(state_hash)
+                    self._save()
+            if not self._entries:
+                return None
+            entries = list(self._entries)
+
+        # 编码较慢，在锁外进行
+        vector = self._embed(normalized)
+        best, best_score = None, self.threshold
+        for entry in entries:
+            score = 1.0 if entry["text"] == normalized else _cosine(vector, entry["vector"])
+            if score >= best_score:
+                best, best_score = entry, score
+
+        if best is None:
+            return None
+        with self._lock:
+            # 命中只更新内存中的 LRU 时间，随下次写入落盘；期间可能已重新加载，按文本查找当前条目
+            for entry in self._entries:
+                if entry["text"] == best["text"]:
+                    entry["last_hit"] = time.time()
+        return best["answer"]
+
+    def store(self, text: str, answer: str):
+        """Cache `answer` for `text` under the current state hash."""
+        normalized = _normalize(text)
+        if not normalized or not answer:
+            return
+        vector = self._embed(normalized)
+        state_hash = _state_hash()
+        with self._lock, file_lock(self.path, exclusive=True):
+            self._refresh()
+            self._evict(state_hash)
+            now = time.time()
+            self._entries = [e for e in self._entries if e["text"] != normalized]
+            self._entries.append({
+                "text": normalized,
+                "vector": vector,
+                "answer": answer,
+                "state_hash": state_hash,
+                "created_at": now,
+                "last_hit": now,
+            })
+            self._evict(state_hash)
+            self._save()
+
+
+def _fresh_turn_text(messages):
+    """Return the user text if `messages` is the first turn of a thread."""
+    if len(messages) >= 1 and isinstance(messages[0], HumanMessage) and not any(
+        isinstance(m, HumanMessage) for m in messages[1:]
+    ):
+        return messages[0].content if isinstance(messages[0].content, str) else None
+    return None
+
+
+def create_cache_nodes(cache: ResponseCache):
+    """Create the (lookup, store) node pair for the response cache."""
+
+    def cache_lookup_node(state: AgentState, config: RunnableConfig) -> dict:
+        """Serve a cached answer for a repeated first-turn question."""
+        messages = state["messages"]
+        if len(messages) != 1:
+            return {}
+        text = _fresh_turn_text(messages)
+        answer = cache.lookup(text) if text else None
+        if answer is None:
+            return {}
+        return {"messages": [AIMessage(content=answer, response_metadata={"semantic_cache": True})]}
+
+    def cache_store_node(state: AgentState, config: RunnableConfig) -> dict:
+        """Store the final answer of a cacheable first turn."""
+        messages = state["messages"]
+        text = _fresh_turn_text(messages)
+        final = messages[-1]
+        if not text or not isinstance(final, AIMessage) or final.response_metadata.get("semantic_cache"):
+            return {}
+        for msg in messages[1:]:
+            for tc in getattr(msg, "tool_calls", None) or []:
+                if tc.get("name") not in CACHEABLE_TOOLS:
+                    return {}
+        if isinstance(final.content, str):
+            cache.store(text, final.content)
+        return {}
+
+    return cache_lookup_node, cache_store_node
+
+
+def route_after_lookup(state: AgentState) -> str:
+    """End the turn if the lookup node produced a cached answer."""
+    last_message = state["messages"][-1]
+    if isinstance(last_message, AIMessage) and last_message.response_metadata.get("semantic_cache"):
+        return "hit"
+    return "miss"
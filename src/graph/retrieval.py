@@ -0,0 +1,139 @@
+"""Speculative retrieval node: inject relevant memory/notes before the first LLM call.
+
+Most turns start with a full LLM round trip that only decides to call
+`search_memory`. This node embeds the incoming user message once, searches
+the memory and notes indexes in parallel, and places the hits that pass the
+relevance threshold into `state["context"]`, so the model can usually answer
+without that first tool call.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+import metrics
+import tracing
+from graph.state import AgentState
+from tools import _get_embeddings, _get_vectorstore, _get_notes_vectorstore
+
+# 若首次 LLM 调用仍调用了这些工具，说明预取没有省下这次往返
+SEARCH_TOOLS = {"search_memory", "search_notes"}
+
+_CONTEXT_HEADER = "以下是根据用户本条消息自动检索到的相关记忆与笔记（仅供参考，已足够时无需再调用检索工具）："
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token estimate: one token per CJK char, ~4 chars per token otherwise."""
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _search(index: str, vectorstore, vector, k: int, min_relevance: float) -> list:
+    """Search by a precomputed vector, keeping hits above `min_relevance`.
+
+    FAISS returns L2 distances; they are mapped to [0, 1] relevance the same
+    way LangChain's euclidean relevance function does.
+    """
+    if vectorstore is None or k <= 0:
+        return []
+    with metrics.timer("faiss_search_seconds", index=index):
+        hits = vectorstore.similarity_search_with_score_by_vector(vector, k=k)
+    results = []
+    for doc, distance in hits:
+        relevance = 1.0 - distance / math.sqrt(2)
+        if relevance >= min_relevance:
+            results.append((doc, relevance))
+    return results
+
+
+def _trace_hits(index: str, hits: list) -> list:
+    """Compact description of search hits for the trace log."""
+    return [
+        {"index": index, "id": doc.metadata.get("note_id") or doc.metadata.get("key"), "score": round(score, 4)}
+        for doc, score in hits
+    ]
+
+
+def _format_context(memory_hits: list, note_hits: list, max_tokens: int) -> str:
+    """Format hits as compact context lines within the token cap."""
+    lines = []
+    for doc, _ in memory_hits:
+        lines.append(f"[记忆] {doc.page_content}")
+    for doc, _ in note_hits:
+        m = doc.metadata
+        preview = doc.page_content.split("\n", 1)[-1][:80].replace("\n", " ")
+        lines.append(f'[笔记 {m["note_id"]}] "{m["title"]}" ({m["created_at"]}): {preview}')
+
+    budget = max_tokens - _estimate_tokens(_CONTEXT_HEADER)
+    kept = []
+    for line in lines:
+        cost = _estimate_tokens(line)
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+
+    if not kept:
+        return ""
+    return "\n".join([_CONTEXT_HEADER] + kept)
+
+
+def record_retrieval_outcome(response) -> None:
+    """Count whether the first LLM call of a turn skipped the search tools.
+
+    Together with `retrieval_turns_total` and `retrieval_injected_total` this
+    shows in /stats how often speculative retrieval saved a tool round trip.
+    """
+    called = {tc.get("name") for tc in getattr(response, "tool_calls", None) or []}
+    if not called & SEARCH_TOOLS:
+        metrics.incr("retrieval_saved_total")
+
+
+def create_retrieval_node(
+    memory_k: int = 3,
+    notes_k: int = 3,
+    min_relevance: float = 0.5,
+    max_tokens: int = 300,
+):
+    """Create the speculative retrieval node.
+
+    Args:
+        memory_k: Number of memory candidates to retrieve.
+        notes_k: Number of note candidates to retrieve.
+        min_relevance: Minimum relevance (0-1) for a hit to be injected.
+        max_tokens: Approximate token cap for the injected context.
+
+    Returns:
+        A node function that sets `context` for the current turn.
+    """
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+
+    def retrieval_node(state: AgentState, config: RunnableConfig) -> dict:
+        """Retrieve memory and notes for the incoming user message."""
+        messages = state["messages"]
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return {}
+
+        query = messages[-1].content if isinstance(messages[-1].content, str) else str(messages[-1].content)
+        metrics.incr("retrieval_turns_total")
+
+        with tracing.span("retrieval", query_chars=len(query)) as span:
+            # 索引加载与 query 向量化并行进行
+            memory_store = executor.submit(_get_vectorstore)
+            notes_store = executor.submit(_get_notes_vectorstore)
+            vector = _get_embeddings().embed_query(query)
+
+            memory_hits = executor.submit(_search, "memory", memory_store.result(), vector, memory_k, min_relevance)
+            note_hits = executor.submit(_search, "notes", notes_store.result(), vector, notes_k, min_relevance)
+
+            context = _format_context(memory_hits.result(), note_hits.result(), max_tokens)
+            if span is not None:
+                span["hits"] = _trace_hits("memory", memory_hits.result()) + _trace_hits("notes", note_hits.result())
+                span["injected"] = bool(context)
+        if context:
+            metrics.incr("retrieval_injected_total")
+        return {"context": context or None}
+
+    return retrieval_node
@@ -13,10 +13,14 @@ class AgentState(TypedDict):
     Uses the add_messages reducer to properly handle message accumulation,
     including deduplication and updates.
 
+    `context` holds volatile per-turn context (e.g. retrieved snippets). It is
+    never written into `messages`; the agent node places it according to the
+    configured prompt layout.
+
     Future extension points:
-    - Add `context` field for cross-node shared context
     - Add `current_agent` field for multi-agent routing
     """
 
     messages: Annotated[Sequence[BaseMessage], add_messages]
     pending_tool_approval: Optional[dict]  # 待用户确认的工具调用: {tool_call_id, name, args, original_message}
+    context: Optional[str]  # 本轮易变上下文，不进入消息历史
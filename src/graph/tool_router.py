@@ -0,0 +1,77 @@
+"""Per-turn tool subset selection.
+
+Binding every tool into every request costs hundreds of prompt tokens. The
+router keeps a small always-on core set and adds the tools whose description
+embeddings are most similar to the user's message. Bound models are cached
+per subset, so a recurring subset reuses the same request prefix.
+"""
+
+import math
+
+from graph.nodes import last_human_text
+from tools import _get_embeddings
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolRouter:
+    """Tool registry that picks the relevant tool subset for a turn.
+
+    Args:
+        tools: All available tools.
+        core_tools: Names of tools that are always bound.
+        top_k: Maximum number of routed (non-core) tools per turn.
+        min_similarity: Minimum cosine similarity for a routed tool.
+    """
+
+    def __init__(self, tools: list, core_tools=(), top_k: int = 3, min_similarity: float = 0.35):
+        self.tools = {t.name: t for t in tools}
+        self.core_tools = {name for name in core_tools if name in self.tools}
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self._tool_vectors = None
+        self._bound_cache = {}
+        self._last_selection = (None, None)
+
+    def _get_tool_vectors(self) -> dict:
+        """Embed tool descriptions once, on first use."""
+        if self._tool_vectors is None:
+            names = sorted(self.tools)
+            texts = [f"{name}: {self.tools[name].description}" for name in names]
+            vectors = _get_embeddings().embed_documents(texts)
+            self._tool_vectors = dict(zip(names, vectors))
+        return self._tool_vectors
+
+    def select(self, text: str) -> tuple:
+        """Return the sorted names of the tools to bind for `text`."""
+        if self._last_selection[0] == text:
+            return self._last_selection[1]
+
+        selected = set(self.core_tools)
+        if text:
+            query = _get_embeddings().embed_query(text)
+            scored = sorted(
+                ((_cosine(query, vec), name) for name, vec in self._get_tool_vectors().items()
+                 if name not in self.core_tools),
+                reverse=True,
+            )
+            selected.update(name for score, name in scored[:self.top_k] if score >= self.min_similarity)
+
+        names = tuple(sorted(selected))
+        self._last_selection = (text, names)
+        return names
+
+    def bind(self, llm, names: tuple):
+        """Return `llm` bound to the named tools, cached per subset."""
+        key = (id(llm), names)
+        if key not in self._bound_cache:
+            self._bound_cache[key] = llm.bind_tools([self.tools[name] for name in names])
+        return self._bound_cache[key]
+
+    def model_for(self, llm, messages):
+        """Bind `llm` to the tool subset routed from the turn's user message."""
+        return self.bind(llm, self.select(last_human_text(messages)))
@@ -0,0 +1,83 @@
+"""Per-module import-time profiling of the CLI.
+
+Runs the imports in a fresh interpreter with `-X importtime` and reports,
+for each phase, the total cost and the most expensive modules:
+
+- startup: what runs before the first prompt (`interfaces.cli`)
+- agent: what the background loader imports to build the agent
+- first use: heavy dependencies loaded lazily by the tools (FAISS, web search)
+"""
+
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PHASES = (
+    ("startup", ("interfaces.cli",)),
+    ("agent", ("core", "graph", "persistence", "tools", "llm")),
+    ("first use", ("langchain_community.vectorstores.faiss", "faiss", "langchain_community.tools.ddg_search", "ddgs")),
+)
+
+_PHASE_MARKER = "--phase "
+
+
+def _profile_script() -> str:
+    lines = ["import importlib, sys", f"sys.path.insert(0, {SRC_DIR!r})"]
+    for name, modules in PHASES:
+        lines.append(f"sys.stderr.write({_PHASE_MARKER + name + chr(10)!r})")
+        for module in modules:
+            # 可选依赖缺失时跳过，不影响其余阶段
+            lines.append(f"try:\n    importlib.import_module({module!r})\nexcept Exception:\n    pass")
+    return "\n".join(lines)
+
+
+def parse_importtime(output: str) -> dict:
+    """Parse `-X importtime` output split by phase markers.
+
+    Returns:
+        {phase: [(module, self_us, cumulative_us, depth), ...]} in import order.
+    """
+    phases = {}
+    current = phases.setdefault("interpreter", [])
+    for line in output.splitlines():
+        if line.startswith(_PHASE_MARKER):
+            current = phases.setdefault(line[len(_PHASE_MARKER):].strip(), [])
+            continue
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        current.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return phases
+
+
+def run_import_profile() -> dict:
+    """Import every phase in a fresh interpreter and return the parsed timings."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _profile_script()],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(SRC_DIR),
+    )
+    return parse_importtime(result.stderr)
+
+
+def phase_total_ms(entries: list) -> float:
+    """Total import time of a phase (sum of its top-level imports), in ms."""
+    return sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000
+
+
+def print_import_profile(top: int = 15):
+    """Print per-phase import totals and the slowest modules by self time."""
+    phases = run_import_profile()
+    for name, _ in PHASES:
+        entries = phases.get(name, [])
+        print(f"\n== {name}: {phase_total_ms(entries):.0f} ms ({len(entries)} modules) ==")
+        slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+        for module, self_us, cumulative_us, _ in slowest:
+            print(f"  {self_us / 1000:8.1f} ms self  {cumulative_us / 1000:8.1f} ms cumulative  {module}")
@@ -0,0 +1,262 @@
+"""Headless batch runner.
+
+Reads prompts as JSONL from a file or stdin, runs them through the agent
+with a bounded number of concurrent conversation threads, and writes one
+JSONL result per prompt. Used for nightly bulk jobs and for measuring
+throughput (turns/sec) against the stub server or the real backend.
+
+Input lines (a bare JSON string is also accepted as a prompt):
+
+    {"prompt": str, "id": any, "thread_id": str}
+
+`id` and `thread_id` are optional. Prompts without a thread_id each get a
+fresh thread; prompts sharing a thread_id run in input order on that
+thread, so multi-turn scripts work.
+
+Output lines:
+
+    {"index", "id", "thread_id", "prompt", "answer",
+     "tool_calls": [{"name", "args", "result", "approval"}],
+     "usage": {"hit", "miss", "input", "output"},
+     "timings": {"first_token", "llm", "tools", "other", "total"},   (seconds)
+     "error": str | null}
+
+`llm` sums the agent's output segments: from the first reasoning/answer
+event of a model response to the next tool call, approval or the end of the
+turn. `tools` runs from a tool call (or applying approvals) to its result.
+`other` is the rest of the turn: waiting for the first output, cache lookup,
+speculative retrieval, checkpoint writes and graph overhead.
+
+Tools requiring approval are approved or rejected according to the
+approval policy instead of prompting.
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+APPROVAL_POLICIES = ("approve", "reject")
+
+_FIRST_TOKEN_EVENTS = ("token", "cached", "reasoning")
+# 结束一段模型输出的事件
+_LLM_END_EVENTS = ("tool_call", "usage", "approval", "done")
+
+
+def read_prompts(stream) -> list:
+    """Parse JSONL prompt records, skipping blank lines.
+
+    Raises:
+        ValueError: If a line is not valid JSON or has no prompt.
+    """
+    records = []
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {lineno}: invalid JSON: {e}") from e
+        if isinstance(record, str):
+            record = {"prompt": record}
+        if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+            raise ValueError(f"line {lineno}: expected an object with a \"prompt\" string")
+        record["index"] = len(records)
+        records.append(record)
+    return records
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class BatchRunner:
+    """Run prompt records through an agent backend concurrently.
+
+    Args:
+        backend: AgentRuntime or DaemonClient.
+        concurrency: Maximum number of threads running at the same time.
+        approval: Policy for tools requiring approval ("approve" or "reject").
+    """
+
+    def __init__(self, backend, concurrency: int = 4, approval: str = "reject"):
+        if approval not in APPROVAL_POLICIES:
+            raise ValueError(f"approval must be one of {APPROVAL_POLICIES}, got {approval!r}")
+        self.backend = backend
+        self.concurrency = max(1, concurrency)
+        self.approval = approval
+        self._output_lock = threading.Lock()
+
+    def run_turn(self, record: dict, thread_id: str) -> dict:
+        """Run one prompt to completion and return its result record."""
+        config = {"configurable": {"thread_id": thread_id}}
+        result = {
+            "index": record["index"],
+            "id": record.get("id"),
+            "thread_id": thread_id,
+            "prompt": record["prompt"],
+            "answer": "",
+            "tool_calls": [],
+            "usage": {"hit": 0, "miss": 0, "input": 0, "output": 0},
+            "timings": {"first_token": None, "llm": 0.0, "tools": 0.0, "other": 0.0, "total": 0.0},
+            "error": None,
+        }
+        calls = {}
+        started = time.perf_counter()
+        # 工具阶段的起点：tool_call 事件或开始应用审批结果时
+        tool_mark = None
+        # 模型输出阶段的起点：一段回复的首个思考/回答事件
+        llm_mark = None
+
+        events = self.backend.stream_turn(config, record["prompt"])
+        try:
+            while events is not None:
+                pending_approvals = None
+                for event in events:
+                    kind = event["type"]
+                    now = time.perf_counter()
+                    if kind in _FIRST_TOKEN_EVENTS:
+                        if result["timings"]["first_token"] is None:
+                            result["timings"]["first_token"] = now - started
+                        if llm_mark is None:
+                            llm_mark = now
+                    elif kind in _LLM_END_EVENTS and llm_mark is not None:
+                        result["timings"]["llm"] += now - llm_mark
+                        llm_mark = None
+                    if kind == "tool_call":
+                        tool_mark = now
+                        calls[event["id"]] = {"name": event["name"], "args": event["args"], "result": None, "approval": None}
+                        result["tool_calls"].append(calls[event["id"]])
+                    elif kind == "tool_result":
+                        if tool_mark is not None:
+                            result["timings"]["tools"] += now - tool_mark
+                            tool_mark = now
+                        call = calls.get(event["id"])
+                        if call is None:
+                            call = {"name": event["name"], "args": None, "result": None, "approval": None}
+                            result["tool_calls"].append(call)
+                        call["result"] = event["content"]
+                    elif kind == "usage":
+                        for key in result["usage"]:
+                            result["usage"][key] += event.get(key, 0)
+                    elif kind == "approval":
+                        pending_approvals = event["tool_calls"]
+                    elif kind == "error":
+                        raise RuntimeError(event["message"])
+                    elif kind == "done":
+                        result["answer"] = event["content"]
+
+                events = None
+                if pending_approvals:
+                    for tc in pending_approvals:
+                        calls[tc["id"]] = {"name": tc["name"], "args": tc["args"], "result": None, "approval": self.approval}
+                        result["tool_calls"].append(calls[tc["id"]])
+                    decisions = [{"tool_call_id": tc["id"], "action": self.approval} for tc in pending_approvals]
+                    tool_mark = time.perf_counter()
+                    events = self.backend.apply_approvals(config, decisions)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+
+        timings = result["timings"]
+        timings["total"] = time.perf_counter() - started
+        timings["other"] = max(timings["total"] - timings["llm"] - timings["tools"], 0.0)
+        return result
+
+    def _run_thread(self, thread_id: str, records: list, out, results: list):
+        for record in records:
+            result = self.run_turn(record, thread_id)
+            with self._output_lock:
+                results.append(result)
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+
+    def run(self, records: list, out) -> dict:
+        """Run all records, writing results to `out` as they complete.
+
+        Returns:
+            Summary dict with turns, errors, elapsed seconds, turns/sec and
+            p50/p95 turn latency.
+        """
+        # 同一 thread_id 的提示按输入顺序在一个任务中串行执行
+        threads = {}
+        for record in records:
+            thread_id = record.get("thread_id") or str(uuid.uuid4())
+            threads.setdefault(thread_id, []).append(record)
+
+        results = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            futures = [
+                pool.submit(self._run_thread, thread_id, thread_records, out, results)
+                for thread_id, thread_records in threads.items()
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        latencies = [r["timings"]["total"] for r in results]
+        return {
+            "turns": len(results),
+            "errors": sum(1 for r in results if r["error"]),
+            "elapsed": elapsed,
+            "turns_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+            "p50": _percentile(latencies, 0.5) if latencies else 0.0,
+            "p95": _percentile(latencies, 0.95) if latencies else 0.0,
+        }
+
+
+def run_batch(input_path: str, output_path: str = None, concurrency: int = None,
+              approval: str = None, use_daemon: bool = True) -> int:
+    """Entry point for `main.py --batch`.
+
+    Args:
+        input_path: JSONL prompt file, or "-" for stdin.
+        output_path: JSONL result file; None or "-" writes to stdout.
+        concurrency: Concurrent threads (default: config batch.concurrency).
+        approval: Approval policy (default: config batch.approval).
+        use_daemon: Run through the resident daemon when one is running.
+
+    Returns:
+        Process exit status: 0 if every turn succeeded, 1 otherwise.
+    """
+    from core import load_config
+
+    batch_config = load_config().get("batch") or {}
+    concurrency = concurrency or batch_config.get("concurrency", 4)
+    approval = approval or batch_config.get("approval", "reject")
+
+    if input_path == "-":
+        records = read_prompts(sys.stdin)
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            records = read_prompts(f)
+
+    backend = None
+    if use_daemon:
+        from interfaces.daemon import connect_daemon
+        backend = connect_daemon()
+    if backend is None:
+        from core import get_agent_executor
+        from runtime import AgentRuntime
+        agent, checkpointer = get_agent_executor()
+        backend = AgentRuntime(agent, checkpointer, memoize_tools=load_config().get("tool_memo", False))
+
+    runner = BatchRunner(backend, concurrency=concurrency, approval=approval)
+    if output_path in (None, "-"):
+        summary = runner.run(records, sys.stdout)
+    else:
+        with open(output_path, "w", encoding="utf-8") as out:
+            summary = runner.run(records, out)
+
+    # 汇总写到 stderr，stdout 只保留 JSONL 结果
+    print(
+        f"{summary['turns']} turns, {summary['errors']} errors in {summary['elapsed']:.2f} s: "
+        f"{summary['turns_per_sec']:.2f} turns/sec "
+        f"(p50 {summary['p50'] * 1000:.0f} ms, p95 {summary['p95'] * 1000:.0f} ms, concurrency {runner.concurrency})",
+        file=sys.stderr,
+    )
+    return 1 if summary["errors"] else 0
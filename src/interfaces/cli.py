@@ -7,7 +7,21 @@ config = load_config()
 # 读取输出模式配置，默认为流式输出
 STREAM_OUTPUT = config.get("stream_output", True)
 SHOW_REASONING_CHAIN = config.get("llm", {}).get("show_reasoning_chain", True)
-
+# 每轮结束后报告前缀缓存命中情况
+REPORT_CACHE_USAGE = config.get("report_cache_usage", False)
+# 工具结果按会话缓存
+TOOL_MEMO = config.get("tool_memo", False)
+# 恢复会话时先显示的对话轮数，更早的通过 /more 加载
+RESUME_HISTORY_EXCHANGES = config.get("resume_history_exchanges", 5)
+# 未检测到常驻进程时自动在后台启动
+DAEMON_AUTOSTART = (config.get("daemon") or {}).get("autostart", False)
+# 逐轮性能分析（/profile）
+PROFILE_CONFIG = config.get("profile") or {}
+# 追踪日志目录（/traces 读取）
+TRACES_DIR = (config.get("tracing") or {}).get("dir") or os.path.join("data", "traces")
+
+# langchain/langgraph、工具与图模块以及 rich.markdown 较重，
+# 在使用处或后台线程中延迟导入，保证首个提示符尽快出现
 import uuid
 import json
 import tempfile
@@ -16,55 +30,18 @@ from prompt_toolkit import PromptSession
 from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.key_binding import KeyBindings
 from rich.console import Console
-from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.text import Text
 from rich.live import Live
 from rich.prompt import Prompt, Confirm
-from langchain_core.messages import AIMessageChunk, ToolMessage
-from core import get_agent_executor
-from llm import get_llm
-from tools import (
-    _load_memory,
-    _save_memory,
-    _load_notes,
-    _save_notes,
-    _get_notes_vectorstore,
-    _notes_vectorstore_cache,
-    _get_embeddings,
-    NOTES_FAISS_DIR,
-    get_environment_context,
-    search_memory,
-    get_memory,
-    update_user_memory,
-    web_search,
-    add_note,
-    search_notes,
-    get_note,
-)
-from graph.builder import TOOLS_REQUIRING_APPROVAL
-from langchain_core.documents import Document
 import datetime
+import threading
+from contextlib import nullcontext
+from runtime import normalize_llm_content
 
 console = Console()
 
 
-def normalize_llm_content(content) -> str:
-    if content is None:
-        return ""
-    if isinstance(content, str):
-        return content
-    if isinstance(content, list):
-        text_parts = []
-        for item in content:
-            if isinstance(item, dict) and item.get("type") == "text":
-                text_parts.append(item.get("text", ""))
-            elif isinstance(item, str):
-                text_parts.append(item)
-        return "".join(text_parts)
-    return str(content)
-
-
 def _build_tidy_prompt(system_prompt: str, memory_json: str) -> str:
     """构建记忆整理提示词，注入 agent 人设。"""
     return f"""
@@ -133,6 +110,9 @@ def edit_memory_json(memory: dict) -> dict | None:
 
 def tidy_memory() -> bool:
     """整理用户记忆，返回是否成功修改。"""
+    from llm import get_llm, invoke_with_hedge
+    from tools import _load_memory, _save_memory
+
     memory = _load_memory()
 
     if not memory:
@@ -156,7 +136,7 @@ def tidy_memory() -> bool:
     console.print("\n[bold]LLM 整理中...[/bold]")
 
     try:
-        response = llm.invoke(prompt)
+        response = invoke_with_hedge(llm, prompt)
         content = normalize_llm_content(response.content)
 
         # 提取 JSON
@@ -232,6 +212,8 @@ def tidy_memory() -> bool:
 
 def view_notes_menu():
     """笔记浏览子菜单：列出笔记并可选择查看详情。"""
+    from tools import _load_notes
+
     while True:
         notes = _load_notes()
 
@@ -280,6 +262,8 @@ def view_notes_menu():
 
 def show_note_detail(note_id: str, note: dict):
     """显示单条笔记详情。"""
+    from rich.markdown import Markdown
+
     console.print()
     console.print(Panel(
         Markdown(f"# {note['title']}\n\n{note['content']}"),
@@ -293,52 +277,26 @@ def show_note_detail(note_id: str, note: dict):
     Prompt.ask("[dim]按 Enter 返回列表[/dim]")
 
 
-def get_session_list(checkpointer, agent, limit=20):
-    """从 SQLite checkpointer 获取历史会话列表，包含摘要信息。
+def get_session_list(backend, limit=20):
+    """从会话索引表获取历史会话列表，包含摘要信息。
 
     Returns:
         List of (thread_id, summary) tuples.
     """
     try:
-        with checkpointer.conn as conn:
-            cursor = conn.execute("""
-                SELECT thread_id
-                FROM checkpoints
-                GROUP BY thread_id
-                ORDER BY MAX(checkpoint_id) DESC
-                LIMIT ?
-            """, (limit,))
-            rows = cursor.fetchall()
+        return backend.sessions(limit)
     except Exception:
         return []
 
-    sessions = []
-    for (thread_id,) in rows:
-        # 获取第一条用户消息作为摘要
-        config = {"configurable": {"thread_id": thread_id}}
-        try:
-            state = agent.get_state(config)
-            messages = state.values.get("messages", [])
-            summary = ""
-            for msg in messages:
-                if hasattr(msg, "type") and msg.type == "human":
-                    content = str(msg.content)[:50].replace("\n", " ")
-                    summary = content + ("..." if len(str(msg.content)) > 50 else "")
-                    break
-            sessions.append((thread_id, summary))
-        except Exception:
-            sessions.append((thread_id, ""))
-    return sessions
-
-
-def view_sessions_menu(checkpointer, agent) -> dict | None:
+
+def view_sessions_menu(backend) -> dict | None:
     """会话浏览子菜单：列出历史会话并可选择恢复。
 
     Returns:
         config 字典如果选择了会话，None 如果取消或无会话。
     """
     while True:
-        sessions = get_session_list(checkpointer, agent)
+        sessions = get_session_list(backend)
 
         if not sessions:
             console.print("[yellow]暂无历史会话。[/yellow]")
@@ -372,41 +330,99 @@ def view_sessions_menu(checkpointer, agent) -> dict | None:
             console.print("[red]请输入有效序号或 q[/red]")
 
 
-def display_history_messages(agent, config: dict):
-    """显示历史对话消息。"""
-    state = agent.get_state(config)
-    messages = state.values.get("messages", [])
+class ResumedHistory:
+    """已恢复会话的历史消息，按轮次分页显示。
+
+    恢复时只读取一次状态，先显示最近 `page_size` 轮对话，更早的对话通过
+    /more 按页加载；已渲染的消息面板会被缓存。
+
+    Args:
+        messages: 会话的完整消息列表（AgentRuntime.history 的格式）。
+        page_size: 每页显示的对话轮数（一轮以用户消息开始）。
+    """
+
+    def __init__(self, messages: list, page_size: int = 5):
+        self.messages = messages
+        self.page_size = max(1, page_size)
+        self.starts = [i for i, msg in enumerate(messages) if msg.get("type") == "human"]
+        if not self.starts or self.starts[0] != 0:
+            self.starts.insert(0, 0)
+        # 尚未显示的轮次数
+        self.hidden = len(self.starts)
+        self._panels = {}
+
+    @property
+    def total(self) -> int:
+        return len(self.starts)
+
+    def _panel(self, index: int):
+        if index not in self._panels:
+            self._panels[index] = _history_panel(self.messages[index])
+        return self._panels[index]
+
+    def show_page(self) -> bool:
+        """显示下一页（更早的）对话，返回是否还有更早的对话。"""
+        if self.hidden <= 0:
+            return False
+        first = max(0, self.hidden - self.page_size)
+        start = self.starts[first]
+        end = self.starts[self.hidden] if self.hidden < len(self.starts) else len(self.messages)
+
+        label = "历史对话" if self.hidden == len(self.starts) else "更早的对话"
+        console.print(f"\n[bold cyan]═══ {label}（第 {first + 1}-{self.hidden} 轮 / 共 {self.total} 轮）═══[/bold cyan]\n")
+        for index in range(start, end):
+            panel = self._panel(index)
+            if panel is not None:
+                console.print(panel)
+
+        self.hidden = first
+        if self.hidden:
+            console.print(f"[dim]还有 {self.hidden} 轮更早的对话，输入 /more 查看[/dim]")
+        return self.hidden > 0
+
+
+def _history_panel(msg: dict) -> Panel | None:
+    """把一条历史消息渲染为面板，不需要显示的消息返回 None。"""
+    from rich.markdown import Markdown
+
+    msg_type = msg.get("type")
+    if msg_type == "human":
+        return Panel(
+            Markdown(msg["content"]),
+            title="[bold red]User[/bold red]",
+            border_style="red",
+            expand=False
+        )
+    if msg_type == "ai":
+        content = msg["content"]
+        if not content:
+            return None
+        return Panel(
+            Markdown(content),
+            title="[bold blue]Assistant[/bold blue]",
+            border_style="blue",
+            expand=False
+        )
+    if msg.get("name") == "add_note":
+        return Panel(
+            f"[笔记已保存] {msg['content']}",
+            title="[bold green]Tool: add_note[/bold green]",
+            border_style="green",
+            expand=False
+        )
+    return None
+
+
+def display_history_messages(backend, config: dict) -> ResumedHistory | None:
+    """显示历史对话的最近几轮，返回用于 /more 翻页的 ResumedHistory。"""
+    messages = backend.history(config)
 
     if not messages:
-        return
+        return None
 
-    console.print("\n[bold cyan]═══ 历史对话 ═══[/bold cyan]\n")
-
-    for msg in messages:
-        msg_type = getattr(msg, "type", None)
-        if msg_type == "human":
-            content = normalize_llm_content(msg.content)
-            console.print(Panel(
-                Markdown(content),
-                title="[bold red]User[/bold red]",
-                border_style="red",
-                expand=False
-            ))
-        elif msg_type == "ai":
-            content = normalize_llm_content(msg.content)
-            console.print(Panel(
-                Markdown(content),
-                title="[bold blue]Assistant[/bold blue]",
-                border_style="blue",
-                expand=False
-            ))
-        elif hasattr(msg, "name") and msg.name == "add_note":
-            console.print(Panel(
-                f"[笔记已保存] {msg.content}",
-                title="[bold green]Tool: add_note[/bold green]",
-                border_style="green",
-                expand=False
-            ))
+    history = ResumedHistory(messages, RESUME_HISTORY_EXCHANGES)
+    history.show_page()
+    return history
 
 
 def edit_note_content(title: str, content: str, tags: str) -> tuple[str, str, str] | None:
@@ -499,7 +515,8 @@ def handle_add_note_approval(tool_call: dict) -> dict:
         tool_call: 工具调用字典，包含 id, name, args
 
     Returns:
-        审批结果字典，包含 action, tool_call_id, tool_name, args, message
+        审批决定字典，包含 action, tool_call_id, tool_name, args；
+        由 backend.apply_approvals 执行
     """
     args = tool_call.get("args", {})
     title = args.get("title", "")
@@ -527,14 +544,11 @@ def handle_add_note_approval(tool_call: dict) -> dict:
         )
 
         if choice == "y":
-            # 直接执行 add_note
-            result_msg = _execute_add_note(title, content, tags)
             return {
                 "action": "approve",
                 "tool_call_id": tool_call.get("id"),
                 "tool_name": tool_call.get("name"),
                 "args": args,
-                "message": result_msg
             }
 
         elif choice == "n":
@@ -542,7 +556,6 @@ def handle_add_note_approval(tool_call: dict) -> dict:
                 "action": "reject",
                 "tool_call_id": tool_call.get("id"),
                 "tool_name": tool_call.get("name"),
-                "message": "用户拒绝保存这条笔记"
             }
 
         elif choice == "e":
@@ -565,168 +578,29 @@ def handle_add_note_approval(tool_call: dict) -> dict:
                 ))
 
                 if Confirm.ask("[bold yellow]确认保存修改后的笔记？[/bold yellow]", default=True):
-                    result_msg = _execute_add_note(new_title, new_content, new_tags)
                     return {
                         "action": "modify",
                         "tool_call_id": tool_call.get("id"),
                         "tool_name": tool_call.get("name"),
                         "args": {"title": new_title, "content": new_content, "tags": new_tags},
-                        "message": result_msg
                     }
             else:
                 console.print("[yellow]编辑已取消或无变化[/yellow]")
 
 
-def _execute_add_note(title: str, content: str, tags: str = "") -> str:
-    """直接执行 add_note 操作.
+def handle_approval(tool_call: dict) -> dict:
+    """询问用户是否批准一个需要审批的工具调用，返回审批决定。"""
+    if tool_call.get("name") == "add_note":
+        return handle_add_note_approval(tool_call)
 
-    Returns:
-        成功消息字符串
-    """
-    note_id = str(uuid.uuid4())[:8]
-    created_at = datetime.datetime.now().strftime("%Y-%m-%d")
-    notes = _load_notes()
-    notes[note_id] = {
-        "title": title,
-        "content": content,
-        "tags": tags,
-        "created_at": created_at,
+    console.print(format_tool_call(tool_call))
+    approved = Confirm.ask("[bold yellow]是否允许执行该操作？[/bold yellow]", default=False)
+    return {
+        "action": "approve" if approved else "reject",
+        "tool_call_id": tool_call.get("id"),
+        "tool_name": tool_call.get("name"),
+        "args": tool_call.get("args", {}),
     }
-    _save_notes(notes)
-
-    # 增量更新 FAISS 索引
-    doc = Document(
-        page_content=f"{title}\n{content}",
-        metadata={"note_id": note_id, "title": title,
-                  "tags": tags, "created_at": created_at}
-    )
-    vectorstore = _get_notes_vectorstore()
-    if vectorstore is not None:
-        vectorstore.add_documents([doc])
-    else:
-        embeddings = _get_embeddings()
-        from langchain_community.vectorstores import FAISS
-        _notes_vectorstore_cache = FAISS.from_documents([doc], embeddings)
-        vectorstore = _notes_vectorstore_cache
-
-    os.makedirs(NOTES_FAISS_DIR, exist_ok=True)
-    vectorstore.save_local(NOTES_FAISS_DIR)
-
-    return f"笔记已保存，id: {note_id}，标题：{title}"
-
-
-def check_and_handle_interrupt(agent, config: dict) -> bool:
-    """检查是否有中断状态，并处理工具审批.
-
-    Args:
-        agent: agent 执行器
-        config: 配置字典
-
-    Returns:
-        True if 需要继续执行，False 表示结束或无中断
-    """
-    from langgraph.prebuilt import ToolNode
-
-    # 获取当前状态
-    state = agent.get_state(config)
-    if not state.next:
-        return False
-
-    # 检查是否在 tools 节点前中断（待审批状态）
-    if "tools" in state.next:
-        messages = state.values.get("messages", [])
-        if not messages:
-            return False
-
-        last_msg = messages[-1]
-        if hasattr(last_msg, "tool_calls") and last_msg.tool_calls:
-            # 检查是否有需要审批的工具
-            has_approval_tool = False
-            for tc in last_msg.tool_calls:
-                if tc.get("name") in TOOLS_REQUIRING_APPROVAL:
-                    has_approval_tool = True
-                    break
-
-            if has_approval_tool:
-                # 有需要审批的工具，走审批流程
-                approval_results = []
-                normal_tool_calls = []
-
-                for tc in last_msg.tool_calls:
-                    tool_name = tc.get("name")
-                    if tool_name in TOOLS_REQUIRING_APPROVAL:
-                        if tool_name == "add_note":
-                            result = handle_add_note_approval(tc)
-                            approval_results.append(result)
-                    else:
-                        normal_tool_calls.append(tc)
-
-                # 构建结果消息
-                new_messages = []
-
-                # 添加审批工具的结果
-                for res in approval_results:
-                    tool_msg = ToolMessage(
-                        content=res["message"],
-                        name=res["tool_name"],
-                        tool_call_id=res["tool_call_id"]
-                    )
-                    new_messages.append(tool_msg)
-                    # 显示工具结果
-                    console.print(format_tool_result(res["tool_name"], res["message"]))
-
-                # 如果有普通工具，单独执行
-                if normal_tool_calls:
-                    # 创建只包含普通工具的消息
-                    from copy import deepcopy
-                    temp_last_msg = deepcopy(last_msg)
-                    temp_last_msg.tool_calls = normal_tool_calls
-
-                    temp_state = {
-                        "messages": messages[:-1] + [temp_last_msg]
-                    }
-
-                    # 工具列表
-                    tools = [
-                        get_environment_context,
-                        update_user_memory,
-                        search_memory,
-                        get_memory,
-                        web_search,
-                        add_note,
-                        search_notes,
-                        get_note,
-                    ]
-
-                    # 显示普通工具调用
-                    for tc in normal_tool_calls:
-                        console.print(format_tool_call(tc))
-
-                    # 执行普通工具
-                    tool_node = ToolNode(tools)
-                    try:
-                        result = tool_node.invoke(temp_state, config)
-                        for msg in result["messages"]:
-                            new_messages.append(msg)
-                            # 显示工具结果
-                            console.print(format_tool_result(msg.name, str(msg.content)))
-                    except Exception as e:
-                        console.print(f"[red]执行工具出错: {e}[/red]")
-
-                # 更新状态
-                if new_messages:
-                    agent.update_state(
-                        config,
-                        {"messages": new_messages},
-                        as_node="tools"
-                    )
-
-                return True
-            else:
-                # 没有需要审批的工具，直接继续执行
-                return True
-
-    return False
 
 
 def format_tool_call(tool_call: dict) -> Panel:
@@ -762,193 +636,296 @@ def _reasoning_panel(text: str) -> Panel:
     )
 
 
-def stream_agent_response(agent, user_input: str, config: dict) -> str:
-    """Stream agent response with tool calls and thinking visible.
+def print_cache_usage(total: dict) -> None:
+    """打印本轮前缀缓存命中统计。"""
+    prompt_tokens = total["hit"] + total["miss"]
+    if not prompt_tokens:
+        return
+    ratio = total["hit"] / prompt_tokens * 100
+    console.print(f"[dim]缓存命中: {total['hit']}/{prompt_tokens} tokens ({ratio:.1f}%)[/dim]")
+
+
+def _format_labels(labels: dict) -> str:
+    return ", ".join(f"{k}={v}" for k, v in labels.items())
+
+
+def show_stats(backend, args: list) -> None:
+    """/stats 命令：显示各阶段耗时分位数与 token 计数；`export [路径]` 导出，`reset` 清零。"""
+    from rich.table import Table
+
+    action = args[0] if args else ""
+    if action == "reset":
+        backend.reset_stats()
+        console.print("[green]✓ 指标已清零[/green]")
+        return
+    if action == "export":
+        path = backend.export_stats(args[1] if len(args) > 1 else None)
+        if path:
+            console.print(f"[green]✓ 指标已导出: {path}[/green]")
+        else:
+            console.print("[yellow]未配置 metrics.export_path，请指定路径: /stats export <路径>[/yellow]")
+        return
+    if action:
+        console.print("[yellow]用法: /stats | /stats export [路径] | /stats reset[/yellow]")
+        return
+
+    stats = backend.stats()
+    if not stats.get("enabled"):
+        console.print("[yellow]指标未开启，请在 .config.yaml 中设置 metrics.enabled: true[/yellow]")
+        return
+    if not stats["histograms"] and not stats["counters"]:
+        console.print("[dim]暂无数据[/dim]")
+        return
+
+    table = Table(title="耗时 (ms)", title_justify="left", header_style="bold")
+    table.add_column("阶段")
+    table.add_column("标签", style="dim")
+    for column in ("次数", "平均", "p50", "p95", "p99", "最大"):
+        table.add_column(column, justify="right")
+    for h in stats["histograms"]:
+        table.add_row(
+            h["name"], _format_labels(h["labels"]), str(h["count"]),
+            *(f"{h[key] * 1000:.1f}" for key in ("mean", "p50", "p95", "p99", "max")),
+        )
+    console.print(table)
+
+    if stats["counters"]:
+        counters = Table(title="计数", title_justify="left", header_style="bold")
+        counters.add_column("指标")
+        counters.add_column("标签", style="dim")
+        counters.add_column("值", justify="right")
+        for c in stats["counters"]:
+            counters.add_row(c["name"], _format_labels(c["labels"]), f"{c['value']:,}")
+        console.print(counters)
+
+
+def show_traces(args: list) -> None:
+    """/traces [N] 命令：汇总最近 N 个会话（默认 10）中最慢的 span。"""
+    from rich.table import Table
+    import tracing
+
+    try:
+        sessions = int(args[0]) if args else 10
+    except ValueError:
+        console.print("[yellow]用法: /traces [会话数][/yellow]")
+        return
+    spans = tracing.load_spans(TRACES_DIR, sessions)
+    if not spans:
+        console.print(f"[yellow]{TRACES_DIR}/ 中暂无追踪记录，请在 .config.yaml 中设置 tracing.enabled: true[/yellow]")
+        return
+    summary = tracing.summarize(spans)
+
+    threads = {s.get("thread") for s in spans}
+    slowest = Table(title=f"最慢的 span（最近 {len(threads)} 个会话）", title_justify="left", header_style="bold")
+    slowest.add_column("span", no_wrap=True)
+    slowest.add_column("耗时 (ms)", justify="right", no_wrap=True)
+    slowest.add_column("会话", style="dim", no_wrap=True)
+    slowest.add_column("时间", style="dim", no_wrap=True)
+    slowest.add_column("详情", style="dim", overflow="fold")
+    for s in summary["slowest"]:
+        details = [
+            f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={json.dumps(v, ensure_ascii=False)[:40]}"
+            for k, v in (s.get("attrs") or {}).items()
+            if k not in ("node", "tool", "model", "op", "index") and v is not None
+        ]
+        slowest.add_row(
+            tracing.span_label(s),
+            f"{s['dur'] * 1000:.1f}",
+            (s.get("thread") or "-")[:8],
+            datetime.datetime.fromtimestamp(s["ts"]).strftime("%m-%d %H:%M:%S"),
+            " ".join(details),
+        )
+    console.print(slowest)
+
+    totals = Table(title="按 span 汇总", title_justify="left", header_style="bold")
+    totals.add_column("span")
+    for column in ("次数", "总计 (ms)", "平均 (ms)", "最大 (ms)"):
+        totals.add_column(column, justify="right")
+    for label, count, total, longest in summary["by_label"]:
+        totals.add_row(label, str(count), f"{total * 1000:.1f}", f"{total / count * 1000:.1f}", f"{longest * 1000:.1f}")
+    console.print(totals)
+
+
+def handle_profile_command(profiler, args: list, backend) -> None:
+    """/profile 命令：`on [N]` 分析接下来 N 轮对话，`off` 取消，无参数显示状态。"""
+    action = args[0] if args else ""
+    if action == "on":
+        try:
+            turns = int(args[1]) if len(args) > 1 else PROFILE_CONFIG.get("turns", 1)
+        except ValueError:
+            console.print("[yellow]用法: /profile on [轮数][/yellow]")
+            return
+        profiler.arm(turns)
+        console.print(f"[green]✓ 将分析接下来 {profiler.remaining} 轮对话（{profiler.mode}），结果保存到 {profiler.output_dir}/[/green]")
+        if hasattr(backend, "socket_path"):
+            console.print("[yellow]当前连接常驻进程，图节点与工具在常驻进程中执行，这里只能分析本地渲染；"
+                          "完整分析请使用 --no-daemon[/yellow]")
+    elif action == "off":
+        profiler.arm(0)
+        console.print("[green]✓ 性能分析已关闭[/green]")
+    elif not action:
+        status = f"剩余 {profiler.remaining} 轮" if profiler.remaining else "未开启"
+        console.print(f"[dim]性能分析: {status}（{profiler.mode}）[/dim]")
+    else:
+        console.print("[yellow]用法: /profile on [轮数] | /profile off[/yellow]")
+
+
+def render_turn(backend, user_input: str, config: dict, profiler=None) -> str:
+    """执行一轮对话并渲染事件流（工具调用、思考过程、审批）。
+
+    流式模式下逐 token 增量渲染回答；阻塞模式下只显示工具调用，结束后一次性渲染回答。
+    传入 profiler 时，等待用户审批的时间不计入性能分析。
 
     Returns the final response content for potential copying.
     """
+    from rich.markdown import Markdown
+    from interfaces.streaming import MarkdownStream
+
     console.print("[bold blue]Agent:[/bold blue]")
 
-    # 第一步：发送用户输入
-    final_output = ""
-    current_input = {"messages": [("user", user_input)]}
+    final_content = ""
+    cache_usage = {"hit": 0, "miss": 0}
+    events = backend.stream_turn(config, user_input)
 
-    while True:
-        # Track state for streaming
-        current_content = ""
+    while events is not None:
+        # 思考面板（按需开启）与正文增量 Markdown 渲染
+        reasoning_live = None
         current_reasoning = ""
-        final_content = ""
-        pending_tool_calls = {}
-        printed_tool_calls = set()
-        # 'reasoning' 或 'content'，用于在两种 Live 面板间切换
-        live_mode = "content"
-
-        # Use Live for real-time markdown rendering
-        live = Live(Markdown(""), console=console, refresh_per_second=10, vertical_overflow="visible")
-        live.start()
+        stream = MarkdownStream(console, refresh_per_second=10)
+        pending_approvals = None
+
+        def close_live():
+            nonlocal reasoning_live
+            if reasoning_live is not None:
+                reasoning_live.stop()
+                reasoning_live = None
+            stream.stop()
+
         try:
-            # 遍历 stream
-            for event in agent.stream(
-                current_input,
-                config,
-                stream_mode="messages"
-            ):
-                msg, metadata = event
-
-                # Handle AI message chunks (streaming text)
-                if isinstance(msg, AIMessageChunk):
-                    # 思考流：reasoning_content 透传自 ReasoningChatOpenAI
-                    reasoning_chunk = msg.additional_kwargs.get("reasoning_content") if msg.additional_kwargs else None
-                    if reasoning_chunk:
-                        if live_mode != "reasoning":
-                            live.update(_reasoning_panel(""))
-                            live_mode = "reasoning"
-                        if SHOW_REASONING_CHAIN:
-                            current_reasoning += reasoning_chunk
-                            live.update(_reasoning_panel(current_reasoning))
-                        else:
-                            live.update(_reasoning_panel("思考中..."))
-
-                    if msg.content:
-                        # 正式回答开始，关闭思考面板
-                        if live_mode == "reasoning":
-                            live.stop()
-                            current_reasoning = ""
-                            live = Live(Markdown(""), console=console, refresh_per_second=10, vertical_overflow="visible")
-                            live.start()
-                            live_mode = "content"
-                        current_content += normalize_llm_content(msg.content)
-                        live.update(Markdown(current_content))
-
-                    # Handle tool calls
-                    if msg.tool_call_chunks:
-                        for chunk in msg.tool_call_chunks:
-                            idx = chunk.get("index", 0)
-                            if idx not in pending_tool_calls:
-                                pending_tool_calls[idx] = {
-                                    "id": chunk.get("id"),
-                                    "name": chunk.get("name") or "",
-                                    "args": chunk.get("args") or ""
-                                }
-                            else:
-                                if chunk.get("id"):
-                                    pending_tool_calls[idx]["id"] = chunk["id"]
-                                if chunk.get("name"):
-                                    pending_tool_calls[idx]["name"] = chunk["name"]
-                                if chunk.get("args"):
-                                    pending_tool_calls[idx]["args"] += chunk["args"]
-
-                # Handle tool messages (results)
-                elif isinstance(msg, ToolMessage):
-                    live.stop()
-
-                    # Print any pending tool calls first
-                    for idx, tc in pending_tool_calls.items():
-                        if idx not in printed_tool_calls and tc.get("name"):
-                            try:
-                                args = json.loads(tc["args"]) if tc["args"] else {}
-                            except json.JSONDecodeError:
-                                args = {"raw": tc["args"]}
-                            console.print(format_tool_call({"name": tc["name"], "args": args}))
-                            printed_tool_calls.add(idx)
-
-                    # Print tool result
-                    tool_name = msg.name or "unknown"
-                    console.print(format_tool_result(tool_name, str(msg.content)))
-
-                    pending_tool_calls.clear()
-                    printed_tool_calls.clear()
-                    if current_content:
-                        final_content = current_content
-                    current_content = ""
-                    current_reasoning = ""
-                    console.print("[bold blue]Agent:[/bold blue]")
-
-                    # 重新开启 Live，准备下一段（默认 content 模式）
-                    live = Live(Markdown(""), console=console, refresh_per_second=10, vertical_overflow="visible")
-                    live.start()
-                    live_mode = "content"
+            for event in events:
+                kind = event["type"]
+
+                # 思考流：reasoning_content 透传自 ReasoningChatOpenAI
+                if kind == "reasoning" and STREAM_OUTPUT and not stream.started:
+                    if reasoning_live is None:
+                        reasoning_live = Live(_reasoning_panel(""), console=console, refresh_per_second=10, vertical_overflow="visible")
+                        reasoning_live.start()
+                    if SHOW_REASONING_CHAIN:
+                        current_reasoning += event["text"]
+                        reasoning_live.update(_reasoning_panel(current_reasoning))
+                    else:
+                        reasoning_live.update(_reasoning_panel("思考中..."))
+
+                elif kind == "token" and STREAM_OUTPUT:
+                    # 正式回答开始，关闭思考面板
+                    if reasoning_live is not None:
+                        reasoning_live.stop()
+                        reasoning_live = None
+                        current_reasoning = ""
+                    stream.start()
+                    stream.append(event["text"])
+
+                # 语义缓存命中：整条回答由 cache_lookup 节点直接给出
+                elif kind == "cached":
+                    if STREAM_OUTPUT:
+                        stream.start()
+                        stream.append(event["text"])
+                        stream.stop()
+                    console.print("[dim](来自语义缓存)[/dim]")
+
+                elif kind == "tool_call":
+                    close_live()
+                    console.print(format_tool_call(event))
+
+                elif kind == "tool_result":
+                    close_live()
+                    console.print(format_tool_result(event["name"] or "unknown", event["content"]))
+                    if STREAM_OUTPUT:
+                        console.print("[bold blue]Agent:[/bold blue]")
+                        # 下一段回答使用新的渲染器
+                        stream = MarkdownStream(console, refresh_per_second=10)
+
+                elif kind == "usage":
+                    cache_usage["hit"] += event["hit"]
+                    cache_usage["miss"] += event["miss"]
+
+                elif kind == "approval":
+                    pending_approvals = event["tool_calls"]
+
+                elif kind == "error":
+                    close_live()
+                    console.print(f"[red]发生错误: {event['message']}[/red]")
+
+                elif kind == "done":
+                    final_content = event["content"]
         except Exception as e:
             console.print(f"[red]流式输出异常: {e}[/red]")
             import traceback
             traceback.print_exc()
         finally:
             try:
-                live.stop()
+                close_live()
             except Exception:
                 pass
 
-        # 保存输出
-        iteration_output = current_content if current_content else final_content
-        if iteration_output:
-            final_output = iteration_output
+        events = None
+        if pending_approvals:
+            with profiler.paused() if profiler is not None else nullcontext():
+                decisions = [handle_approval(tc) for tc in pending_approvals]
+            events = backend.apply_approvals(config, decisions)
 
-        # 检查中断
-        if check_and_handle_interrupt(agent, config):
-            current_input = None  # 继续执行
-            continue
+    # 阻塞模式：渲染最终响应
+    if not STREAM_OUTPUT and final_content:
+        console.print(Markdown(final_content))
 
-        break
+    if REPORT_CACHE_USAGE:
+        print_cache_usage(cache_usage)
 
-    return final_output
+    return final_content
 
 
-def blocking_agent_response(agent, user_input: str, config: dict) -> str:
-    """Non-streaming agent response with tool calls visible.
+class AgentLoader(threading.Thread):
+    """在后台线程中构建 agent，用户输入第一条消息前无需等待重依赖加载。"""
 
-    Returns the final response content for potential copying.
-    """
-    console.print("[bold blue]Agent:[/bold blue]")
+    def __init__(self):
+        super().__init__(name="agent-loader", daemon=True)
+        self._result = None
+        self._error = None
 
-    final_content = ""
-    current_input = {"messages": [("user", user_input)]}
+    def run(self):
+        try:
+            from core import get_agent_executor
+            from runtime import AgentRuntime
+            agent, checkpointer = get_agent_executor()
+            self._result = AgentRuntime(agent, checkpointer, memoize_tools=TOOL_MEMO)
+        except Exception as e:
+            self._error = e
 
-    while True:
-        response = agent.invoke(current_input, config)
-
-        # 提取所有消息，显示工具调用信息
-        messages = response.get("messages", [])
-
-        for msg in messages:
-            # 显示工具调用
-            if hasattr(msg, "tool_calls") and msg.tool_calls:
-                for tc in msg.tool_calls:
-                    console.print(format_tool_call({
-                        "name": tc.get("name", "unknown"),
-                        "args": tc.get("args", {})
-                    }))
-
-            # 显示工具返回结果
-            if isinstance(msg, ToolMessage):
-                tool_name = msg.name or "unknown"
-                console.print(format_tool_result(tool_name, str(msg.content)))
-
-            # 获取最终 AI 响应内容
-            if hasattr(msg, "content") and msg.content and hasattr(msg, "type") and msg.type == "ai":
-                content = normalize_llm_content(msg.content)
-                if content:
-                    final_content = content
-
-        # 检查中断
-        if check_and_handle_interrupt(agent, config):
-            current_input = None  # 继续执行
-            continue
-
-        break
-
-    # 渲染最终响应
-    if final_content:
-        console.print(Markdown(final_content))
+    def get(self):
+        """等待加载完成并返回 AgentRuntime，加载失败时抛出原异常。"""
+        if self.is_alive():
+            with console.status("[dim]正在加载 Agent...[/dim]"):
+                self.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
 
-    return final_content
 
+def main(startup_check: bool = False, use_daemon: bool = True):
+    """运行交互式 CLI.
 
-def main():
-    try:
-        agent, checkpointer = get_agent_executor()
-    except Exception as e:
-        console.print(f"[red]Error initializing agent: {e}[/red]")
-        return
+    Args:
+        startup_check: 仅用于启动基准测试：初始化到首个提示符前即退出。
+        use_daemon: 有常驻进程时作为瘦客户端连接它（见 interfaces.daemon）。
+    """
+    # 对话后端：常驻进程客户端，或本进程内的 AgentRuntime（后台加载）
+    backend = None
+    if use_daemon and not startup_check:
+        from interfaces.daemon import connect_daemon, start_daemon
+        backend = connect_daemon()
+        if backend is None and DAEMON_AUTOSTART:
+            with console.status("[dim]正在启动常驻进程...[/dim]"):
+                backend = start_daemon()
 
     # Use a fixed thread_id for this session to maintain conversation history
     thread_id = str(uuid.uuid4())
@@ -967,13 +944,37 @@ def main():
         """Bind Enter to submit the buffer."""
         event.current_buffer.validate_and_handle()
 
+    from profiling import TurnProfiler, format_top
+    profiler = TurnProfiler(
+        mode=PROFILE_CONFIG.get("mode", "sample"),
+        interval=PROFILE_CONFIG.get("interval", 0.005),
+        output_dir=PROFILE_CONFIG.get("dir", os.path.join("data", "profiles")),
+    )
+    if PROFILE_CONFIG.get("enabled"):
+        profiler.arm(PROFILE_CONFIG.get("turns", 1))
+
     output_mode = "流式" if STREAM_OUTPUT else "阻塞"
     console.print(f"[dim]Session ID: {thread_id}[/dim]")
     console.print(f"[dim]输出模式: {output_mode}[/dim]")
-    console.print("[dim]命令: /notes 浏览笔记 | /tidy 整理记忆 | /resume 恢复会话 | /clear 清空上下文 | /exit 退出[/dim]")
+    if backend is not None:
+        console.print(f"[dim]已连接常驻进程: {backend.socket_path}[/dim]")
+    console.print("[dim]命令: /notes 浏览笔记 | /tidy 整理记忆 | /resume 恢复会话 | /more 更早对话 | /stats 性能统计 | /profile 性能分析 | /traces 慢 span | /clear 清空上下文 | /exit 退出[/dim]")
     console.print("[dim]─" * 50 + "[/dim]")
 
     use_prompt_toolkit = True
+    # 当前恢复会话的分页历史
+    history = None
+    # 当前会话已进行的轮次（用于性能分析文件名）
+    turns = 0
+
+    if startup_check:
+        return
+
+    # 依赖加载与 agent 构建放到后台，与等待用户输入并行
+    loader = None
+    if backend is None:
+        loader = AgentLoader()
+        loader.start()
 
     while True:
         try:
@@ -1007,16 +1008,18 @@ def main():
                 tidy_memory()
                 continue
 
-            if stripped_input == "/resume":
-                config = view_sessions_menu(checkpointer, agent)
-                if config:
-                    console.print(f"[green]✓ 已恢复会话: {config['configurable']['thread_id']}[/green]")
-                    display_history_messages(agent, config)
+            if stripped_input == "/more":
+                if history is None or not history.hidden:
+                    console.print("[dim]没有更早的对话了[/dim]")
+                else:
+                    history.show_page()
                 continue
 
             if stripped_input == "/clear":
                 thread_id = str(uuid.uuid4())
                 config = {"configurable": {"thread_id": thread_id}}
+                history = None
+                turns = 0
                 console.print("[green]✓ 上下文已清空，新对话已开始[/green]")
                 console.print(f"[dim]Session ID: {thread_id}[/dim]")
                 continue
@@ -1024,10 +1027,45 @@ def main():
             if not stripped_input:
                 continue
 
-            if STREAM_OUTPUT:
-                stream_agent_response(agent, user_input, config)
-            else:
-                blocking_agent_response(agent, user_input, config)
+            if stripped_input.split()[0] == "/traces":
+                show_traces(stripped_input.split()[1:])
+                continue
+
+            if stripped_input.split()[0] == "/profile":
+                handle_profile_command(profiler, stripped_input.split()[1:], backend)
+                continue
+
+            # 以下操作需要 agent，等待后台加载完成
+            if backend is None:
+                try:
+                    backend = loader.get()
+                except Exception as e:
+                    console.print(f"[red]Error initializing agent: {e}[/red]")
+                    return
+
+            if stripped_input == "/resume":
+                resumed_config = view_sessions_menu(backend)
+                if resumed_config:
+                    config = resumed_config
+                    console.print(f"[green]✓ 已恢复会话: {config['configurable']['thread_id']}[/green]")
+                    history = display_history_messages(backend, config)
+                    # 恢复的会话从已有的用户消息数继续计数，复用已加载的历史
+                    turns = sum(1 for msg in history.messages if msg.get("type") == "human") if history else 0
+                continue
+
+            if stripped_input.split()[0] == "/stats":
+                show_stats(backend, stripped_input.split()[1:])
+                continue
+
+            turns += 1
+            _, profiled = profiler.run(
+                render_turn, config["configurable"]["thread_id"], turns,
+                backend, user_input, config, profiler=profiler,
+            )
+            if profiled:
+                path, elapsed, top = profiled
+                console.print(f"[dim]性能分析 ({elapsed:.2f}s) 热点: {format_top(top)}[/dim]")
+                console.print(f"[dim]已保存: {path}[/dim]")
             print()
 
         except (KeyboardInterrupt, EOFError):
@@ -0,0 +1,282 @@
+"""Resident agent daemon on a local Unix socket, and its thin client.
+
+The daemon builds the agent once (LLM client, graph, checkpointer), warms
+the embedding model and FAISS indexes, and serves any number of terminals.
+`main.py` connects to it when it is running, so a new CLI session only pays
+for importing the UI and one socket round trip.
+
+Protocol: the client sends one JSON request line per connection; the daemon
+answers with JSON event lines (see `runtime`) and closes the connection.
+
+    {"op": "ping"}
+    {"op": "chat", "thread_id": str, "input": str | null}  (null resumes)
+    {"op": "approve", "thread_id": str, "decisions": list}
+    {"op": "sessions", "limit": int}
+    {"op": "history", "thread_id": str}
+    {"op": "stats"}
+    {"op": "reset_stats"}
+    {"op": "export_stats", "path": str | null}
+    {"op": "shutdown"}
+"""
+
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from core import load_config
+
+# 连接常驻进程时的超时（秒），仅用于 connect/ping，对话流不设超时
+CONNECT_TIMEOUT = 0.5
+
+# 项目根目录；不引用 tools.base，避免客户端启动时导入工具模块
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_socket_path() -> str:
+    """Configured daemon socket path (default: data/agent.sock)."""
+    path = (load_config().get("daemon") or {}).get("socket", os.path.join("data", "agent.sock"))
+    if not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+    return path
+
+
+def _warm_up():
+    """Load the embedding model and indexes before the first request needs them."""
+    from tools import _get_embeddings, _get_vectorstore, _get_notes_vectorstore
+
+    try:
+        _get_embeddings()
+        _get_vectorstore()
+        _get_notes_vectorstore()
+    except Exception:
+        # 预热失败不影响服务，首次使用时会再次加载
+        pass
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "AgentDaemon"
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            for event in self.server.dispatch(request):
+                self._send(event)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途退出（如 Ctrl-C）
+            pass
+        except Exception as e:
+            try:
+                self._send({"type": "error", "message": str(e)})
+            except OSError:
+                pass
+
+    def _send(self, event: dict):
+        self.wfile.write(json.dumps(event, ensure_ascii=False, default=str).encode() + b"\n")
+        self.wfile.flush()
+
+
+class AgentDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix-socket server sharing one AgentRuntime across clients.
+
+    Args:
+        socket_path: Path of the Unix socket to listen on.
+        runtime: AgentRuntime to serve.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, runtime):
+        self.socket_path = socket_path
+        self.runtime = runtime
+        super().__init__(socket_path, _RequestHandler)
+
+    def server_bind(self):
+        # 在 umask 0177 下绑定，socket 文件创建时即为 0600，仅当前用户可连接
+        previous = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(previous)
+
+    def dispatch(self, request: dict):
+        """Yield the response events of one request."""
+        op = request.get("op")
+        if op == "ping":
+            yield {"type": "pong", "pid": os.getpid()}
+        elif op in ("chat", "approve"):
+            thread_id = request["thread_id"]
+            config = {"configurable": {"thread_id": thread_id}}
+            # 同一会话的多轮请求串行执行，不同会话并发
+            with self.runtime.thread_lock(thread_id):
+                if op == "chat":
+                    yield from self.runtime.stream_turn(config, request.get("input"))
+                else:
+                    yield from self.runtime.apply_approvals(config, request.get("decisions", []))
+        elif op == "sessions":
+            yield {"type": "sessions", "items": self.runtime.sessions(request.get("limit", 20))}
+        elif op == "history":
+            config = {"configurable": {"thread_id": request["thread_id"]}}
+            yield {"type": "history", "messages": self.runtime.history(config)}
+        elif op == "stats":
+            yield {"type": "stats", "stats": self.runtime.stats()}
+        elif op == "reset_stats":
+            self.runtime.reset_stats()
+            yield {"type": "ok"}
+        elif op == "export_stats":
+            yield {"type": "exported", "path": self.runtime.export_stats(request.get("path"))}
+        elif op == "shutdown":
+            yield {"type": "ok"}
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        else:
+            yield {"type": "error", "message": f"unknown op: {op!r}"}
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+def serve(socket_path: str = None):
+    """Build the agent and serve it on `socket_path` until interrupted."""
+    from core import get_agent_executor
+    from runtime import AgentRuntime
+
+    socket_path = socket_path or get_socket_path()
+    if connect_daemon(socket_path) is not None:
+        print(f"Daemon already running on {socket_path}")
+        return
+    # 清理上次异常退出残留的 socket 文件
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+    agent, checkpointer = get_agent_executor()
+    runtime = AgentRuntime(agent, checkpointer, memoize_tools=load_config().get("tool_memo", False))
+    # umask 是进程级的，先绑定 socket 再启动会创建文件的预热线程
+    server = AgentDaemon(socket_path, runtime)
+    threading.Thread(target=_warm_up, name="daemon-warm-up", daemon=True).start()
+    print(f"Agent daemon listening on {socket_path} (pid {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class DaemonClient:
+    """Thin client with the same interface as runtime.AgentRuntime.
+
+    Args:
+        socket_path: Daemon socket path.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    def _request(self, payload: dict, timeout: float = None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(self.socket_path)
+            sock.settimeout(timeout)
+            sock.sendall(json.dumps(payload, ensure_ascii=False).encode() + b"\n")
+            with sock.makefile("rb") as reader:
+                for line in reader:
+                    yield json.loads(line)
+        finally:
+            sock.close()
+
+    def _single(self, payload: dict, timeout: float = None) -> dict:
+        events = self._request(payload, timeout)
+        try:
+            event = next(events, None)
+        finally:
+            events.close()
+        if event is None:
+            raise ConnectionError("daemon closed the connection without a response")
+        if event.get("type") == "error":
+            raise RuntimeError(event["message"])
+        return event
+
+    def ping(self) -> dict:
+        return self._single({"op": "ping"}, timeout=CONNECT_TIMEOUT)
+
+    def stream_turn(self, config: dict, user_input: str = None):
+        return self._request({
+            "op": "chat",
+            "thread_id": config["configurable"]["thread_id"],
+            "input": user_input,
+        })
+
+    def apply_approvals(self, config: dict, decisions: list):
+        return self._request({
+            "op": "approve",
+            "thread_id": config["configurable"]["thread_id"],
+            "decisions": decisions,
+        })
+
+    def sessions(self, limit: int = 20) -> list:
+        items = self._single({"op": "sessions", "limit": limit})["items"]
+        return [tuple(item) for item in items]
+
+    def history(self, config: dict) -> list:
+        return self._single({"op": "history", "thread_id": config["configurable"]["thread_id"]})["messages"]
+
+    def stats(self) -> dict:
+        return self._single({"op": "stats"})["stats"]
+
+    def reset_stats(self):
+        self._single({"op": "reset_stats"})
+
+    def export_stats(self, path: str = None) -> str | None:
+        return self._single({"op": "export_stats", "path": path})["path"]
+
+    def shutdown(self):
+        self._single({"op": "shutdown"})
+
+
+def connect_daemon(socket_path: str = None) -> DaemonClient | None:
+    """Return a client for the running daemon, or None if none answers."""
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    client = DaemonClient(socket_path)
+    try:
+        client.ping()
+    except (OSError, ValueError, RuntimeError, ConnectionError):
+        return None
+    return client
+
+
+def start_daemon(socket_path: str = None, wait: float = 60) -> DaemonClient | None:
+    """Spawn a detached daemon process and wait until it answers."""
+    socket_path = socket_path or get_socket_path()
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    log_path = os.path.join(os.path.dirname(socket_path), "daemon.log")
+    with open(log_path, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, "main.py"), "--daemon"],
+            cwd=BASE_DIR,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        client = connect_daemon(socket_path)
+        if client is not None:
+            return client
+        time.sleep(0.1)
+    return None
@@ -0,0 +1,365 @@
+"""Local HTTP interface with Server-Sent Events streaming.
+
+Serves the agent to other local frontends from one process. The embedding
+model, FAISS indexes, compiled graph and checkpointer are shared by all
+requests, and read-only database queries go through a connection pool.
+Turns of one thread run serially; different threads run concurrently, up
+to `max_concurrent_turns`. Further turn requests wait up to `queue_timeout`
+seconds and are then rejected with 503.
+
+Endpoints:
+
+    GET  /health
+    POST /chat                      {"input": str, "thread_id": str?}   -> SSE
+    POST /approve                   {"thread_id": str, "decisions": list} -> SSE
+    GET  /sessions?limit=20
+    GET  /sessions/<thread_id>/history
+    GET  /notes
+    GET  /notes/search?q=...&k=3
+    GET  /notes/<note_id>
+    POST /notes                     {"title", "content", "tags"}
+    GET  /memory
+    GET  /memory/search?q=...&k=3
+    GET  /stats?format=json|prometheus
+
+Turn endpoints stream `runtime` events as SSE (`event: <type>`, `data:
+<json>`), preceded by a `session` event carrying the thread_id. A turn that
+needs approval ends with an `approval` event; the client resumes it with
+POST /approve.
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from core import load_config
+
+# 请求体上限（字节）
+MAX_BODY = 1024 * 1024
+
+
+class HTTPError(Exception):
+    """Error answered with a JSON body and the given status code."""
+
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "AgentHTTPServer"
+    server_version = "PersonalAgent"
+
+    def setup(self):
+        # 读请求的超时，防止慢客户端长期占用工作线程
+        self.timeout = self.server.read_timeout
+        super().setup()
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            route = self.server.route(method, parts)
+            if route is None:
+                raise HTTPError(404, f"no route for {method} {url.path}")
+            handler, args = route
+            body = self._read_json() if method == "POST" else {}
+            result = handler(self, *args, query=query, body=body)
+            if result is not None:
+                self._send_json(200, result)
+        except HTTPError as e:
+            self._send_json(e.status, {"error": e.message}, e.headers)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise HTTPError(413, "request body too large")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPError(400, f"invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "JSON body must be an object")
+        return body
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8"):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def send_event(self, event: dict):
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode())
+        self.wfile.flush()
+
+
+class AgentHTTPServer(ThreadingHTTPServer):
+    """HTTP server sharing one AgentRuntime across requests.
+
+    Args:
+        address: (host, port) to listen on.
+        runtime: AgentRuntime to serve.
+        max_concurrent_turns: Turns running at the same time.
+        queue_timeout: Seconds a turn request waits for a free slot or for
+            its thread's previous turn before being rejected.
+        turn_timeout: Seconds after which a running turn is abandoned.
+        read_timeout: Socket timeout for reading requests.
+        access_log: Log every request to stderr.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, runtime, max_concurrent_turns: int = 8, queue_timeout: float = 5.0,
+                 turn_timeout: float = 300.0, read_timeout: float = 30.0, access_log: bool = False):
+        self.runtime = runtime
+        self.queue_timeout = queue_timeout
+        self.turn_timeout = turn_timeout
+        self.read_timeout = read_timeout
+        self.access_log = access_log
+        self._turn_slots = threading.BoundedSemaphore(max(1, max_concurrent_turns))
+        self._routes = [
+            ("GET", ("health",), _health),
+            ("POST", ("chat",), _chat),
+            ("POST", ("approve",), _approve),
+            ("GET", ("sessions",), _sessions),
+            ("GET", ("sessions", None, "history"), _history),
+            ("GET", ("notes",), _notes),
+            ("GET", ("notes", "search"), _search_notes),
+            ("GET", ("notes", None), _note),
+            ("POST", ("notes",), _create_note),
+            ("GET", ("memory",), _memory),
+            ("GET", ("memory", "search"), _search_memory),
+            ("GET", ("stats",), _stats),
+        ]
+        super().__init__(address, _Handler)
+
+    def route(self, method: str, parts: list):
+        """Match a request to (handler, path args); None segments are captured."""
+        for route_method, pattern, handler in self._routes:
+            if route_method != method or len(pattern) != len(parts):
+                continue
+            args = []
+            for expected, actual in zip(pattern, parts):
+                if expected is None:
+                    args.append(actual)
+                elif expected != actual:
+                    break
+            else:
+                return handler, args
+        return None
+
+    def run_turn(self, handler: _Handler, thread_id: str, start_events):
+        """Stream one turn as SSE under the backpressure and per-thread limits."""
+        if not self._turn_slots.acquire(timeout=self.queue_timeout):
+            raise HTTPError(503, "server busy, retry later", {"Retry-After": "1"})
+        try:
+            lock = self.runtime.thread_lock(thread_id)
+            if not lock.acquire(timeout=self.queue_timeout):
+                raise HTTPError(409, f"thread {thread_id} is busy with another turn")
+            try:
+                handler.start_sse()
+                handler.send_event({"type": "session", "thread_id": thread_id})
+                deadline = time.monotonic() + self.turn_timeout
+                events = start_events()
+                try:
+                    for event in events:
+                        handler.send_event(event)
+                        if time.monotonic() > deadline:
+                            # 只能在事件之间中止；单次 LLM 调用受 llm.timeout 约束
+                            handler.send_event({"type": "error", "message": f"turn timed out after {self.turn_timeout}s"})
+                            break
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                except Exception as e:
+                    handler.send_event({"type": "error", "message": f"{type(e).__name__}: {e}"})
+                finally:
+                    events.close()
+            finally:
+                lock.release()
+        finally:
+            self._turn_slots.release()
+
+
+def _thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _int_param(query: dict, name: str, default: int) -> int:
+    try:
+        return int(query.get(name, default))
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer")
+
+
+def _health(handler, *, query, body):
+    return {"ok": True}
+
+
+def _chat(handler, *, query, body):
+    user_input = body.get("input")
+    if not isinstance(user_input, str) or not user_input:
+        raise HTTPError(400, "\"input\" must be a non-empty string")
+    thread_id = body.get("thread_id") or str(uuid.uuid4())
+    runtime = handler.server.runtime
+    handler.server.run_turn(handler, thread_id, lambda: runtime.stream_turn(_thread_config(thread_id), user_input))
+
+
+def _approve(handler, *, query, body):
+    thread_id = body.get("thread_id")
+    decisions = body.get("decisions")
+    if not thread_id or not isinstance(decisions, list):
+        raise HTTPError(400, "\"thread_id\" and a \"decisions\" list are required")
+    runtime = handler.server.runtime
+    handler.server.run_turn(handler, thread_id, lambda: runtime.apply_approvals(_thread_config(thread_id), decisions))
+
+
+def _sessions(handler, *, query, body):
+    items = handler.server.runtime.sessions(_int_param(query, "limit", 20))
+    return {"sessions": [{"thread_id": thread_id, "summary": summary} for thread_id, summary in items]}
+
+
+def _history(handler, thread_id, *, query, body):
+    return {"thread_id": thread_id, "messages": handler.server.runtime.history(_thread_config(thread_id))}
+
+
+def _notes(handler, *, query, body):
+    from tools import _load_notes
+
+    notes = _load_notes()
+    items = [
+        {"id": note_id, "title": note["title"], "created_at": note["created_at"], "tags": note["tags"]}
+        for note_id, note in notes.items()
+    ]
+    items.sort(key=lambda item: item["created_at"], reverse=True)
+    return {"notes": items}
+
+
+def _note(handler, note_id, *, query, body):
+    from tools import _load_notes
+
+    note = _load_notes().get(note_id)
+    if note is None:
+        raise HTTPError(404, f"note {note_id} not found")
+    return {"id": note_id, **note}
+
+
+def _search_notes(handler, *, query, body):
+    from tools import search_notes
+
+    if not query.get("q"):
+        raise HTTPError(400, "query parameter q is required")
+    return {"result": search_notes.invoke({"query": query["q"], "k": _int_param(query, "k", 3)})}
+
+
+def _create_note(handler, *, query, body):
+    from tools import _add_note
+
+    title, content = body.get("title"), body.get("content")
+    if not isinstance(title, str) or not isinstance(content, str) or not title:
+        raise HTTPError(400, "\"title\" and \"content\" strings are required")
+    return {"result": _add_note(title, content, body.get("tags") or "")}
+
+
+def _memory(handler, *, query, body):
+    from tools import _load_memory
+
+    return {"memory": _load_memory()}
+
+
+def _search_memory(handler, *, query, body):
+    from tools import search_memory
+
+    if not query.get("q"):
+        raise HTTPError(400, "query parameter q is required")
+    return {"result": search_memory.invoke({"query": query["q"], "k": _int_param(query, "k", 3)})}
+
+
+def _stats(handler, *, query, body):
+    output_format = query.get("format", "json")
+    if output_format == "prometheus":
+        handler.send_text(200, metrics.render_prometheus(handler.server.runtime.stats()),
+                          "text/plain; version=0.0.4; charset=utf-8")
+        return None
+    if output_format != "json":
+        raise HTTPError(400, "format must be json or prometheus")
+    return handler.server.runtime.stats()
+
+
+def serve(host: str = None, port: int = None):
+    """Build the agent and serve it over HTTP until interrupted."""
+    from core import CHECKPOINT_DB_PATH, get_agent_executor
+    from interfaces.daemon import _warm_up
+    from persistence import ConnectionPool
+    from runtime import AgentRuntime
+
+    config = load_config()
+    server_config = config.get("server") or {}
+    host = host or server_config.get("host", "127.0.0.1")
+    port = port or server_config.get("port", 8780)
+
+    agent, checkpointer = get_agent_executor()
+    read_pool = ConnectionPool(CHECKPOINT_DB_PATH, size=server_config.get("db_pool_size", 4))
+    runtime = AgentRuntime(agent, checkpointer, memoize_tools=config.get("tool_memo", False), read_pool=read_pool)
+    threading.Thread(target=_warm_up, name="server-warm-up", daemon=True).start()
+
+    server = AgentHTTPServer(
+        (host, port),
+        runtime,
+        max_concurrent_turns=server_config.get("max_concurrent_turns", 8),
+        queue_timeout=server_config.get("queue_timeout", 5),
+        turn_timeout=server_config.get("turn_timeout", 300),
+        read_timeout=server_config.get("read_timeout", 30),
+        access_log=server_config.get("access_log", False),
+    )
+    print(f"Agent HTTP server listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        read_pool.close()
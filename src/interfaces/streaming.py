@@ -0,0 +1,135 @@
+"""Incremental Markdown rendering for streamed replies.
+
+Re-rendering the whole reply on every token is O(n²) and makes long answers
+stutter. MarkdownStream instead splits the reply into Markdown blocks as it
+arrives: once a block is complete (a paragraph followed by a blank line, a
+closed code fence), it is rendered once and printed into the scrollback. The
+Live region only holds the still-open tail block, and it is redrawn by Live's
+refresh thread at a fixed rate instead of once per chunk, so the cost per
+refresh stays flat as the reply grows.
+"""
+
+import re
+
+from rich.live import Live
+from rich.markdown import Markdown
+
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+class _Tail:
+    """Renderable that draws the stream's current open block."""
+
+    def __init__(self, stream: "MarkdownStream"):
+        self.stream = stream
+
+    def __rich_console__(self, console, options):
+        yield self.stream._tail_markdown()
+
+
+class MarkdownStream:
+    """Streams Markdown into the console, freezing completed blocks.
+
+    Args:
+        console: Rich console to render to.
+        refresh_per_second: Redraw rate of the open tail block.
+
+    Example:
+        stream = MarkdownStream(console)
+        stream.start()
+        for chunk in chunks:
+            stream.append(chunk)
+        stream.stop()
+    """
+
+    def __init__(self, console, refresh_per_second: float = 10):
+        self.console = console
+        self.refresh_per_second = refresh_per_second
+        self.text = ""
+        # text[:_frozen] 已输出到滚动区
+        self._frozen = 0
+        # 下一个待扫描的完整行的起始位置
+        self._scan = 0
+        self._fence = None
+        # 空行后的候选分块位置，等下一行确认不是缩进续行后生效
+        self._pending_boundary = None
+        self._tail_cache = (None, None)
+        self._live = None
+
+    @property
+    def started(self) -> bool:
+        return self._live is not None
+
+    def start(self):
+        if self._live is None:
+            self._live = Live(
+                _Tail(self),
+                console=self.console,
+                refresh_per_second=self.refresh_per_second,
+                vertical_overflow="visible",
+            )
+            self._live.start()
+
+    def append(self, chunk: str):
+        """Add streamed text; completed blocks are printed immediately."""
+        if not chunk:
+            return
+        self.text += chunk
+        boundary = self._scan_lines()
+        if boundary is not None and boundary > self._frozen:
+            block = self.text[self._frozen:boundary]
+            self._frozen = boundary
+            if block.strip():
+                self.console.print(Markdown(block))
+                self.console.print()
+
+    def stop(self):
+        """Render the remaining tail and stop the live region."""
+        if self._live is not None:
+            self._live.stop()
+            self._live = None
+
+    def _scan_lines(self):
+        """Scan newly completed lines and return the last block boundary found."""
+        boundary = None
+        text = self.text
+        while True:
+            newline = text.find("\n", self._scan)
+            if newline < 0:
+                break
+            line = text[self._scan:newline]
+            line_end = newline + 1
+            self._scan = line_end
+
+            fence = _FENCE_RE.match(line)
+            if self._fence is not None:
+                # 代码块内：只关注闭合围栏
+                marker = self._fence
+                if fence and fence.group(1)[0] == marker[0] and len(fence.group(1)) >= len(marker) \
+                        and not line.strip()[len(fence.group(1)):].strip():
+                    self._fence = None
+                    boundary = line_end
+                continue
+
+            if not line.strip():
+                if self._pending_boundary is None:
+                    self._pending_boundary = line_end
+                continue
+
+            if self._pending_boundary is not None:
+                # 缩进行可能是上一块的续行（列表项段落、缩进代码），不能切开
+                if not line[:1].isspace():
+                    boundary = self._pending_boundary
+                self._pending_boundary = None
+
+            if fence:
+                self._fence = fence.group(1)
+        return boundary
+
+    def _tail_markdown(self) -> Markdown:
+        tail = self.text[self._frozen:]
+        cached_text, cached = self._tail_cache
+        if cached_text != tail:
+            cached = Markdown(tail)
+            self._tail_cache = (tail, cached)
+        return cached
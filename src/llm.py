@@ -1,8 +1,100 @@
 """LLM initialization for the personal agent."""
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import json
+import time
+
+import httpx
 from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
 from langchain_openai import ChatOpenAI
 from core import load_config
+from replay import get_cassette
+import metrics
+import tracing
+
+
+def _extract_cache_usage(token_usage):
+    """从 usage 字段提取前缀缓存命中/未命中 token 数。
+
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens；
+    OpenAI 兼容实现则放在 prompt_tokens_details.cached_tokens。
+
+    Returns:
+        {"hit": int, "miss": int}，无缓存信息时返回 None。
+    """
+    if not token_usage:
+        return None
+    hit = token_usage.get("prompt_cache_hit_tokens")
+    miss = token_usage.get("prompt_cache_miss_tokens")
+    if hit is None:
+        details = token_usage.get("prompt_tokens_details") or {}
+        hit = details.get("cached_tokens")
+        if hit is None:
+            return None
+        miss = max((token_usage.get("prompt_tokens") or 0) - hit, 0)
+    return {"hit": hit, "miss": miss or 0}
+
+
+def _add_usage(totals: dict, message):
+    """Add the input/output/cached token counts reported on `message` to `totals`."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        totals["input"] += usage.get("input_tokens", 0)
+        totals["output"] += usage.get("output_tokens", 0)
+    cache_usage = get_cache_usage(message)
+    if cache_usage:
+        totals["cached"] += cache_usage["hit"]
+
+
+def _record_call(model: str, start: float, duration: float, ttft, usage: dict, request: dict):
+    """Report one LLM call to metrics and the trace log."""
+    metrics.observe("llm_seconds", duration, model=model)
+    for kind, tokens in usage.items():
+        metrics.incr("llm_tokens_total", tokens, model=model, kind=kind)
+    tracing.record("llm", start, duration, model=model, ttft=ttft, **request, **usage)
+
+
+def _observe_stream(model: str, request: dict, chunks):
+    """Pass chunks through, recording TTFT, duration and token usage."""
+    start = time.time()
+    started = time.perf_counter()
+    ttft = None
+    usage = {"input": 0, "output": 0, "cached": 0}
+    try:
+        for chunk in chunks:
+            message = chunk.message
+            if ttft is None and (message.content or message.additional_kwargs.get("reasoning_content")
+                                 or getattr(message, "tool_call_chunks", None)):
+                ttft = time.perf_counter() - started
+                metrics.observe("llm_ttft_seconds", ttft, model=model)
+            _add_usage(usage, message)
+            yield chunk
+    finally:
+        _record_call(model, start, time.perf_counter() - started, ttft, usage, request)
+
+
+def _dump_message(message) -> dict:
+    """Serialize an AIMessage(Chunk) for the replay cassette."""
+    data = {
+        "content": message.content,
+        "additional_kwargs": message.additional_kwargs,
+        "response_metadata": message.response_metadata,
+        "usage_metadata": message.usage_metadata,
+        "id": message.id,
+    }
+    if isinstance(message, AIMessageChunk):
+        data["tool_call_chunks"] = message.tool_call_chunks
+    else:
+        data["tool_calls"] = message.tool_calls
+    return data
+
+
+def get_cache_usage(message):
+    """Return the cache usage attached to an AIMessage(Chunk), or None."""
+    metadata = getattr(message, "response_metadata", None) or {}
+    return metadata.get("cache_usage")
 
 
 class ReasoningChatOpenAI(ChatOpenAI):
@@ -10,11 +102,108 @@ class ReasoningChatOpenAI(ChatOpenAI):
 
     1. 流式 chunk 解析：把 delta['reasoning_content'] 透传到
        AIMessageChunk.additional_kwargs['reasoning_content']，便于 UI 实时展示。
-    2. 请求 payload：把历史 AIMessage.additional_kwargs['reasoning_content'] 作为顶层字段
-       回传给服务端 —— DeepSeek 文档要求两个 user 消息之间发生过工具调用时，
-       assistant 的 reasoning_content 必须原样回传，否则会返回 400。
+    2. 请求 payload：把最后一条 user 消息之后的 AIMessage.additional_kwargs['reasoning_content']
+       作为顶层字段回传给服务端 —— DeepSeek 文档要求两个 user 消息之间发生过工具调用时，
+       assistant 的 reasoning_content 必须原样回传，否则会返回 400；更早轮次的思维链不再回传。
+    3. 缓存用量：把 usage 中的前缀缓存命中/未命中 token 数写入
+       response_metadata['cache_usage']，流式与非流式一致。
+    4. 录制/回放：配置 replay.mode 时，请求与响应（含流式 chunk）经 replay 模块
+       录制到 cassette 或从中回放。
     """
 
+    def _trace_request(self, messages, stop, **kwargs) -> dict:
+        """Request size attributes for the trace log (empty when tracing is off)."""
+        if not tracing.enabled():
+            return {}
+        try:
+            payload = self._get_request_payload(messages, stop=stop, **kwargs)
+            payload_bytes = len(json.dumps(payload, ensure_ascii=False, default=str).encode())
+        except Exception:
+            payload_bytes = None
+        return {"messages": len(messages), "payload_bytes": payload_bytes}
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = self._stream_chunks(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if metrics.enabled() or tracing.enabled():
+            request = self._trace_request(messages, stop, **{**kwargs, "stream": True})
+            chunks = _observe_stream(self.model_name, request, chunks)
+        yield from chunks
+
+    def _stream_chunks(self, messages, stop=None, run_manager=None, **kwargs):
+        cassette = get_cassette()
+        if cassette is None:
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+
+        request = self._get_request_payload(messages, stop=stop, **{**kwargs, "stream": True})
+        started = time.perf_counter()
+        if cassette.mode == "replay":
+            interaction = cassette.replay("llm_stream", request)
+            for item in interaction["response"]:
+                cassette.wait_until(started, item["offset"])
+                chunk = ChatGenerationChunk(
+                    message=AIMessageChunk(**item["message"]),
+                    generation_info=item.get("generation_info"),
+                )
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        recorded_chunks = []
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            recorded_chunks.append({
+                "offset": time.perf_counter() - started,
+                "message": _dump_message(chunk.message),
+                "generation_info": chunk.generation_info,
+            })
+            yield chunk
+        cassette.record("llm_stream", request, recorded_chunks, time.perf_counter() - started)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        # streaming=True 时父类会走 _stream，在那里计量
+        if not (metrics.enabled() or tracing.enabled()) or self.streaming:
+            return self._generate_result(messages, stop=stop, run_manager=run_manager, **kwargs)
+        request = self._trace_request(messages, stop, **kwargs)
+        start = time.time()
+        started = time.perf_counter()
+        result = self._generate_result(messages, stop=stop, run_manager=run_manager, **kwargs)
+        usage = {"input": 0, "output": 0, "cached": 0}
+        for generation in result.generations:
+            _add_usage(usage, generation.message)
+        _record_call(self.model_name, start, time.perf_counter() - started, None, usage, request)
+        return result
+
+    def _generate_result(self, messages, stop=None, run_manager=None, **kwargs):
+        cassette = get_cassette()
+        # streaming=True 时父类会走 _stream，录制/回放在那里完成
+        if cassette is None or self.streaming:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        request = self._get_request_payload(messages, stop=stop, **kwargs)
+        started = time.perf_counter()
+        if cassette.mode == "replay":
+            interaction = cassette.replay("llm", request)
+            cassette.wait_until(started, interaction["duration"])
+            response = interaction["response"]
+            return ChatResult(
+                generations=[
+                    ChatGeneration(message=AIMessage(**g["message"]), generation_info=g.get("generation_info"))
+                    for g in response["generations"]
+                ],
+                llm_output=response.get("llm_output"),
+            )
+
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        cassette.record("llm", request, {
+            "generations": [
+                {"message": _dump_message(g.message), "generation_info": g.generation_info}
+                for g in result.generations
+            ],
+            "llm_output": result.llm_output,
+        }, time.perf_counter() - started)
+        return result
+
     def _convert_chunk_to_generation_chunk(self, chunk, default_chunk_class, base_generation_info):
         generation_chunk = super()._convert_chunk_to_generation_chunk(
             chunk, default_chunk_class, base_generation_info
@@ -22,6 +211,11 @@ class ReasoningChatOpenAI(ChatOpenAI):
         if generation_chunk is None:
             return generation_chunk
 
+        # usage 通常单独出现在最后一个（choices 为空的）chunk 中
+        cache_usage = _extract_cache_usage(chunk.get("usage"))
+        if cache_usage and isinstance(generation_chunk.message, AIMessageChunk):
+            generation_chunk.message.response_metadata["cache_usage"] = cache_usage
+
         choices = chunk.get("choices") or chunk.get("chunk", {}).get("choices", [])
         if not choices:
             return generation_chunk
@@ -31,6 +225,15 @@ class ReasoningChatOpenAI(ChatOpenAI):
             generation_chunk.message.additional_kwargs["reasoning_content"] = reasoning_content
         return generation_chunk
 
+    def _create_chat_result(self, response, generation_info=None):
+        result = super()._create_chat_result(response, generation_info)
+        token_usage = (result.llm_output or {}).get("token_usage")
+        cache_usage = _extract_cache_usage(token_usage)
+        if cache_usage:
+            for generation in result.generations:
+                generation.message.response_metadata["cache_usage"] = cache_usage
+        return result
+
     def _get_request_payload(self, input_, *, stop=None, **kwargs):
         payload = super()._get_request_payload(input_, stop=stop, **kwargs)
 
@@ -38,26 +241,85 @@ class ReasoningChatOpenAI(ChatOpenAI):
         if "messages" not in payload:
             return payload
 
-        # 按顺序把原始 AIMessage 的 reasoning_content 回写到 assistant dict 顶层
+        # 按顺序把原始 AIMessage 的 reasoning_content 回写到 assistant dict 顶层。
+        # 只有最后一条 user 消息之后（本轮工具调用链）的 assistant 需要回传，
+        # 更早的已完成轮次不回传，避免历史思维链随每次请求重复上传
+        last_user_idx = max(
+            (i for i, m in enumerate(payload["messages"]) if m.get("role") == "user"),
+            default=-1,
+        )
         original_messages = self._convert_input(input_).to_messages()
         ai_iter = iter(m for m in original_messages if isinstance(m, AIMessage))
-        for msg_dict in payload["messages"]:
+        for i, msg_dict in enumerate(payload["messages"]):
             if msg_dict.get("role") != "assistant":
                 continue
             try:
                 original = next(ai_iter)
             except StopIteration:
                 break
+            if i < last_user_idx:
+                continue
             rc = original.additional_kwargs.get("reasoning_content") if original.additional_kwargs else None
             if rc:
                 msg_dict["reasoning_content"] = rc
         return payload
 
 
-def get_llm():
-    """Get LLM instance for standalone use (e.g., memory tidying)."""
+# 进程级共享：一个 HTTP 连接池 + 每个档位一个 LLM 实例（agent 与 /tidy 共用）
+_http_client = None
+_llm_instances = {}
+_hedge_executor = None
+
+# 模型级联档位：reasoning 使用 llm 基础配置，fast 在其上叠加 llm.cascade.fast
+TIERS = ("reasoning", "fast")
+
+_DEFAULT_COMPLEX_KEYWORDS = [
+    "代码", "分析", "方案", "报告", "总结", "计划", "为什么", "如何", "比较", "解释", "写",
+]
+
+
+def _get_http_client(llm_config: dict) -> httpx.Client:
+    """Get the process-wide HTTP client with a persistent keep-alive pool."""
+    global _http_client
+    if _http_client is None:
+        max_connections = llm_config.get("max_connections", 10)
+        _http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=llm_config.get("keepalive_expiry", 60),
+            ),
+        )
+    return _http_client
+
+
+def _tier_config(llm_config: dict, tier: str) -> dict:
+    """Resolve the effective llm config for a cascade tier."""
+    if tier not in TIERS:
+        raise ValueError(f"Unknown LLM tier: {tier!r}")
+    if tier == "reasoning":
+        return llm_config
+    overrides = (llm_config.get("cascade") or {}).get("fast") or {}
+    # fast 档默认关闭思考，基础配置的 thinking_type 不生效，只有 cascade.fast 可以覆盖
+    return {**llm_config, "thinking_type": "disabled", **overrides}
+
+
+def get_llm(tier: str = "reasoning"):
+    """Get the shared LLM instance for a tier (agent, memory tidying, ...).
+
+    Instances and their HTTP connection pool are created once per process.
+    Retries use the OpenAI client's built-in exponential backoff.
+
+    Args:
+        tier: "reasoning" (base llm config) or "fast" (llm.cascade.fast
+            overrides, thinking disabled unless overridden).
+    """
+    if tier in _llm_instances:
+        return _llm_instances[tier]
+
     config = load_config()
-    llm_config = config.get("llm", {})
+    base_config = config.get("llm", {})
+    llm_config = _tier_config(base_config, tier)
 
     api_key = llm_config.get("api_key")
     model = llm_config.get("model")
@@ -65,6 +327,10 @@ def get_llm():
     reasoning_effort = llm_config.get("reasoning_effort", "high")
     thinking_type = llm_config.get("thinking_type", "disabled")
 
+    cassette = get_cassette()
+    if not api_key and cassette is not None and cassette.mode == "replay":
+        # 回放模式不发请求，无需真实密钥
+        api_key = "replay"
     if not api_key:
         print("Warning: api_key not found in config.yaml.")
 
@@ -72,9 +338,76 @@ def get_llm():
         "model": model,
         "api_key": api_key,
         "base_url": base_url,
+        # 流式时也返回 usage，用于统计前缀缓存命中
+        "stream_usage": True,
         "extra_body": {"thinking": {"type": thinking_type}},
+        "http_client": _get_http_client(base_config),
+        "max_retries": llm_config.get("max_retries", 2),
+        "timeout": llm_config.get("timeout", 120),
     }
     if thinking_type != "disabled":
         kwargs["reasoning_effort"] = reasoning_effort
 
-    return ReasoningChatOpenAI(**kwargs)
+    _llm_instances[tier] = ReasoningChatOpenAI(**kwargs)
+    return _llm_instances[tier]
+
+
+def classify_turn(text: str, rules: dict = None) -> str:
+    """Classify a user turn locally into a cascade tier.
+
+    A turn escalates to "reasoning" if any rule matches: it is longer than
+    `max_simple_chars`, contains a code fence (`escalate_on_code`), asks more
+    than one question, or contains one of `complex_keywords`. Otherwise it is
+    served by the "fast" tier.
+    """
+    rules = rules or {}
+    text = text.strip()
+    if len(text) > rules.get("max_simple_chars", 40):
+        return "reasoning"
+    if rules.get("escalate_on_code", True) and "```" in text:
+        return "reasoning"
+    if text.count("?") + text.count("？") > 1:
+        return "reasoning"
+    keywords = rules.get("complex_keywords", _DEFAULT_COMPLEX_KEYWORDS)
+    if any(keyword in text for keyword in keywords):
+        return "reasoning"
+    return "fast"
+
+
+def invoke_with_hedge(llm, input_, hedge_after=None, **kwargs):
+    """Non-streaming invoke with an optional hedged second request.
+
+    If the first request has not finished after `hedge_after` seconds, an
+    identical second request is sent and whichever succeeds first wins. The
+    loser cannot be cancelled mid-flight; its result is simply discarded.
+    Only use this for short, idempotent calls (e.g. /tidy, summarization).
+
+    Args:
+        llm: The model to invoke.
+        input_: Model input.
+        hedge_after: Latency threshold in seconds. Defaults to
+            `llm.hedge_after` in config; 0 or None disables hedging.
+    """
+    global _hedge_executor
+    if hedge_after is None:
+        hedge_after = load_config().get("llm", {}).get("hedge_after", 0)
+    if not hedge_after:
+        return llm.invoke(input_, **kwargs)
+
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-hedge")
+
+    first = _hedge_executor.submit(llm.invoke, input_, **kwargs)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    second = _hedge_executor.submit(llm.invoke, input_, **kwargs)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    # 两个请求都失败，抛出首个请求的异常
+    return first.result()
@@ -0,0 +1,261 @@
+"""In-process latency and token metrics.
+
+Instrumented stages record into histograms (seconds) and counters (tokens,
+hits), aggregated per process and labelled, e.g.:
+
+    node_seconds{node}              graph node execution
+    tool_seconds{tool}              tool execution
+    llm_ttft_seconds{model}         time to first streamed token
+    llm_seconds{model}              LLM call duration
+    llm_tier_seconds{tier}          agent LLM call by cascade tier
+    llm_tokens_total{model,kind}    input / output / cached prompt tokens
+    retrieval_turns_total           turns run through speculative retrieval
+    retrieval_injected_total        ... that injected context
+    retrieval_saved_total           ... whose first LLM call skipped the search tools
+    embed_seconds{op}               embedding encode (query / documents)
+    faiss_search_seconds{index}     vector search
+    checkpoint_seconds{op}          checkpoint read / write
+    turn_seconds, turn_ttft_seconds whole turns (runtime)
+
+Disabled by default. When disabled, `timer()` returns a shared no-op context
+manager and `observe()` / `incr()` return after one flag check; stages whose
+instrumentation is installed at build time (graph nodes, tools, embeddings)
+are not wrapped at all.
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# 直方图桶上界（秒），与 Prometheus 默认桶相近，覆盖 1ms~2min
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = False
+_export_path = None
+_export_format = "prometheus"
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_NULL = nullcontext()
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max."""
+
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / n
+                return min(max(estimate, self.min), self.max)
+            seen += n
+        return self.max
+
+
+def configure(enabled: bool = False, export_path: str = None, export_format: str = "prometheus"):
+    """Enable or disable collection and set the optional export file."""
+    global _enabled, _export_path, _export_format
+    if export_format not in ("prometheus", "json"):
+        raise ValueError(f"Unknown metrics export_format: {export_format!r}")
+    _enabled = bool(enabled)
+    _export_path = export_path
+    _export_format = export_format
+
+
+def configure_from(config: dict):
+    """Configure from the `metrics` section of the app config."""
+    section = config.get("metrics") or {}
+    configure(
+        enabled=section.get("enabled", False),
+        export_path=section.get("export_path"),
+        export_format=section.get("export_format", "prometheus"),
+    )
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def observe(name: str, value: float, **labels):
+    """Record one sample (seconds) into histogram `name`."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def incr(name: str, value: float = 1, **labels):
+    """Add `value` to counter `name`."""
+    if not _enabled or not value:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def _timer(name: str, labels: dict):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timer(name: str, **labels):
+    """Context manager timing its block into histogram `name`."""
+    if not _enabled:
+        return _NULL
+    return _timer(name, labels)
+
+
+def instrument(name: str, func, **labels):
+    """Wrap `func` so each call is timed into histogram `name`."""
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe(name, time.perf_counter() - started, **labels)
+    timed.__name__ = getattr(func, "__name__", "timed")
+    timed.__doc__ = getattr(func, "__doc__", None)
+    return timed
+
+
+def reset():
+    """Drop all collected samples."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    """JSON-serializable copy of all metrics.
+
+    Returns:
+        {"histograms": [{name, labels, count, sum, mean, min, p50, p95, p99,
+        max, buckets}], "counters": [{name, labels, value}]}
+    """
+    with _lock:
+        histograms = [(key, h.count, h.sum, h.min, h.max, list(h.counts), h) for key, h in _histograms.items()]
+        counters = list(_counters.items())
+
+    result = {"enabled": _enabled, "histograms": [], "counters": []}
+    for (name, labels), count, total, minimum, maximum, counts, histogram in sorted(histograms, key=lambda item: item[0]):
+        result["histograms"].append({
+            "name": name,
+            "labels": dict(labels),
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "min": minimum if count else 0.0,
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+            "max": maximum,
+            "buckets": counts,
+        })
+    for (name, labels), value in sorted(counters, key=lambda item: item[0]):
+        result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+    return result
+
+
+def _format_labels(labels: dict, extra: dict = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    escaped = []
+    for k, v in items.items():
+        value = str(v).replace("\\", "\\\\").replace("\"", '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(data: dict = None) -> str:
+    """Render a snapshot in the Prometheus text exposition format."""
+    data = data or snapshot()
+    lines = []
+    typed = set()
+    for h in data["histograms"]:
+        name = f"agent_{h['name']}"
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), h["buckets"]):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(h['labels'], {'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_format_labels(h['labels'])} {h['count']}")
+    for c in data["counters"]:
+        name = f"agent_{c['name']}"
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(c['labels'])} {c['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path: str = None, export_format: str = None) -> str | None:
+    """Write the metrics to `path` (default: configured export_path) atomically.
+
+    The format defaults to JSON for `*.json` paths, else the configured one.
+
+    Returns:
+        The path written, or None if no path is configured.
+    """
+    # tools 包导入时依赖本模块，在此延迟导入
+    from tools.storage import atomic_write_text
+
+    path = path or _export_path
+    if not path:
+        return None
+    if export_format is None:
+        export_format = "json" if path.endswith(".json") else _export_format
+    data = snapshot()
+    text = render_prometheus(data) if export_format == "prometheus" else json.dumps(data, ensure_ascii=False, indent=2)
+    atomic_write_text(path, text)
+    return path
+
+
+def maybe_export():
+    """Export after a turn when collection and an export file are configured."""
+    if _enabled and _export_path:
+        try:
+            export()
+        except OSError:
+            pass
@@ -0,0 +1,27 @@
+"""Checkpoint persistence: SQLite setup, compressed message storage, session index and background maintenance."""
+
+from persistence.maintenance import (
+    CheckpointMaintenance,
+    open_checkpoint_connection,
+    prune_sessions,
+    compact_threads,
+    collect_message_blobs,
+    maybe_vacuum,
+    convert_to_incremental,
+)
+from persistence.pool import ConnectionPool
+from persistence.saver import AgentSqliteSaver
+from persistence.sessions import list_sessions
+
+__all__ = [
+    "CheckpointMaintenance",
+    "open_checkpoint_connection",
+    "prune_sessions",
+    "compact_threads",
+    "collect_message_blobs",
+    "maybe_vacuum",
+    "convert_to_incremental",
+    "ConnectionPool",
+    "AgentSqliteSaver",
+    "list_sessions",
+]
@@ -0,0 +1,251 @@
+"""Incremental, off-the-hot-path maintenance of the checkpoint database.
+
+Startup only opens the database (WAL mode, incremental auto-vacuum). Session
+retention, per-thread history compaction, message blob collection and space
+reclamation run in a background thread on their own
+connection, so time-to-prompt no longer depends on the size of
+`checkpoints.db`. The one exception is the one-off full VACUUM converting a
+bloated legacy database to incremental auto-vacuum: it takes an exclusive
+lock, so it runs at startup before the graph is used, never in the
+background.
+"""
+
+import logging
+import sqlite3
+import threading
+
+from persistence.sessions import backfill_sessions, delete_orphan_sessions
+
+logger = logging.getLogger(__name__)
+
+# 每批删除的会话数，避免长时间持有写锁
+_DELETE_BATCH = 20
+
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def open_checkpoint_connection(db_path: str) -> sqlite3.Connection:
+    """Open the checkpoint database for the agent's SqliteSaver.
+
+    WAL lets the maintenance thread prune while the agent reads and writes.
+    auto_vacuum=INCREMENTAL only takes effect on a fresh database; existing
+    ones are converted by `convert_to_incremental` at startup.
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+def prune_sessions(conn: sqlite3.Connection, max_sessions: int) -> int:
+    """Delete checkpoints and writes of all but the newest `max_sessions` threads.
+
+    Returns:
+        Number of threads pruned.
+    """
+    rows = conn.execute("""
+        SELECT thread_id
+        FROM checkpoints
+        GROUP BY thread_id
+        ORDER BY MAX(rowid) DESC
+    """).fetchall()
+    stale = [thread_id for (thread_id,) in rows[max_sessions:]]
+
+    for start in range(0, len(stale), _DELETE_BATCH):
+        batch = stale[start:start + _DELETE_BATCH]
+        placeholders = ",".join("?" * len(batch))
+        conn.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({placeholders})", batch)
+        conn.execute(f"DELETE FROM writes WHERE thread_id IN ({placeholders})", batch)
+        conn.commit()
+
+    # 清理没有对应 checkpoint 的孤立 writes 与会话索引
+    conn.execute("""
+        DELETE FROM writes
+        WHERE thread_id NOT IN (SELECT DISTINCT thread_id FROM checkpoints)
+    """)
+    conn.commit()
+    delete_orphan_sessions(conn)
+    return len(stale)
+
+
+def compact_threads(conn: sqlite3.Connection, keep_last: int) -> int:
+    """Collapse each thread's history to its latest checkpoint plus `keep_last` more.
+
+    Every super-step writes a full checkpoint, so older intermediate steps
+    are near-duplicates. The latest checkpoint (and its pending writes) is
+    always kept, so resuming and interrupted approvals keep working.
+    Checkpoint ids are time-ordered (uuid6), so ordering by id is ordering
+    by time.
+
+    Returns:
+        Number of checkpoints deleted.
+    """
+    keep = keep_last + 1
+    threads = conn.execute("""
+        SELECT thread_id, checkpoint_ns
+        FROM checkpoints
+        GROUP BY thread_id, checkpoint_ns
+        HAVING COUNT(*) > ?
+    """, (keep,)).fetchall()
+
+    deleted = 0
+    for thread_id, checkpoint_ns in threads:
+        row = conn.execute("""
+            SELECT checkpoint_id FROM checkpoints
+            WHERE thread_id = ? AND checkpoint_ns = ?
+            ORDER BY checkpoint_id DESC
+            LIMIT 1 OFFSET ?
+        """, (thread_id, checkpoint_ns, keep)).fetchone()
+        if row is None:
+            continue
+        cutoff = row[0]
+        cur = conn.execute("""
+            DELETE FROM checkpoints
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ?
+        """, (thread_id, checkpoint_ns, cutoff))
+        deleted += cur.rowcount
+        conn.execute("""
+            DELETE FROM writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ?
+        """, (thread_id, checkpoint_ns, cutoff))
+        conn.commit()
+    return deleted
+
+
+def collect_message_blobs(conn: sqlite3.Connection) -> int:
+    """Delete message blobs no longer referenced by any remaining thread.
+
+    Blobs are content-addressed and shared across a thread's checkpoints, so
+    they are collected per thread: refs of threads without checkpoints are
+    dropped first, then blobs without refs. Blobs of a compacted but still
+    existing thread are kept; they are small and shared with its latest
+    checkpoint.
+
+    Returns:
+        Number of blobs deleted.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_blobs'"
+    ).fetchone()
+    if not exists:
+        return 0
+    conn.execute("""
+        DELETE FROM message_refs
+        WHERE thread_id NOT IN (SELECT DISTINCT thread_id FROM checkpoints)
+    """)
+    cur = conn.execute("""
+        DELETE FROM message_blobs
+        WHERE hash NOT IN (SELECT hash FROM message_refs)
+    """)
+    conn.commit()
+    return cur.rowcount
+
+
+def _over_threshold(conn: sqlite3.Connection, threshold: float) -> bool:
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return bool(page_count) and freelist_count / page_count >= threshold
+
+
+def convert_to_incremental(conn: sqlite3.Connection, threshold: float) -> bool:
+    """Convert a legacy database to incremental auto-vacuum with a full VACUUM.
+
+    Only runs when the free-page ratio exceeds `threshold`. VACUUM rewrites the
+    whole file under an exclusive lock, so call this at startup before the
+    graph uses the connection.
+
+    Returns:
+        True if the database was converted.
+    """
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if auto_vacuum == _AUTO_VACUUM_INCREMENTAL or not _over_threshold(conn, threshold):
+        return False
+    logger.warning("Converting the checkpoint database to incremental auto-vacuum with a one-off VACUUM")
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def maybe_vacuum(conn: sqlite3.Connection, threshold: float) -> bool:
+    """Reclaim free pages once the free-page ratio exceeds `threshold`.
+
+    Only databases in incremental auto-vacuum mode are vacuumed here; legacy
+    databases are left to `convert_to_incremental` at the next startup.
+
+    Returns:
+        True if space was reclaimed.
+    """
+    if not _over_threshold(conn, threshold):
+        return False
+
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if auto_vacuum != _AUTO_VACUUM_INCREMENTAL:
+        # 全量 VACUUM 会持有排他锁，不能在对话进行时于后台执行
+        logger.info("Skipping VACUUM of legacy checkpoint database; it is converted at the next startup")
+        return False
+    # incremental_vacuum 每执行一步只释放一页，executescript 会执行到底
+    conn.commit()
+    conn.executescript("PRAGMA incremental_vacuum;")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    return True
+
+
+class CheckpointMaintenance(threading.Thread):
+    """Background thread running retention and vacuum passes.
+
+    Args:
+        db_path: Checkpoint database path.
+        max_sessions: Number of most recent threads to keep (0 disables pruning).
+        keep_per_thread: Checkpoints kept per thread besides the latest one
+            (None disables compaction).
+        saver: Optional AgentSqliteSaver; threads missing from its session
+            index are backfilled on the first pass.
+        interval: Seconds between passes; 0 runs a single pass.
+        vacuum_threshold: Free-page ratio that triggers space reclamation.
+    """
+
+    def __init__(self, db_path: str, max_sessions: int = 10, interval: float = 1800,
+                 vacuum_threshold: float = 0.25, keep_per_thread: int = None, saver=None):
+        super().__init__(name="checkpoint-maintenance", daemon=True)
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.interval = interval
+        self.vacuum_threshold = vacuum_threshold
+        self.keep_per_thread = keep_per_thread
+        self.saver = saver
+        self._backfilled = False
+        self._stop_event = threading.Event()
+
+    def run_once(self):
+        """Run one maintenance pass on a dedicated connection."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            if self.max_sessions and self.max_sessions > 0:
+                prune_sessions(conn, self.max_sessions)
+            if self.keep_per_thread is not None and self.keep_per_thread >= 0:
+                compact_threads(conn, self.keep_per_thread)
+            collect_message_blobs(conn)
+            maybe_vacuum(conn, self.vacuum_threshold)
+        finally:
+            conn.close()
+
+        if self.saver is not None and not self._backfilled:
+            backfill_sessions(self.saver)
+            self._backfilled = True
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except sqlite3.Error:
+                # 维护失败不影响对话，下个周期重试
+                pass
+            if not self.interval:
+                return
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
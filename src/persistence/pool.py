@@ -0,0 +1,69 @@
+"""Small pool of extra SQLite connections to the checkpoint database.
+
+The SqliteSaver serializes everything on its one connection and lock. With
+WAL, readers on their own connections do not block the writer or each
+other, so servers answer session listings and similar read-only queries
+from this pool while turns are checkpointing.
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+
+from persistence.maintenance import open_checkpoint_connection
+
+
+class ConnectionPool:
+    """Fixed-size pool of connections, opened lazily.
+
+    Args:
+        db_path: Path of the checkpoint database.
+        size: Maximum number of open connections.
+        timeout: Seconds to wait for a free connection before raising.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 10.0):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return open_checkpoint_connection(self.db_path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no free database connection after {self.timeout}s") from None
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the `with` block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close the idle connections."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
@@ -0,0 +1,259 @@
+"""SqliteSaver extension used by the agent."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+import metrics
+import tracing
+from persistence.serde import DEFAULT_CODEC, CompressedSerializer, compress, decompress
+from persistence.sessions import SESSIONS_SCHEMA, upsert_session
+
+MESSAGE_BLOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_blobs (
+    hash TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS message_refs (
+    thread_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (thread_id, hash)
+);
+"""
+
+# checkpoint 中代替消息本体的引用键
+MESSAGE_REF_KEY = "__msgref__"
+
+# 已计算哈希 / 已加载消息的缓存条数
+_CACHE_SIZE = 4096
+
+
+class AgentSqliteSaver(SqliteSaver):
+    """SqliteSaver with compressed, content-addressed message storage.
+
+    - Every checkpoint write upserts the thread's row in `sessions`, so
+      /resume can list sessions without deserializing any checkpoint.
+    - The `messages` channel is stored as a list of hash references; each
+      message is serialized, compressed and written to `message_blobs` once.
+      A step therefore writes only its new messages instead of the whole
+      history again.
+    - Everything else in the checkpoint goes through CompressedSerializer.
+
+    Checkpoints written before this format (inline messages, uncompressed)
+    still load unchanged.
+    """
+
+    def __init__(self, conn, *, serde=None):
+        super().__init__(conn, serde=serde or CompressedSerializer())
+        # 消息本体使用未压缩的内层序列化器，压缩在写 blob 时单独进行
+        self._message_serde = getattr(self.serde, "inner", self.serde)
+        self._cache_lock = threading.Lock()
+        # id(message) -> (message, hash)：同一消息对象在后续 step 中无需重复序列化
+        self._hash_cache = OrderedDict()
+        # hash -> message：已加载的消息，供 get_tuple/list 复用
+        self._message_cache = OrderedDict()
+        # 当前线程进行中的 checkpoint 写事务（见 _transaction）
+        self._tx = threading.local()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        tx_cursor = getattr(self._tx, "cursor", None)
+        if tx_cursor is not None:
+            # 已在 _transaction 中（父类 put 等），复用其游标，由外层统一提交
+            yield tx_cursor
+            return
+        with super().cursor(transaction) as cur:
+            yield cur
+
+    @contextmanager
+    def _transaction(self):
+        """Run a whole checkpoint write in one transaction.
+
+        cursor() calls made inside (including SqliteSaver.put) join it, so
+        blobs, refs, the checkpoint row and the session row commit together
+        or not at all.
+        """
+        with self.lock:
+            self.setup()
+            cur = self.conn.cursor()
+            self._tx.cursor = cur
+            try:
+                yield cur
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self._tx.cursor = None
+                cur.close()
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        # setup() 在 cursor() 持锁期间被调用，这里直接使用连接
+        self.conn.executescript(SESSIONS_SCHEMA)
+        self.conn.executescript(MESSAGE_BLOBS_SCHEMA)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with metrics.timer("checkpoint_seconds", op="put"), tracing.span("checkpoint", op="put") as span:
+            return self._put(config, checkpoint, metadata, new_versions, span)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with metrics.timer("checkpoint_seconds", op="put_writes"):
+            super().put_writes(config, writes, task_id, task_path)
+
+    def _put(self, config, checkpoint, metadata, new_versions, span=None):
+        thread_id = str(config["configurable"]["thread_id"])
+        channel_values = checkpoint.get("channel_values", {})
+        messages = channel_values.get("messages")
+
+        stored = checkpoint
+        new_blobs = []
+        if isinstance(messages, list) and messages:
+            refs, new_blobs = self._to_refs(messages)
+            stored = {**checkpoint, "channel_values": {**channel_values, "messages": refs}}
+        if span is not None:
+            span["new_messages"] = len(new_blobs)
+            span["blob_bytes"] = sum(len(blob[3]) for blob in new_blobs)
+
+        # blob、引用与 checkpoint 在同一事务中提交：后台 GC 不会看到
+        # "有引用但没有 checkpoint" 的中间状态而回收刚写入的 blob
+        try:
+            with self._transaction() as cur:
+                if new_blobs:
+                    cur.executemany(
+                        "INSERT OR IGNORE INTO message_blobs (hash, type, codec, data) VALUES (?, ?, ?, ?)",
+                        new_blobs,
+                    )
+                    cur.executemany(
+                        "INSERT OR IGNORE INTO message_refs (thread_id, hash) VALUES (?, ?)",
+                        [(thread_id, blob[0]) for blob in new_blobs],
+                    )
+                next_config = super().put(config, stored, metadata, new_versions)
+                if messages:
+                    upsert_session(cur, thread_id, messages)
+        except BaseException:
+            # 事务已回滚，这些消息下次需要重新写入 blob
+            self._forget({blob[0] for blob in new_blobs})
+            raise
+        return next_config
+
+    def get_tuple(self, config):
+        with metrics.timer("checkpoint_seconds", op="get_tuple"):
+            checkpoint_tuple = super().get_tuple(config)
+            return self._resolve(checkpoint_tuple) if checkpoint_tuple else checkpoint_tuple
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # 父类生成器在迭代期间持有 self.lock（不可重入），_resolve 查询 blob 需要再次加锁，
+        # 因此先取完全部 checkpoint 再解析
+        checkpoint_tuples = list(super().list(config, filter=filter, before=before, limit=limit))
+        for checkpoint_tuple in checkpoint_tuples:
+            yield self._resolve(checkpoint_tuple)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM message_refs WHERE thread_id = ?", (str(thread_id),))
+
+    def _to_refs(self, messages: list) -> tuple:
+        """Replace messages by hash references.
+
+        Returns:
+            (refs, new_blobs) where new_blobs are (hash, type, codec, data)
+            rows for messages not seen by this saver yet.
+        """
+        refs = []
+        new_blobs = []
+        with self._cache_lock:
+            for msg in messages:
+                cached = self._hash_cache.get(id(msg))
+                if cached is not None and cached[0] is msg:
+                    self._hash_cache.move_to_end(id(msg))
+                    refs.append({MESSAGE_REF_KEY: cached[1]})
+                    continue
+
+                type_, data = self._message_serde.dumps_typed(msg)
+                digest = hashlib.sha256(type_.encode() + b"\0" + data).hexdigest()
+                new_blobs.append((digest, type_, DEFAULT_CODEC, compress(data)))
+                self._remember(msg, digest)
+                refs.append({MESSAGE_REF_KEY: digest})
+        return refs, new_blobs
+
+    def _forget(self, digests: set) -> None:
+        """Drop cached msg -> hash entries for blobs that were not written."""
+        if not digests:
+            return
+        with self._cache_lock:
+            for key in [k for k, (_, digest) in self._hash_cache.items() if digest in digests]:
+                del self._hash_cache[key]
+
+    def _remember(self, msg, digest: str) -> None:
+        """Cache both directions of msg <-> hash (caller holds _cache_lock)."""
+        self._hash_cache[id(msg)] = (msg, digest)
+        self._hash_cache.move_to_end(id(msg))
+        self._message_cache[digest] = msg
+        self._message_cache.move_to_end(digest)
+        while len(self._hash_cache) > _CACHE_SIZE:
+            self._hash_cache.popitem(last=False)
+        while len(self._message_cache) > _CACHE_SIZE:
+            self._message_cache.popitem(last=False)
+
+    def _resolve(self, checkpoint_tuple):
+        """Swap hash references in a loaded checkpoint back to messages."""
+        channel_values = checkpoint_tuple.checkpoint.get("channel_values", {})
+        refs = channel_values.get("messages")
+        if not isinstance(refs, list) or not any(
+            isinstance(ref, dict) and MESSAGE_REF_KEY in ref for ref in refs
+        ):
+            return checkpoint_tuple
+
+        with self._cache_lock:
+            loaded = {}
+            for ref in refs:
+                if isinstance(ref, dict) and MESSAGE_REF_KEY in ref:
+                    digest = ref[MESSAGE_REF_KEY]
+                    if digest in self._message_cache:
+                        loaded[digest] = self._message_cache[digest]
+                        self._remember(loaded[digest], digest)
+        missing = list({
+            ref[MESSAGE_REF_KEY] for ref in refs
+            if isinstance(ref, dict) and MESSAGE_REF_KEY in ref and ref[MESSAGE_REF_KEY] not in loaded
+        })
+
+        if missing:
+            rows = []
+            with self.cursor(transaction=False) as cur:
+                # 分批查询，避免超过 SQLite 参数个数上限
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows += cur.execute(
+                        f"SELECT hash, type, codec, data FROM message_blobs WHERE hash IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+            with self._cache_lock:
+                for digest, type_, codec, data in rows:
+                    msg = self._message_serde.loads_typed((type_, decompress(data, codec)))
+                    loaded[digest] = msg
+                    self._remember(msg, digest)
+
+        messages = []
+        for ref in refs:
+            if isinstance(ref, dict) and MESSAGE_REF_KEY in ref:
+                if ref[MESSAGE_REF_KEY] not in loaded:
+                    raise KeyError(f"Message blob {ref[MESSAGE_REF_KEY]} missing from checkpoint database")
+                messages.append(loaded[ref[MESSAGE_REF_KEY]])
+            else:
+                messages.append(ref)
+
+        checkpoint = {
+            **checkpoint_tuple.checkpoint,
+            "channel_values": {**channel_values, "messages": messages},
+        }
+        return checkpoint_tuple._replace(checkpoint=checkpoint)
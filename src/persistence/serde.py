@@ -0,0 +1,71 @@
+"""Compressed checkpoint serialization.
+
+Serialized payloads above a small size are compressed with zstd when the
+optional `zstandard` package is installed, zlib otherwise. The codec is
+recorded as a suffix of the serialization type (e.g. "msgpack+zlib"), so
+rows written before compression was enabled still load unchanged.
+"""
+
+import zlib
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，缺失时退回 zlib
+    zstandard = None
+
+# 小于该字节数的数据不压缩
+MIN_COMPRESS_SIZE = 256
+
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Checkpoint data is zstd-compressed but `zstandard` is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+class CompressedSerializer:
+    """Serializer wrapper that compresses the inner serializer's output.
+
+    Args:
+        inner: Serializer implementing dumps_typed/loads_typed. Defaults to
+            LangGraph's JsonPlusSerializer.
+        codec: "zstd" or "zlib".
+    """
+
+    def __init__(self, inner=None, codec: str = DEFAULT_CODEC):
+        self.inner = inner or JsonPlusSerializer()
+        self.codec = codec
+
+    def dumps_typed(self, obj) -> tuple:
+        type_, data = self.inner.dumps_typed(obj)
+        if type_ in ("null", "empty") or data is None or len(data) < MIN_COMPRESS_SIZE:
+            return type_, data
+        return f"{type_}+{self.codec}", compress(data, self.codec)
+
+    def loads_typed(self, data: tuple):
+        type_, payload = data
+        if "+" in type_:
+            type_, codec = type_.rsplit("+", 1)
+            payload = decompress(payload, codec)
+        return self.inner.loads_typed((type_, payload))
+
+    # 兼容仍调用非 typed 接口的旧版本 checkpointer
+    def dumps(self, obj) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes):
+        return self.inner.loads(data)
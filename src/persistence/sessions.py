@@ -0,0 +1,108 @@
+"""Materialized session index for /resume.
+
+One small row per thread (created/updated timestamps, first-message summary,
+message count), upserted by the checkpointer as checkpoints are written.
+Listing sessions is then a single indexed query instead of deserializing
+every thread's full message history.
+"""
+
+import time
+from datetime import datetime
+
+SESSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    thread_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at DESC);
+"""
+
+SUMMARY_LEN = 50
+
+
+def summarize_messages(messages) -> str:
+    """Summary of a thread: its first user message, truncated."""
+    for msg in messages:
+        if getattr(msg, "type", None) == "human":
+            content = str(msg.content)
+            summary = content[:SUMMARY_LEN].replace("\n", " ")
+            return summary + ("..." if len(content) > SUMMARY_LEN else "")
+    return ""
+
+
+def upsert_session(cur, thread_id: str, messages) -> None:
+    """Insert or refresh the index row of `thread_id`."""
+    now = time.time()
+    cur.execute("""
+        INSERT INTO sessions (thread_id, created_at, updated_at, summary, message_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(thread_id) DO UPDATE SET
+            updated_at = excluded.updated_at,
+            message_count = excluded.message_count,
+            summary = CASE WHEN sessions.summary = '' THEN excluded.summary ELSE sessions.summary END
+    """, (thread_id, now, now, summarize_messages(messages), len(messages)))
+
+
+def list_sessions(conn, limit: int = 20) -> list:
+    """Return the most recently updated sessions.
+
+    Returns:
+        List of (thread_id, summary, updated_at, message_count) tuples.
+    """
+    return conn.execute("""
+        SELECT thread_id, summary, updated_at, message_count
+        FROM sessions
+        ORDER BY updated_at DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def delete_orphan_sessions(conn) -> None:
+    """Drop index rows of threads that no longer have checkpoints."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+    ).fetchone()
+    if exists:
+        conn.execute("""
+            DELETE FROM sessions
+            WHERE thread_id NOT IN (SELECT DISTINCT thread_id FROM checkpoints)
+        """)
+        conn.commit()
+
+
+def backfill_sessions(saver) -> int:
+    """Index threads written before the session index existed.
+
+    Deserializes the latest checkpoint of each missing thread once; meant to
+    run in the background maintenance thread.
+
+    Returns:
+        Number of threads indexed.
+    """
+    with saver.cursor(transaction=False) as cur:
+        missing = cur.execute("""
+            SELECT thread_id, MAX(rowid)
+            FROM checkpoints
+            WHERE thread_id NOT IN (SELECT thread_id FROM sessions)
+            GROUP BY thread_id
+        """).fetchall()
+
+    for thread_id, _ in missing:
+        checkpoint_tuple = saver.get_tuple({"configurable": {"thread_id": thread_id}})
+        if checkpoint_tuple is None:
+            continue
+        messages = checkpoint_tuple.checkpoint.get("channel_values", {}).get("messages", [])
+        with saver.cursor() as cur:
+            upsert_session(cur, thread_id, messages)
+            # 以 checkpoint 的时间作为更新时间，保持会话原有顺序
+            ts = checkpoint_tuple.checkpoint.get("ts")
+            if ts:
+                timestamp = datetime.fromisoformat(ts).timestamp()
+                cur.execute(
+                    "UPDATE sessions SET created_at = ?, updated_at = ? WHERE thread_id = ?",
+                    (timestamp, timestamp, thread_id),
+                )
+    return len(missing)
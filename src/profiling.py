@@ -0,0 +1,218 @@
+"""Opt-in profiling of individual CLI turns.
+
+`/profile on [N]` (or `profile.enabled` in the config) arms a TurnProfiler
+for the next N turns. Each profiled turn writes one file to `data/profiles/`
+named after the thread and its turn number, and a one-line summary of the
+hottest functions is printed after the turn. Time spent waiting on the user
+(approval prompts) is excluded via `TurnProfiler.paused()`.
+
+Modes:
+
+- "sample" (default): a background thread samples the Python stacks of all
+  threads every `interval` seconds. Graph nodes, tools and the LLM client
+  run in LangGraph's worker threads, so this is the mode that attributes a
+  slow turn to rendering, checkpoint serialization, tool code or waiting on
+  the LLM. Idle waits (pool workers waiting for work, locks) are dropped.
+  Output: collapsed stacks (`.folded`, one `frame;frame;... count` per
+  line), readable by flamegraph.pl and speedscope.
+- "cprofile": deterministic cProfile of the thread rendering the turn
+  (Rich rendering, event handling, the daemon socket). Work in worker
+  threads shows up as time waiting for events. Output: `.prof`, readable
+  with pstats or snakeviz.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+MODES = ("sample", "cprofile")
+
+# 叶子帧为这些函数时视为空闲等待（线程池等任务、锁等待），不计入热点
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class StackSampler:
+    """Samples the stacks of all threads from a background thread.
+
+    Args:
+        interval: Seconds between samples.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._paused = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self._paused.is_set():
+                continue
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                leaf = tuple(stack[0].split(":", 1))
+                if leaf in _IDLE_LEAVES:
+                    continue
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, n: int = 5) -> list:
+        """Hottest functions by own (leaf) samples, as (name, share) pairs."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values())
+        return [(name, count / total) for name, count in leaves.most_common(n)] if total else []
+
+
+class _CProfiler:
+    """cProfile of the calling thread with the same interface as StackSampler."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def pause(self):
+        self.profile.disable()
+
+    def resume(self):
+        self.profile.enable()
+
+    def write(self, path: str):
+        self.profile.dump_stats(path)
+
+    def top(self, n: int = 5) -> list:
+        stats = pstats.Stats(self.profile)
+        if not stats.total_tt:
+            return []
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:n]
+        return [
+            # 内置函数的文件名为 "~"
+            (name if filename == "~" else f"{os.path.basename(filename)}:{name}", tottime / stats.total_tt)
+            for (filename, _line, name), (_cc, _nc, tottime, _ct, _callers) in rows
+        ]
+
+
+class TurnProfiler:
+    """Profiles the next N turns and writes one file per turn.
+
+    Args:
+        mode: "sample" or "cprofile".
+        interval: Sampling interval in seconds ("sample" mode).
+        output_dir: Directory for the profile files.
+    """
+
+    def __init__(self, mode: str = "sample", interval: float = 0.005, output_dir: str = os.path.join("data", "profiles")):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode!r}")
+        self.mode = mode
+        self.interval = interval
+        self.output_dir = output_dir
+        self.remaining = 0
+        self._active = None
+        self._paused_s = 0.0
+
+    def arm(self, turns: int):
+        """Profile the next `turns` turns (0 disarms)."""
+        self.remaining = max(0, turns)
+
+    @contextmanager
+    def paused(self):
+        """Exclude the block (e.g. waiting for user input) from the running profile."""
+        profiler = self._active
+        if profiler is None:
+            yield
+            return
+        profiler.pause()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._paused_s += time.perf_counter() - started
+            profiler.resume()
+
+    def run(self, func, thread_id: str, turn: int, *args, **kwargs):
+        """Call `func(*args, **kwargs)`, profiling it if the profiler is armed.
+
+        Args:
+            func: The turn to run.
+            thread_id: Conversation thread id, used in the file name.
+            turn: The thread's turn number, used in the file name.
+
+        Returns:
+            (result of func, None) when not profiled, else (result of func,
+            (profile path, elapsed seconds excluding pauses, top functions)).
+        """
+        if not self.remaining:
+            return func(*args, **kwargs), None
+        self.remaining -= 1
+
+        profiler = StackSampler(self.interval) if self.mode == "sample" else _CProfiler()
+        self._active = profiler
+        self._paused_s = 0.0
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            self._active = None
+        elapsed = time.perf_counter() - started - self._paused_s
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        suffix = ".folded" if self.mode == "sample" else ".prof"
+        path = os.path.join(self.output_dir, f"{thread_id}_turn{turn}_{stamp}{suffix}")
+        profiler.write(path)
+        return result, (path, elapsed, profiler.top())
+
+
+def format_top(top: list) -> str:
+    """One-line summary of (function, share) pairs."""
+    return " | ".join(f"{name} {share:.0%}" for name, share in top) or "无样本"
@@ -0,0 +1,157 @@
+"""Record/replay of LLM and network calls for deterministic benchmarks.
+
+In record mode every LLM request/response (including streamed chunks and
+reasoning_content) and every recorded network helper call (web search,
+IP location, weather) is collected in memory and written to a local cassette
+file once, when the process exits (or on `Cassette.close()`). In replay mode
+they are served back from the cassette — at full speed or with the recorded
+timing — so the graph, CLI and retrieval layers can be benchmarked offline
+with no API key or network.
+
+Requests are matched by a hash of the canonicalized request first; if the
+exact request was not recorded (e.g. a prompt contains the current time), the
+next unconsumed interaction of the same kind is served in recorded order.
+"""
+
+import atexit
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+MODES = ("off", "record", "replay")
+TIMINGS = ("fast", "recorded")
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recorded interaction is left."""
+
+
+def _request_key(kind: str, request) -> str:
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}:{hashlib.sha1(canonical.encode()).hexdigest()}"
+
+
+class Cassette:
+    """A JSON file of recorded interactions.
+
+    Args:
+        path: Cassette file path.
+        mode: "record" or "replay".
+        timing: "fast" serves replays immediately, "recorded" reproduces the
+            recorded latencies.
+    """
+
+    def __init__(self, path: str, mode: str, timing: str = "fast"):
+        if mode not in MODES or mode == "off":
+            raise ValueError(f"Invalid cassette mode: {mode!r}")
+        if timing not in TIMINGS:
+            raise ValueError(f"Invalid replay timing: {timing!r}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._interactions = []
+        self._consumed = set()
+        self._dirty = False
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                self._interactions = json.load(f).get("interactions", [])
+
+    def record(self, kind: str, request, response, duration: float):
+        """Append an interaction; it is written to the file by `close()`."""
+        with self._lock:
+            self._interactions.append({
+                "kind": kind,
+                "key": _request_key(kind, request),
+                "response": response,
+                "duration": duration,
+            })
+            self._dirty = True
+
+    def replay(self, kind: str, request) -> dict:
+        """Pop the recorded interaction for `request` (exact match, then in order)."""
+        key = _request_key(kind, request)
+        with self._lock:
+            candidates = [
+                i for i, item in enumerate(self._interactions)
+                if item["kind"] == kind and i not in self._consumed
+            ]
+            if not candidates:
+                raise CassetteMiss(f"No recorded {kind} interaction left in {self.path}")
+            index = next((i for i in candidates if self._interactions[i]["key"] == key), candidates[0])
+            self._consumed.add(index)
+            return self._interactions[index]
+
+    def wait_until(self, started: float, offset: float):
+        """Sleep until `offset` seconds after `started` when replaying recorded timing."""
+        if self.timing == "recorded":
+            remaining = started + offset - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def close(self):
+        """Write the recorded interactions to the cassette file (no-op when nothing new was recorded)."""
+        # tools 包导入时依赖本模块（recorded），在此延迟导入
+        from tools.storage import atomic_write_json
+
+        with self._lock:
+            if not self._dirty:
+                return
+            atomic_write_json(
+                self.path, {"version": 1, "interactions": self._interactions}, ensure_ascii=False, default=str,
+            )
+            self._dirty = False
+
+
+_cassette = None
+_cassette_loaded = False
+
+
+def get_cassette():
+    """Return the configured cassette, or None when record/replay is off."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        from core import load_config
+        from tools.base import BASE_DIR
+
+        replay_config = load_config().get("replay") or {}
+        mode = replay_config.get("mode", "off")
+        if mode != "off":
+            path = replay_config.get("cassette", os.path.join("data", "cassettes", "default.json"))
+            if not os.path.isabs(path):
+                path = os.path.join(BASE_DIR, path)
+            _cassette = Cassette(path, mode, replay_config.get("timing", "fast"))
+            if mode == "record":
+                # 录制期间只在内存中追加，进程退出时一次写入
+                atexit.register(_cassette.close)
+        _cassette_loaded = True
+    return _cassette
+
+
+def recorded(kind: str):
+    """Decorator recording/replaying a JSON-serializable function call."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cassette = get_cassette()
+            if cassette is None:
+                return func(*args, **kwargs)
+
+            request = {"args": list(args), "kwargs": kwargs}
+            if cassette.mode == "replay":
+                interaction = cassette.replay(kind, request)
+                cassette.wait_until(time.perf_counter(), interaction["duration"])
+                return interaction["response"]
+
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            cassette.record(kind, request, result, time.perf_counter() - started)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,299 @@
+"""UI-agnostic execution of agent turns.
+
+AgentRuntime drives the compiled graph and reports progress as plain,
+JSON-serializable event dicts, so the CLI, the daemon and other frontends
+share one implementation of streaming, approval interrupts and resuming.
+
+Events:
+    {"type": "reasoning", "text": str}          reasoning_content delta
+    {"type": "token", "text": str}              answer delta
+    {"type": "cached", "text": str}             answer served by the semantic cache
+    {"type": "tool_call", "id", "name", "args"} tool about to run
+    {"type": "tool_result", "id", "name", "content"}
+    {"type": "usage", "hit", "miss", "input", "output"}
+                                                prefix-cache hits/misses and token counts
+    {"type": "approval", "tool_calls": list}    turn paused, resume with apply_approvals
+    {"type": "done", "content": str}            turn finished with its final answer
+
+Heavy dependencies are imported inside the methods, so importing this module
+stays cheap for thin clients.
+"""
+
+import threading
+import time
+
+import metrics
+import tracing
+
+
+def normalize_llm_content(content) -> str:
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        text_parts = []
+        for item in content:
+            if isinstance(item, dict) and item.get("type") == "text":
+                text_parts.append(item.get("text", ""))
+            elif isinstance(item, str):
+                text_parts.append(item)
+        return "".join(text_parts)
+    return str(content)
+
+
+REJECTION_MESSAGES = {
+    "add_note": "用户拒绝保存这条笔记",
+}
+
+
+def _execute_approved_tool(name: str, args: dict) -> str:
+    """Run an approved tool call outside the graph."""
+    if name == "add_note":
+        from tools import _add_note
+        with metrics.timer("tool_seconds", tool=name), tracing.span("tool", tool=name, approved=True) as span:
+            result = _add_note(args.get("title", ""), args.get("content", ""), args.get("tags", ""))
+            if span is not None:
+                span["result_chars"] = len(result)
+            return result
+    raise ValueError(f"No approval handler for tool: {name}")
+
+
+class AgentRuntime:
+    """In-process agent runtime.
+
+    Args:
+        agent: Compiled agent graph.
+        checkpointer: Its checkpointer (used for the session list).
+        memoize_tools: Memoize tool results when running tools outside the
+            graph (approval flow), like the graph's own tool node.
+        read_pool: Optional persistence.ConnectionPool; read-only queries
+            use it instead of waiting for the checkpointer's connection.
+    """
+
+    def __init__(self, agent, checkpointer, memoize_tools: bool = False, read_pool=None):
+        self.agent = agent
+        self.checkpointer = checkpointer
+        self.memoize_tools = memoize_tools
+        self.read_pool = read_pool
+        self._locks_guard = threading.Lock()
+        self._thread_locks = {}
+
+    def thread_lock(self, thread_id: str) -> threading.Lock:
+        """Lock serializing turns of one conversation thread."""
+        with self._locks_guard:
+            return self._thread_locks.setdefault(thread_id, threading.Lock())
+
+    def stream_turn(self, config: dict, user_input: str = None):
+        """Run the graph until the turn ends or pauses for approval.
+
+        Args:
+            config: Graph config with the thread_id.
+            user_input: New user message; None resumes a paused turn.
+
+        Yields:
+            Event dicts (see module docstring).
+        """
+        kind = "new" if user_input is not None else "resume"
+        return self._instrumented(config, kind, self._stream_turn(config, user_input))
+
+    def _instrumented(self, config: dict, kind: str, events):
+        """Pass a turn's events through, recording turn metrics and its trace."""
+        if not metrics.enabled() and not tracing.enabled():
+            yield from events
+            return
+
+        started = time.perf_counter()
+        first_output = True
+        try:
+            with tracing.turn(config["configurable"]["thread_id"], kind=kind) as turn_span:
+                for event in events:
+                    if first_output and event["type"] in ("reasoning", "token", "cached"):
+                        metrics.observe("turn_ttft_seconds", time.perf_counter() - started, kind=kind)
+                        first_output = False
+                    if turn_span is not None and event["type"] in ("usage", "approval"):
+                        turn_span.update({k: v for k, v in event.items() if k in ("hit", "miss", "input", "output")})
+                        turn_span["paused"] = event["type"] == "approval"
+                    yield event
+        finally:
+            events.close()
+            metrics.observe("turn_seconds", time.perf_counter() - started, kind=kind)
+            metrics.maybe_export()
+
+    def _stream_turn(self, config: dict, user_input: str = None):
+        from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+        from graph.builder import TOOLS_REQUIRING_APPROVAL
+        from llm import get_cache_usage
+
+        current_input = {"messages": [("user", user_input)]} if user_input is not None else None
+        final_content = ""
+        usage = {"hit": 0, "miss": 0, "input": 0, "output": 0}
+
+        while True:
+            segment_content = ""
+            for msg, _metadata in self.agent.stream(current_input, config, stream_mode="messages"):
+                if isinstance(msg, AIMessage):
+                    cache_usage = get_cache_usage(msg)
+                    if cache_usage:
+                        usage["hit"] += cache_usage["hit"]
+                        usage["miss"] += cache_usage["miss"]
+                    token_usage = msg.usage_metadata
+                    if token_usage:
+                        usage["input"] += token_usage.get("input_tokens", 0)
+                        usage["output"] += token_usage.get("output_tokens", 0)
+
+                if isinstance(msg, AIMessageChunk):
+                    reasoning = msg.additional_kwargs.get("reasoning_content") if msg.additional_kwargs else None
+                    if reasoning:
+                        yield {"type": "reasoning", "text": reasoning}
+                    if msg.content:
+                        text = normalize_llm_content(msg.content)
+                        segment_content += text
+                        yield {"type": "token", "text": text}
+
+                elif isinstance(msg, AIMessage) and msg.response_metadata.get("semantic_cache"):
+                    segment_content = normalize_llm_content(msg.content)
+                    yield {"type": "cached", "text": segment_content}
+
+                elif isinstance(msg, AIMessage) and msg.content:
+                    # 非流式调用（如对冲请求）整条返回
+                    text = normalize_llm_content(msg.content)
+                    segment_content += text
+                    yield {"type": "token", "text": text}
+
+                elif isinstance(msg, ToolMessage):
+                    if segment_content:
+                        final_content = segment_content
+                    segment_content = ""
+                    yield {
+                        "type": "tool_result",
+                        "id": msg.tool_call_id,
+                        "name": msg.name or "unknown",
+                        "content": str(msg.content),
+                    }
+
+            if segment_content:
+                final_content = segment_content
+
+            state = self.agent.get_state(config)
+            messages = state.values.get("messages", [])
+            last_msg = messages[-1] if messages else None
+            tool_calls = getattr(last_msg, "tool_calls", None) or []
+            if "tools" not in state.next or not tool_calls:
+                break
+
+            approval_calls = [tc for tc in tool_calls if tc.get("name") in TOOLS_REQUIRING_APPROVAL]
+            if approval_calls:
+                yield {"type": "usage", **usage}
+                yield {
+                    "type": "approval",
+                    "tool_calls": [
+                        {"id": tc.get("id"), "name": tc.get("name"), "args": tc.get("args", {})}
+                        for tc in approval_calls
+                    ],
+                }
+                return
+
+            # 无需审批的工具：直接继续执行
+            for tc in tool_calls:
+                yield {"type": "tool_call", "id": tc.get("id"), "name": tc.get("name"), "args": tc.get("args", {})}
+            current_input = None
+
+        yield {"type": "usage", **usage}
+        yield {"type": "done", "content": final_content}
+
+    def apply_approvals(self, config: dict, decisions: list):
+        """Resolve a paused turn's approvals and continue it.
+
+        Args:
+            config: Graph config with the thread_id.
+            decisions: Dicts with tool_call_id, action ("approve", "modify"
+                or "reject") and, for "modify", the edited args. Approval
+                tool calls without a decision are rejected.
+
+        Yields:
+            Event dicts, ending like stream_turn.
+        """
+        return self._instrumented(config, "resume", self._apply_approvals(config, decisions))
+
+    def _apply_approvals(self, config: dict, decisions: list):
+        from langchain_core.messages import ToolMessage
+        from graph.builder import TOOLS_REQUIRING_APPROVAL
+        from graph.nodes import create_tool_node
+        from tools import get_agent_tools
+
+        state = self.agent.get_state(config)
+        messages = state.values.get("messages", [])
+        last_msg = messages[-1] if messages else None
+        tool_calls = getattr(last_msg, "tool_calls", None) or []
+        if "tools" not in state.next or not tool_calls:
+            yield {"type": "done", "content": ""}
+            return
+
+        by_id = {d.get("tool_call_id"): d for d in decisions}
+        new_messages = []
+        normal_tool_calls = []
+        for tc in tool_calls:
+            name = tc.get("name")
+            if name not in TOOLS_REQUIRING_APPROVAL:
+                normal_tool_calls.append(tc)
+                continue
+            decision = by_id.get(tc.get("id")) or {"action": "reject"}
+            if decision.get("action") in ("approve", "modify"):
+                args = decision.get("args") or tc.get("args", {})
+                content = _execute_approved_tool(name, args)
+            else:
+                content = REJECTION_MESSAGES.get(name, "用户拒绝执行该操作")
+            new_messages.append(ToolMessage(content=content, name=name, tool_call_id=tc.get("id")))
+            yield {"type": "tool_result", "id": tc.get("id"), "name": name, "content": content}
+
+        if normal_tool_calls:
+            # 只包含普通工具调用的消息副本，交给工具节点执行
+            partial_msg = last_msg.model_copy(update={"tool_calls": normal_tool_calls})
+            for tc in normal_tool_calls:
+                yield {"type": "tool_call", "id": tc.get("id"), "name": tc.get("name"), "args": tc.get("args", {})}
+            tool_node = create_tool_node(get_agent_tools(), memoize=self.memoize_tools)
+            result = tool_node.invoke({"messages": messages[:-1] + [partial_msg]}, config)
+            for msg in result["messages"]:
+                new_messages.append(msg)
+                yield {"type": "tool_result", "id": msg.tool_call_id, "name": msg.name, "content": str(msg.content)}
+
+        if new_messages:
+            self.agent.update_state(config, {"messages": new_messages}, as_node="tools")
+        yield from self._stream_turn(config)
+
+    def stats(self) -> dict:
+        """Snapshot of the process's latency and token metrics (see metrics.snapshot)."""
+        return metrics.snapshot()
+
+    def reset_stats(self):
+        """Drop the collected metrics."""
+        metrics.reset()
+
+    def export_stats(self, path: str = None) -> str | None:
+        """Write the metrics to `path` or the configured export file; returns the path."""
+        return metrics.export(path)
+
+    def sessions(self, limit: int = 20) -> list:
+        """Most recent sessions as (thread_id, summary) pairs."""
+        from persistence import list_sessions
+
+        if self.read_pool is not None:
+            with self.read_pool.connection() as conn:
+                rows = list_sessions(conn, limit)
+        else:
+            with self.checkpointer.lock:
+                rows = list_sessions(self.checkpointer.conn, limit)
+        return [(thread_id, summary) for thread_id, summary, _, _ in rows]
+
+    def history(self, config: dict) -> list:
+        """Messages of a thread as dicts with type, name and text content."""
+        state = self.agent.get_state(config)
+        return [
+            {
+                "type": getattr(msg, "type", None),
+                "name": getattr(msg, "name", None),
+                "content": normalize_llm_content(msg.content),
+            }
+            for msg in state.values.get("messages", [])
+        ]
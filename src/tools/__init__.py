@@ -3,6 +3,7 @@
 This package contains all the tools available to the agent, organized by category.
 """
 
+from tools.stores import stores
 from tools.base import (
     BASE_DIR,
     MEMORY_FILE,
@@ -23,7 +24,7 @@ from tools.notes import (
     _load_notes,
     _save_notes,
     _get_notes_vectorstore,
-    _notes_vectorstore_cache,
+    _add_note,
     add_note,
     search_notes,
     get_note,
@@ -35,7 +36,24 @@ from tools.web import (
     web_search,
 )
 
+
+def get_agent_tools() -> list:
+    """All tools bound to the agent, in binding order."""
+    return [
+        get_environment_context,
+        update_user_memory,
+        search_memory,
+        get_memory,
+        web_search,
+        add_note,
+        search_notes,
+        get_note,
+    ]
+
+
 __all__ = [
+    # Shared state
+    "stores",
     # Base
     "BASE_DIR",
     "MEMORY_FILE",
@@ -54,7 +72,7 @@ __all__ = [
     "_load_notes",
     "_save_notes",
     "_get_notes_vectorstore",
-    "_notes_vectorstore_cache",
+    "_add_note",
     "add_note",
     "search_notes",
     "get_note",
@@ -62,4 +80,5 @@ __all__ = [
     "get_environment_context",
     # Web
     "web_search",
+    "get_agent_tools",
 ]
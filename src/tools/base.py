@@ -6,6 +6,10 @@ import io
 import logging
 import contextlib
 
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
 # Suppress HuggingFace transformers warnings
 logging.getLogger("transformers").setLevel(logging.ERROR)
 logging.getLogger("sentence_transformers").setLevel(logging.ERROR)
@@ -31,21 +35,37 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 # Memory file paths
 MEMORY_FILE = os.path.join(BASE_DIR, "data", "user_memory.json")
 MEMORY_FAISS_DIR = os.path.join(BASE_DIR, "data", "memory_faiss_index")
-MEMORY_FAISS_MTIME_FILE = os.path.join(MEMORY_FAISS_DIR, "memory_mtime.txt")
 
 # Notes file paths
 NOTES_FILE = os.path.join(BASE_DIR, "data", "notes.json")
 NOTES_FAISS_DIR = os.path.join(BASE_DIR, "data", "notes_faiss_index")
 
-# Global cache for embeddings
-_embeddings_cache = None
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings wrapper recording encode latency into metrics (embed_seconds)."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        with metrics.timer("embed_seconds", op="query"):
+            return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with metrics.timer("embed_seconds", op="documents"):
+            return self.embeddings.embed_documents(texts)
+
+
+def _load_embeddings():
+    """Load the local embedding model, wrapped for timing when metrics are enabled."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    with suppress_stdout_stderr():
+        embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-small-zh-v1.5")
+    # 未开启指标时不包装，编码路径上没有额外开销
+    return TimedEmbeddings(embeddings) if metrics.enabled() else embeddings
 
 
 def _get_embeddings():
-    """Get cached embeddings model."""
-    global _embeddings_cache
-    if _embeddings_cache is None:
-        from langchain_huggingface import HuggingFaceEmbeddings
-        with suppress_stdout_stderr():
-            _embeddings_cache = HuggingFaceEmbeddings(model_name="BAAI/bge-small-zh-v1.5")
-    return _embeddings_cache
+    """Get cached embeddings model (loaded once per process, thread-safe)."""
+    from tools.stores import stores
+    return stores.cached("embeddings", _load_embeddings)
@@ -6,18 +6,20 @@ import urllib.error
 from datetime import datetime
 from langchain_core.tools import tool
 
-# Location cache
-_location_cache = None
+from replay import recorded
+from tools.stores import stores
 
 # Weekday names in Chinese
 _WEEKDAY_ZH = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
 
 
+@recorded("location")
 def _get_location():
     """Get current location via IP geolocation. Cached for the session."""
-    global _location_cache
-    if _location_cache is not None:
-        return _location_cache
+    return stores.cached("location", _lookup_location)
+
+
+def _lookup_location():
     try:
         req = urllib.request.Request(
             "http://ipinfo.io/json",
@@ -34,12 +36,12 @@ def _get_location():
         if loc and "," in loc:
             parts = loc.split(",")
             lat, lon = float(parts[0]), float(parts[1])
-        _location_cache = {"location": location_str, "lat": lat, "lon": lon}
-        return _location_cache
+        return {"location": location_str, "lat": lat, "lon": lon}
     except Exception:
         return None
 
 
+@recorded("weather")
 def _get_weather(lat, lon):
     """Get current weather from Open-Meteo API (no API key required)."""
     try:
@@ -0,0 +1,93 @@
+"""Per-thread memoization of read-only tool results.
+
+Each cacheable tool declares either a data dependency or a TTL. Writes to a
+data domain (memory / notes) bump its version, which lazily invalidates every
+cached read that depends on it — `_save_memory` and `_save_notes` call
+`invalidate()` so writes from tools, /tidy and note approval are all covered.
+A domain's version also includes its data file's version stamp, so writes
+by other processes invalidate cached reads too.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from tools.stores import stores
+
+# 可缓存工具的失效策略：depends=依赖的数据域（写入即失效），ttl=过期秒数
+MEMO_POLICIES = {
+    "search_memory": {"depends": "memory"},
+    "get_memory": {"depends": "memory"},
+    "search_notes": {"depends": "notes"},
+    "get_note": {"depends": "notes"},
+    "get_environment_context": {"ttl": 180},
+}
+
+# 最多缓存的结果条数（所有会话共享，LRU 淘汰）
+MAX_ENTRIES = 512
+
+_domain_versions = {"memory": 0, "notes": 0}
+_entries = OrderedDict()
+# 多个会话并发执行工具时保护 _entries 与版本号
+_lock = threading.Lock()
+
+
+def _make_key(thread_id, tool_name: str, args: dict):
+    """Key by thread, tool name and canonicalized args."""
+    canonical = json.dumps(args or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return (thread_id, tool_name, canonical)
+
+
+def _version(domain: str):
+    """Current version of a data domain (caller holds _lock)."""
+    store = getattr(stores, domain, None)
+    file_stamp = store.version() if store is not None else None
+    return (_domain_versions.get(domain, 0), file_stamp)
+
+
+def invalidate(domain: str):
+    """Invalidate all cached reads depending on `domain` (e.g. "memory")."""
+    with _lock:
+        _domain_versions[domain] = _domain_versions.get(domain, 0) + 1
+
+
+def lookup(thread_id, tool_name: str, args: dict):
+    """Return the cached result content, or None on miss/expiry."""
+    policy = MEMO_POLICIES.get(tool_name)
+    if policy is None:
+        return None
+
+    key = _make_key(thread_id, tool_name, args)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+
+        content, created_at, version = entry
+        domain = policy.get("depends")
+        ttl = policy.get("ttl")
+        if (domain and version != _version(domain)) or (
+            ttl and time.monotonic() - created_at > ttl
+        ):
+            del _entries[key]
+            return None
+
+        _entries.move_to_end(key)
+        return content
+
+
+def store(thread_id, tool_name: str, args: dict, content):
+    """Cache a tool result if the tool has a memo policy."""
+    policy = MEMO_POLICIES.get(tool_name)
+    if policy is None:
+        return
+
+    domain = policy.get("depends")
+    key = _make_key(thread_id, tool_name, args)
+    with _lock:
+        version = _version(domain) if domain else None
+        _entries[key] = (content, time.monotonic(), version)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
@@ -1,97 +1,61 @@
 """Memory-related tools for user profile and preferences."""
 
 import os
-import json
 from langchain_core.tools import tool
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
+import metrics
+import tracing
 from tools.base import (
     MEMORY_FILE,
     MEMORY_FAISS_DIR,
-    MEMORY_FAISS_MTIME_FILE,
     _get_embeddings,
 )
+from tools import memo
+from tools.storage import load_index, save_index
+from tools.stores import stores
 
-# Global cache for vector store
-_vectorstore_cache = None
-_last_memory_mtime = 0
+
+def _write_memory(memory):
+    """Write the memory file (caller holds the memory write lock)."""
+    stores.memory.write(memory)
+    memo.invalidate("memory")
 
 
 def _load_memory():
     """Load memory from JSON file."""
-    if not os.path.exists(MEMORY_FILE):
-        return {}
-    try:
-        with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    with stores.memory.lock.reading():
+        return stores.memory.read()
 
 
 def _save_memory(memory):
     """Save memory to JSON file."""
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(memory, f, ensure_ascii=False, indent=2)
-
-
-def _save_vectorstore(vectorstore, memory_mtime):
-    """Save FAISS index to disk along with memory mtime."""
-    if not os.path.exists(MEMORY_FAISS_DIR):
-        os.makedirs(MEMORY_FAISS_DIR, exist_ok=True)
-    vectorstore.save_local(MEMORY_FAISS_DIR)
-    with open(MEMORY_FAISS_MTIME_FILE, "w") as f:
-        f.write(str(memory_mtime))
-
-
-def _load_vectorstore():
-    """Load FAISS index from disk if it exists and is up-to-date."""
-    if not os.path.exists(MEMORY_FAISS_DIR) or not os.path.exists(MEMORY_FAISS_MTIME_FILE):
-        return None
-
-    if not os.path.exists(MEMORY_FILE):
-        return None
-
-    # Check if index is up-to-date
-    current_mtime = os.path.getmtime(MEMORY_FILE)
-    try:
-        with open(MEMORY_FAISS_MTIME_FILE, "r") as f:
-            saved_mtime = float(f.read().strip())
-        if saved_mtime != current_mtime:
-            return None
-    except Exception:
-        return None
-
-    # Load the index
-    try:
-        embeddings = _get_embeddings()
-        return FAISS.load_local(MEMORY_FAISS_DIR, embeddings, allow_dangerous_deserialization=True)
-    except Exception:
-        return None
+    with stores.memory.lock.writing():
+        _write_memory(memory)
 
 
 def _get_vectorstore():
-    """Get memory vector store: memory cache → disk → full build."""
-    global _vectorstore_cache, _last_memory_mtime
+    """Get memory vector store: memory cache → disk → full build.
 
+    The index is a snapshot tagged with the memory file's version stamp
+    (see tools.stores); it is reloaded only when the file changes.
+    """
     if not os.path.exists(MEMORY_FILE):
         return None
+    return stores.memory.index(_build_vectorstore)
 
-    current_mtime = os.path.getmtime(MEMORY_FILE)
 
-    # If memory cache is valid, return it
-    if _vectorstore_cache is not None and current_mtime == _last_memory_mtime:
-        return _vectorstore_cache
+def _build_vectorstore(version):
+    """Load the index saved for `version` from disk, or rebuild it from the memory file."""
+    embeddings = _get_embeddings()
 
     # Try to load from disk first
-    loaded_vectorstore = _load_vectorstore()
+    loaded_vectorstore = load_index(MEMORY_FAISS_DIR, embeddings, version)
     if loaded_vectorstore is not None:
-        _vectorstore_cache = loaded_vectorstore
-        _last_memory_mtime = current_mtime
-        return _vectorstore_cache
+        return loaded_vectorstore
 
     # Rebuild index from scratch
-    memory = _load_memory()
+    memory = stores.memory.read()
     if not memory:
         return None
 
@@ -106,14 +70,13 @@ def _get_vectorstore():
     if not documents:
         return None
 
-    embeddings = _get_embeddings()
-    _vectorstore_cache = FAISS.from_documents(documents, embeddings)
-    _last_memory_mtime = current_mtime
+    from langchain_community.vectorstores import FAISS
+    vectorstore = FAISS.from_documents(documents, embeddings)
 
-    # Save to disk for future runs
-    _save_vectorstore(_vectorstore_cache, current_mtime)
+    # Save to disk for future runs (and other processes)
+    save_index(vectorstore, MEMORY_FAISS_DIR, version)
 
-    return _vectorstore_cache
+    return vectorstore
 
 
 @tool
@@ -131,7 +94,10 @@ def search_memory(query: str, k: int = 3):
     if not vectorstore:
         return "Memory is empty."
 
-    docs = vectorstore.similarity_search(query, k=k)
+    with metrics.timer("faiss_search_seconds", index="memory"), tracing.span("faiss_search", index="memory", k=k) as span:
+        docs = vectorstore.similarity_search(query, k=k)
+        if span is not None:
+            span["hits"] = len(docs)
     if not docs:
         return "No relevant information found in memory."
 
@@ -176,16 +142,18 @@ def update_user_memory(key: str, value: str, overwrite_confirmed: bool = False):
         overwrite_confirmed: Must be True when updating an existing key. Set this only after
             reading the existing value and merging it with the new information.
     """
-    memory = _load_memory()
-    if key in memory and not overwrite_confirmed:
-        existing = memory[key]
-        return (
-            f"⚠️ Key '{key}' already exists with content:\n{existing}\n\n"
-            f"Please merge the above with your new information, then call again with "
-            f"the merged value and overwrite_confirmed=True."
-        )
-    memory[key] = value
-    _save_memory(memory)
+    # 读-改-写整体持有写锁，并发更新不会互相覆盖
+    with stores.memory.lock.writing():
+        memory = stores.memory.read()
+        if key in memory and not overwrite_confirmed:
+            existing = memory[key]
+            return (
+                f"⚠️ Key '{key}' already exists with content:\n{existing}\n\n"
+                f"Please merge the above with your new information, then call again with "
+                f"the merged value and overwrite_confirmed=True."
+            )
+        memory[key] = value
+        _write_memory(memory)
     return f"Successfully updated memory: {key} = {value}"
 
 
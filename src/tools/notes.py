@@ -1,58 +1,63 @@
 """Notes-related tools for recording and searching user notes."""
 
-import os
-import json
 import uuid
 from datetime import datetime
 from langchain_core.tools import tool
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
+import metrics
+import tracing
 from tools.base import (
-    NOTES_FILE,
     NOTES_FAISS_DIR,
     _get_embeddings,
 )
+from tools import memo
+from tools.storage import load_index, save_index
+from tools.stores import stores
 
-# Global cache for notes vector store
-_notes_vectorstore_cache = None
+
+def _write_notes(notes):
+    """Write the notes file (caller holds the notes write lock)."""
+    stores.notes.write(notes)
+    memo.invalidate("notes")
 
 
 def _load_notes():
     """Load notes from JSON file."""
-    if not os.path.exists(NOTES_FILE):
-        return {}
-    try:
-        with open(NOTES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    with stores.notes.lock.reading():
+        return stores.notes.read()
 
 
 def _save_notes(notes):
     """Save notes to JSON file."""
-    with open(NOTES_FILE, "w", encoding="utf-8") as f:
-        json.dump(notes, f, ensure_ascii=False, indent=2)
+    with stores.notes.lock.writing():
+        _write_notes(notes)
+
+
+def _save_notes_vectorstore(vectorstore, version):
+    save_index(vectorstore, NOTES_FAISS_DIR, version)
 
 
 def _get_notes_vectorstore():
-    """Get notes vector store: memory cache → disk → full build."""
-    global _notes_vectorstore_cache
+    """Get notes vector store: memory cache → disk → full build.
+
+    The index is a snapshot tagged with the notes file's version stamp
+    (see tools.stores); it is reloaded only when the file changes.
+    """
+    return stores.notes.index(_build_notes_vectorstore)
 
-    if _notes_vectorstore_cache is not None:
-        return _notes_vectorstore_cache
+
+def _build_notes_vectorstore(version):
+    """Load the index saved for `version` from disk, or build it from the notes file."""
+    embeddings = _get_embeddings()
 
     # Try to load from disk
-    if os.path.exists(NOTES_FAISS_DIR):
-        try:
-            embeddings = _get_embeddings()
-            _notes_vectorstore_cache = FAISS.load_local(NOTES_FAISS_DIR, embeddings, allow_dangerous_deserialization=True)
-            return _notes_vectorstore_cache
-        except Exception:
-            pass
-
-    # Full build as fallback (first run or index missing)
-    notes = _load_notes()
+    loaded_vectorstore = load_index(NOTES_FAISS_DIR, embeddings, version)
+    if loaded_vectorstore is not None:
+        return loaded_vectorstore
+
+    # Full build as fallback (first run, index missing or outdated)
+    notes = stores.notes.read()
     if not notes:
         return None
 
@@ -68,13 +73,48 @@ def _get_notes_vectorstore():
     if not documents:
         return None
 
-    embeddings = _get_embeddings()
-    _notes_vectorstore_cache = FAISS.from_documents(documents, embeddings)
+    # FAISS/langchain_community 导入较重，首次使用时才加载
+    from langchain_community.vectorstores import FAISS
+    vectorstore = FAISS.from_documents(documents, embeddings)
+    _save_notes_vectorstore(vectorstore, version)
 
-    os.makedirs(NOTES_FAISS_DIR, exist_ok=True)
-    _notes_vectorstore_cache.save_local(NOTES_FAISS_DIR)
+    return vectorstore
 
-    return _notes_vectorstore_cache
+
+def _add_note(title: str, content: str, tags: str = "") -> str:
+    """Save a note and add it to the notes index.
+
+    Shared by the add_note tool and the approval flow of the interfaces.
+
+    Returns:
+        Confirmation message with the new note id.
+    """
+    # 先把索引更新到当前版本，写入后只需增量加入新笔记
+    _get_notes_vectorstore()
+
+    note_id = str(uuid.uuid4())[:8]
+    created_at = datetime.now().strftime("%Y-%m-%d")
+    doc = Document(
+        page_content=f"{title}\n{content}",
+        metadata={"note_id": note_id, "title": title,
+                  "tags": tags, "created_at": created_at}
+    )
+
+    # 笔记文件与索引在同一把写锁内更新，其他进程不会看到两者不一致
+    with stores.notes.lock.writing():
+        base_version = stores.notes.version()
+        notes = stores.notes.read()
+        notes[note_id] = {
+            "title": title,
+            "content": content,
+            "tags": tags,
+            "created_at": created_at,
+        }
+        _write_notes(notes)
+        # Incrementally add to FAISS index (on a copy, swapped in when saved)
+        stores.notes.upsert([doc], base_version, _build_notes_vectorstore, _save_notes_vectorstore)
+
+    return f"笔记已保存，id: {note_id}，标题：{title}"
 
 
 @tool
@@ -91,30 +131,7 @@ def add_note(title: str, content: str, tags: str = ""):
         content: 笔记正文，详细记录内容（使用第一人称，以你自己的口吻来写）。
         tags: 标签，逗号分隔（可选）。
     """
-    note_id = str(uuid.uuid4())[:8]
-    created_at = datetime.now().strftime("%Y-%m-%d")
-    notes = _load_notes()
-    notes[note_id] = {
-        "title": title,
-        "content": content,
-        "tags": tags,
-        "created_at": created_at,
-    }
-    _save_notes(notes)
-
-    # Incrementally add to FAISS index
-    doc = Document(
-        page_content=f"{title}\n{content}",
-        metadata={"note_id": note_id, "title": title,
-                  "tags": tags, "created_at": created_at}
-    )
-    vectorstore = _get_notes_vectorstore()
-    vectorstore.add_documents([doc])
-
-    os.makedirs(NOTES_FAISS_DIR, exist_ok=True)
-    vectorstore.save_local(NOTES_FAISS_DIR)
-
-    return f"笔记已保存，id: {note_id}，标题：{title}"
+    return _add_note(title, content, tags)
 
 
 @tool
@@ -132,7 +149,10 @@ def search_notes(query: str, k: int = 3):
     if not vectorstore:
         return "笔记本为空。"
 
-    docs = vectorstore.similarity_search(query, k=k)
+    with metrics.timer("faiss_search_seconds", index="notes"), tracing.span("faiss_search", index="notes", k=k) as span:
+        docs = vectorstore.similarity_search(query, k=k)
+        if span is not None:
+            span["hits"] = len(docs)
     if not docs:
         return "未找到相关笔记。"
 
@@ -0,0 +1,174 @@
+"""Multi-process safe file primitives for the data directory.
+
+Several agents on one host (CLI windows, daemon, server, batch jobs) share
+`data/`. Every data file and index is therefore:
+
+- written atomically: to a temp file/dir next to it, fsynced, then renamed
+  into place, so a reader never loads a half-written file;
+- guarded by an advisory `fcntl.flock` on a sidecar `<path>.lock` file:
+  shared for reads, exclusive for read-modify-write;
+- identified by a cheap version stamp (inode, mtime_ns, size) from a single
+  `os.stat`. Each atomic write creates a new inode, so readers notice
+  another process's changes without rereading the file.
+
+On platforms without fcntl the locks are no-ops; atomic renames still apply.
+"""
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 索引目录中记录其对应数据文件版本的文件
+INDEX_VERSION_FILE = "data_version.json"
+
+# 进程 umask（只能通过设置来读取，导入时读取一次）。mkstemp/mkdtemp 创建的临时文件与目录
+# 权限为 0600/0700，替换前改为原文件的权限或 umask 默认权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _target_mode(path: str, default: int) -> int:
+    """Mode for a file about to replace `path`: the existing file's, else `default` minus the umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return default & ~_UMASK
+
+
+def file_version(path: str):
+    """Version stamp of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+@contextmanager
+def file_lock(path: str, exclusive: bool = False):
+    """Hold an advisory lock on `path` (via `<path>.lock`) across processes.
+
+    Each call opens its own descriptor, so threads of one process do not
+    share the lock; combine with an in-process lock (see tools.stores).
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def read_json(path: str, default=None):
+    """Load a JSON file; `default` if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def atomic_write_json(path: str, data, **dump_kwargs):
+    """Write JSON to a temp file in the same directory and rename it over `path`."""
+    atomic_write_text(path, json.dumps(data, **dump_kwargs))
+
+
+def atomic_write_text(path: str, text: str):
+    """Write text to a unique temp file in the same directory and rename it over `path`."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path, 0o666))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _recover_dir(path: str):
+    """Finish a directory swap interrupted between its two renames."""
+    old = f"{path}.old"
+    if not os.path.exists(path) and os.path.isdir(old):
+        os.replace(old, path)
+
+
+def save_index(vectorstore, index_dir: str, data_version=None):
+    """Save a FAISS store as a new directory and swap it in atomically.
+
+    Args:
+        vectorstore: LangChain FAISS store.
+        index_dir: Destination directory.
+        data_version: Version stamp of the data file the index reflects.
+    """
+    parent = os.path.dirname(index_dir) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(index_dir)}.", dir=parent)
+    try:
+        vectorstore.save_local(tmp_dir)
+        with open(os.path.join(tmp_dir, INDEX_VERSION_FILE), "w", encoding="utf-8") as f:
+            json.dump(data_version, f)
+        os.chmod(tmp_dir, _target_mode(index_dir, 0o777))
+        with file_lock(index_dir, exclusive=True):
+            _recover_dir(index_dir)
+            old = f"{index_dir}.old"
+            if os.path.exists(index_dir):
+                shutil.rmtree(old, ignore_errors=True)
+                os.replace(index_dir, old)
+            os.replace(tmp_dir, index_dir)
+            shutil.rmtree(old, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def index_version(index_dir: str):
+    """Data version stamp recorded with a saved index (None if unknown)."""
+    return read_json(os.path.join(index_dir, INDEX_VERSION_FILE))
+
+
+def load_index(index_dir: str, embeddings, data_version=None):
+    """Load a saved FAISS store.
+
+    Args:
+        index_dir: Index directory.
+        embeddings: Embeddings for the loaded store.
+        data_version: If given, only load an index saved for this version.
+
+    Returns:
+        The store, or None if it is missing, outdated or unreadable.
+    """
+    if not os.path.isdir(index_dir) and os.path.isdir(f"{index_dir}.old"):
+        # 上次替换在两次 rename 之间中断（进程退出），恢复旧索引
+        with file_lock(index_dir, exclusive=True):
+            _recover_dir(index_dir)
+    with file_lock(index_dir):
+        if not os.path.isdir(index_dir):
+            return None
+        if data_version is not None and index_version(index_dir) != data_version:
+            return None
+        try:
+            # FAISS/langchain_community 导入较重，首次使用时才加载
+            from langchain_community.vectorstores import FAISS
+            return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        except Exception:
+            return None
@@ -0,0 +1,220 @@
+"""Thread-safe shared state of the tools: embedding model, data files and FAISS indexes.
+
+One process may run several turns at once (daemon, HTTP server, batch
+runner), so the lazily built singletons live in a StoreManager:
+
+- `cached()` builds a shared value once (single-flight); concurrent callers
+  wait for the first build instead of loading the model twice.
+- Each data domain (memory, notes) has a read/write lock around its JSON
+  file: many concurrent readers, one writer doing read-modify-write. The
+  lock also takes the file's cross-process lock (see tools.storage).
+- Each domain's FAISS index is an immutable snapshot tagged with the data
+  file's version stamp. Searches use the current snapshot without locking;
+  rebuilds and upserts prepare a new index off to the side (upserts on a
+  copy) and swap the reference, so a search never sees a half-updated index
+  or waits for a rebuild. When another process changes the data, the stamp
+  changes and the index it saved is loaded instead of rebuilt.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from tools.base import MEMORY_FILE, NOTES_FILE
+from tools.storage import atomic_write_json, file_lock, file_version, read_json
+
+
+class RWLock:
+    """Readers-writer lock; waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def copy_vectorstore(vectorstore):
+    """Independent copy of a LangChain FAISS store (index, docstore and id map)."""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS(
+        embedding_function=vectorstore.embedding_function,
+        index=faiss.clone_index(vectorstore.index),
+        docstore=InMemoryDocstore(dict(vectorstore.docstore._dict)),
+        index_to_docstore_id=dict(vectorstore.index_to_docstore_id),
+        relevance_score_fn=vectorstore.override_relevance_score_fn,
+        normalize_L2=vectorstore._normalize_L2,
+        distance_strategy=vectorstore.distance_strategy,
+    )
+
+
+class DomainLock:
+    """In-process readers-writer lock combined with the data file's cross-process lock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rw = RWLock()
+
+    @contextmanager
+    def reading(self):
+        with self._rw.reading(), file_lock(self.path):
+            yield
+
+    @contextmanager
+    def writing(self):
+        with self._rw.writing(), file_lock(self.path, exclusive=True):
+            yield
+
+
+class DomainStore:
+    """One JSON data file, its locks and the snapshot of its FAISS index.
+
+    Args:
+        name: Domain name ("memory" / "notes"), for debugging.
+        path: Path of the JSON data file.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.lock = DomainLock(path)
+        # (vectorstore, data version)；整体替换，读者拿到的引用始终完整
+        self._snapshot = None
+        # 同一时间只有一个线程重建索引
+        self._build_lock = threading.Lock()
+
+    def version(self):
+        """Version stamp of the data file (None if it does not exist)."""
+        return file_version(self.path)
+
+    def read(self) -> dict:
+        """Read the data file (caller holds `lock`)."""
+        data = read_json(self.path, {})
+        return data if isinstance(data, dict) else {}
+
+    def write(self, data: dict):
+        """Atomically replace the data file (caller holds `lock.writing()`)."""
+        atomic_write_json(self.path, data, ensure_ascii=False, indent=2)
+
+    def index(self, build):
+        """Return the index snapshot for the current data version, building it if needed.
+
+        Args:
+            build: Callable(version) returning a vectorstore (or None) for the
+                data at `version`. Runs under `lock.reading()`, so it must
+                use `read()` rather than taking the lock again.
+
+        While another thread rebuilds a stale index, callers keep getting the
+        previous snapshot instead of waiting; only the first build blocks.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[1] == self.version():
+            return snapshot[0]
+        if not self._build_lock.acquire(blocking=snapshot is None):
+            return snapshot[0]
+        try:
+            with self.lock.reading():
+                version = self.version()
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot[1] == version:
+                    return snapshot[0]
+                vectorstore = build(version)
+                # 空数据不缓存，下次调用重新检查
+                if vectorstore is not None:
+                    self._snapshot = (vectorstore, version)
+                return vectorstore
+        finally:
+            self._build_lock.release()
+
+    def upsert(self, documents: list, base_version, rebuild, persist):
+        """Add documents to a copy of the current index and swap it in.
+
+        The caller holds `lock.writing()`, read the data file at
+        `base_version` and has written it back with the new records.
+
+        Args:
+            documents: Documents to add.
+            base_version: Data version before the caller's write.
+            rebuild: Callable(version) building the index from the data file;
+                used when the snapshot is missing or behind `base_version`
+                (e.g. another process wrote in between).
+            persist: Callable(vectorstore, version) saving the new index.
+
+        Returns:
+            The new vectorstore.
+        """
+        snapshot = self._snapshot
+        version = self.version()
+        if snapshot is not None and snapshot[1] == base_version:
+            vectorstore = copy_vectorstore(snapshot[0])
+            vectorstore.add_documents(documents)
+            persist(vectorstore, version)
+        else:
+            vectorstore = rebuild(version)
+        if vectorstore is not None:
+            self._snapshot = (vectorstore, version)
+        return vectorstore
+
+
+class StoreManager:
+    """Process-wide owner of the tools' shared state."""
+
+    def __init__(self):
+        self._values = {}
+        self._values_lock = threading.Lock()
+        self._value_locks = {}
+        self.memory = DomainStore("memory", MEMORY_FILE)
+        self.notes = DomainStore("notes", NOTES_FILE)
+
+    def cached(self, name: str, factory):
+        """Return the shared value `name`, creating it once with `factory()`.
+
+        Concurrent first callers wait for one build. A None result is not
+        cached, so failed lookups (e.g. offline geolocation) are retried.
+        """
+        value = self._values.get(name)
+        if value is not None:
+            return value
+        with self._values_lock:
+            lock = self._value_locks.setdefault(name, threading.Lock())
+        with lock:
+            value = self._values.get(name)
+            if value is None:
+                value = factory()
+                if value is not None:
+                    self._values[name] = value
+            return value
+
+
+stores = StoreManager()
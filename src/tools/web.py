@@ -1,7 +1,17 @@
 """Web-related tools for searching the internet."""
 
 from langchain_core.tools import tool
-from langchain_community.tools import DuckDuckGoSearchRun
+
+from replay import recorded
+
+
+@recorded("web_search")
+def _search_web(query: str) -> str:
+    """Run a DuckDuckGo search and return the result text."""
+    # 延迟导入：仅在首次搜索时加载 langchain_community/ddgs
+    from langchain_community.tools import DuckDuckGoSearchRun
+    search = DuckDuckGoSearchRun()
+    return search.run(query)
 
 
 @tool
@@ -17,5 +27,4 @@ def web_search(query: str):
     Args:
         query: The search query string.
     """
-    search = DuckDuckGoSearchRun()
-    return search.run(query)
+    return _search_web(query)
@@ -0,0 +1,265 @@
+"""Local structured trace log of agent steps.
+
+When enabled, every turn is recorded as a tree of spans and appended as
+compact JSONL to `data/traces/trace.jsonl`, rotated by size
+(`trace.1.jsonl` ... `trace.<backups>.jsonl`). One line per span:
+
+    {"ts": start (epoch s), "dur": seconds, "name": str, "trace": turn id,
+     "thread": thread_id, "span": id, "parent": id | null, "pid": int,
+     "attrs": {...}}
+
+Span names: turn, node (attrs node), tool (tool, args, result_chars),
+retrieval (hits with index, id and score), faiss_search, checkpoint (put,
+with new_messages and blob_bytes), llm (model, messages, payload_bytes, ttft, input/output/
+cached tokens).
+
+The current turn and span live in context variables; LangGraph copies the
+context into its worker threads, so spans from nodes, tools, LLM calls and
+checkpoint writes attach to their turn. A turn's spans are buffered and
+written with one append under the file's cross-process lock when the turn
+ends, so several processes can share the directory.
+
+Disabled by default; when disabled `span()` returns a shared no-op context
+manager yielding None.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+TRACE_FILE = "trace.jsonl"
+
+_enabled = False
+_directory = os.path.join("data", "traces")
+_max_bytes = 5 * 1024 * 1024
+_backups = 5
+
+_NULL = nullcontext()
+# 当前轮次：{"trace", "thread", "spans": list, "lock"}；当前 span 的 id
+_turn = ContextVar("trace_turn", default=None)
+_parent = ContextVar("trace_parent", default=None)
+_write_lock = threading.Lock()
+
+
+def configure(enabled: bool = False, directory: str = None, max_bytes: int = None, backups: int = None):
+    """Enable or disable tracing and set the output directory and rotation."""
+    global _enabled, _directory, _max_bytes, _backups
+    _enabled = bool(enabled)
+    _directory = directory or _directory
+    _max_bytes = max_bytes or _max_bytes
+    _backups = backups if backups is not None else _backups
+
+
+def configure_from(config: dict):
+    """Configure from the `tracing` section of the app config."""
+    section = config.get("tracing") or {}
+    configure(
+        enabled=section.get("enabled", False),
+        directory=section.get("dir"),
+        max_bytes=section.get("max_bytes"),
+        backups=section.get("backups"),
+    )
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _emit(record: dict):
+    turn = _turn.get()
+    if turn is None:
+        # 轮次之外的 span（如 HTTP 接口直接检索）单独写入
+        _write([record])
+        return
+    record["trace"] = turn["trace"]
+    record["thread"] = turn["thread"]
+    with turn["lock"]:
+        turn["spans"].append(record)
+
+
+def record(name: str, start: float, duration: float, **attrs):
+    """Record a finished span measured by the caller (start in epoch seconds)."""
+    if not _enabled:
+        return
+    _emit({
+        "ts": round(start, 6),
+        "dur": round(duration, 6),
+        "name": name,
+        "trace": None,
+        "thread": None,
+        "span": _new_id(),
+        "parent": _parent.get(),
+        "pid": os.getpid(),
+        "attrs": attrs,
+    })
+
+
+@contextmanager
+def _span(name: str, attrs: dict):
+    span_id = _new_id()
+    token = _parent.set(span_id)
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _parent.reset(token)
+        except ValueError:
+            pass
+        _emit({
+            "ts": round(start, 6),
+            "dur": round(time.perf_counter() - started, 6),
+            "name": name,
+            "trace": None,
+            "thread": None,
+            "span": span_id,
+            "parent": _parent.get(),
+            "pid": os.getpid(),
+            "attrs": attrs,
+        })
+
+
+def span(name: str, **attrs):
+    """Context manager recording its block as a span.
+
+    Yields the span's attribute dict (None when tracing is disabled), so the
+    block can add attributes known only at the end, e.g. result sizes.
+    """
+    if not _enabled:
+        return _NULL
+    return _span(name, attrs)
+
+
+@contextmanager
+def _turn_span(thread_id: str, attrs: dict):
+    turn = {"trace": _new_id(), "thread": thread_id, "spans": [], "lock": threading.Lock()}
+    token = _turn.set(turn)
+    try:
+        with _span("turn", attrs) as turn_attrs:
+            yield turn_attrs
+    finally:
+        try:
+            _turn.reset(token)
+        except ValueError:
+            # 生成器在其他上下文中被关闭
+            pass
+        _write(turn["spans"])
+
+
+def turn(thread_id: str, **attrs):
+    """Context manager for one turn: the root span; its spans are written at the end."""
+    if not _enabled:
+        return _NULL
+    return _turn_span(thread_id, attrs)
+
+
+def _rotate(path: str):
+    for i in range(_backups - 1, 0, -1):
+        older = _rotated_path(path, i)
+        if os.path.exists(older):
+            os.replace(older, _rotated_path(path, i + 1))
+    if _backups > 0:
+        os.replace(path, _rotated_path(path, 1))
+    else:
+        os.unlink(path)
+
+
+def _rotated_path(path: str, index: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def _write(records: list):
+    if not records:
+        return
+    from tools.storage import file_lock
+
+    data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str) + "\n" for r in records)
+    path = os.path.join(_directory, TRACE_FILE)
+    try:
+        os.makedirs(_directory, exist_ok=True)
+        with _write_lock, file_lock(path, exclusive=True):
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > _max_bytes:
+                _rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+    except OSError:
+        # 追踪是辅助功能，写入失败不影响对话
+        pass
+
+
+def trace_files(directory: str = None) -> list:
+    """Trace files in `directory`, oldest first."""
+    directory = directory or _directory
+    path = os.path.join(directory, TRACE_FILE)
+    files = []
+    index = 1
+    while os.path.exists(_rotated_path(path, index)):
+        files.append(_rotated_path(path, index))
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def load_spans(directory: str = None, sessions: int = 10) -> list:
+    """Spans of the `sessions` most recently active threads, across rotated files."""
+    spans = []
+    for path in trace_files(directory):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    last_seen = {}
+    for s in spans:
+        # 轮次之外的 span 不属于任何会话
+        if s.get("thread") is not None:
+            last_seen[s["thread"]] = max(last_seen.get(s["thread"], 0), s["ts"])
+    recent = set(sorted(last_seen, key=last_seen.get, reverse=True)[:sessions])
+    return [s for s in spans if s.get("thread") in recent]
+
+
+def span_label(s: dict) -> str:
+    """Short description of a span: its name plus the identifying attribute."""
+    attrs = s.get("attrs") or {}
+    for key in ("node", "tool", "model", "op", "index"):
+        if key in attrs:
+            return f"{s['name']}:{attrs[key]}"
+    return s["name"]
+
+
+def summarize(spans: list, top: int = 15) -> dict:
+    """Slowest spans and per-label totals.
+
+    Returns:
+        {"slowest": [span, ...] (by duration, at most `top`),
+         "by_label": [(label, count, total, max), ...] (by total, descending)}
+    """
+    by_label = {}
+    for s in spans:
+        label = span_label(s)
+        count, total, longest = by_label.get(label, (0, 0.0, 0.0))
+        by_label[label] = (count + 1, total + s["dur"], max(longest, s["dur"]))
+    return {
+        "slowest": sorted(spans, key=lambda s: s["dur"], reverse=True)[:top],
+        "by_label": sorted(
+            ((label, *values) for label, values in by_label.items()),
+            key=lambda row: row[2],
+            reverse=True,
+        ),
+    }